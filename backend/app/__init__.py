@@ -1,4 +1,6 @@
-from flask import Flask, jsonify, request, send_from_directory
+import hmac
+
+from flask import abort, Flask, jsonify, request
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -28,6 +30,19 @@ def create_app(config_class=Config):
 
     app.url_map.strict_slashes = False
 
+    from app.utils.avatars import avatar_fallback
+    from app.utils.catalog import reset_request_catalog_version
+    from app.utils.covers import cache_covers_command
+    from app.utils.popularity import reconcile_popularity_command
+    from app.utils.similar import build_similar_command
+    from app.utils.uploads import serve_upload
+    from app.utils.user_stats import rebuild_stats_command
+
+    app.cli.add_command(build_similar_command)
+    app.cli.add_command(cache_covers_command)
+    app.cli.add_command(reconcile_popularity_command)
+    app.cli.add_command(rebuild_stats_command)
+
     CORS(app, resources={
         r"/api/*": {
             "origins": "http://localhost:3000",
@@ -48,8 +63,32 @@ def create_app(config_class=Config):
         if request.method == 'OPTIONS' or request.method == 'options':
             return jsonify(headers), 200
 
+    app.before_request(reset_request_catalog_version)
+
+    from app.utils.query_budget import init_query_budget
+
+    with app.app_context():
+        init_query_budget(app, db.engine)
+
+    if app.config.get('METRICS_ENABLED', False):
+        from app.utils.metrics import init_metrics, render_metrics
+
+        with app.app_context():
+            init_metrics(app, db.engine)
+
+        @app.route('/metrics')
+        def metrics():
+            token = app.config.get('METRICS_TOKEN')
+            if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+                abort(401)
+            return app.response_class(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return serve_upload(avatar_fallback(filename) or filename)
+
+    @app.route('/uploads/covers/<filename>')
+    def cover_file(filename):
+        return serve_upload(filename, 'covers')
 
     return app
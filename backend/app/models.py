@@ -1,9 +1,10 @@
-import bcrypt
 import re
 
 from datetime import datetime
+from sqlalchemy import DDL, event, func, text
 
 from app import db
+from app.utils.passwords import hash_password, needs_rehash, verify_password
 
 
 class User(db.Model):
@@ -27,10 +28,13 @@ class User(db.Model):
     friends = db.relationship('Friendship', foreign_keys='Friendship.user_id', backref='user', lazy='dynamic')
 
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode(), self.password_hash.encode())
+        return verify_password(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     @staticmethod
     def validate_username(username):
@@ -39,6 +43,9 @@ class User(db.Model):
 
 class Media(db.Model):
     __tablename__ = 'media'
+    __table_args__ = (
+        db.Index('ix_media_source_external_id', 'source', 'external_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(256), nullable=False)
@@ -50,6 +57,87 @@ class Media(db.Model):
     cover_url = db.Column(db.String(512))
     external_rating = db.Column(db.Float)
     external_rating_count = db.Column(db.Integer)
+    source = db.Column(db.String(20))
+    external_id = db.Column(db.String(64))
+    content_hash = db.Column(db.String(40))
+    cover_hash = db.Column(db.String(64))
+
+
+# text(), а не literal_column(): литеральная «колонка» без таблицы мешает
+# Index найти таблицу по выражению, и индекс ix_media_search не создавался
+SEARCH_CONFIG = text("'russian'::regconfig")
+
+
+def _weighted_vector(column, weight):
+    return func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, '')),
+        text(f"'{weight}'")
+    )
+
+
+media_search_vector = (
+    _weighted_vector(Media.title, 'A')
+    .op('||')(_weighted_vector(Media.author, 'B'))
+    .op('||')(_weighted_vector(Media.description, 'C'))
+)
+
+
+def _not_postgresql(ddl, target, bind, dialect, **kw):
+    return dialect.name != 'postgresql'
+
+
+def keyset_index(name, column, id_column, *leading):
+    """Индекс под сортировку column DESC NULLS LAST, id DESC
+
+    NULLS LAST в индексе поддерживает только Postgres. В SQLite NULL
+    и так идут последними при сортировке по убыванию, поэтому там
+    создаётся обычный индекс с тем же именем.
+    """
+    db.Index(name, *leading, column.desc().nulls_last(), id_column.desc()).ddl_if(dialect='postgresql')
+    db.Index(name, *leading, column.desc(), id_column.desc()).ddl_if(callable_=_not_postgresql)
+
+
+for table in (User.__table__, Media.__table__):
+    event.listen(
+        table,
+        'before_create',
+        DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+    )
+
+keyset_index('ix_media_rating_count', Media.external_rating_count, Media.id)
+keyset_index('ix_media_release_year', Media.release_year, Media.id)
+keyset_index('ix_media_type_popularity', Media.external_rating_count, Media.id, Media.type)
+keyset_index('ix_media_type_release_year', Media.release_year, Media.id, Media.type)
+
+db.Index(
+    'ix_media_search',
+    media_search_vector,
+    postgresql_using='gin'
+).ddl_if(dialect='postgresql')
+db.Index(
+    'ix_media_title_trgm',
+    Media.title,
+    postgresql_using='gin',
+    postgresql_ops={'title': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
+db.Index(
+    'ix_media_author_trgm',
+    Media.author,
+    postgresql_using='gin',
+    postgresql_ops={'author': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
+db.Index(
+    'ix_users_username_trgm',
+    User.username,
+    postgresql_using='gin',
+    postgresql_ops={'username': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
+db.Index(
+    'ix_users_display_name_trgm',
+    User.display_name,
+    postgresql_using='gin',
+    postgresql_ops={'display_name': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
 
 
 class UserMediaList(db.Model):
@@ -64,10 +152,85 @@ class UserMediaList(db.Model):
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+db.Index(
+    'ix_user_media_lists_user_list_added',
+    UserMediaList.user_id,
+    UserMediaList.list_type,
+    UserMediaList.added_at.desc()
+)
+
+
 class Friendship(db.Model):
     __tablename__ = 'friendships'
+    __table_args__ = (
+        db.Index('ix_friendships_friend_id_status', 'friend_id', 'status'),
+    )
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     friend_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     status = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UserMediaStats(db.Model):
+    __tablename__ = 'user_media_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    media_type = db.Column(db.String(10), primary_key=True)
+    list_type = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    duration = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class UserActivity(db.Model):
+    __tablename__ = 'user_activity'
+    __table_args__ = (
+        db.Index('ix_user_activity_user_id_id', 'user_id', 'id'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=False)
+    list_type = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class MediaPopularity(db.Model):
+    __tablename__ = 'media_popularity'
+
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), primary_key=True)
+    media_type = db.Column(db.String(10), nullable=False)
+    planned = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    favorite = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Integer, nullable=False, default=0)
+
+
+db.Index(
+    'ix_media_popularity_score',
+    MediaPopularity.score.desc(),
+    MediaPopularity.media_id.desc()
+)
+db.Index(
+    'ix_media_popularity_type_score',
+    MediaPopularity.media_type,
+    MediaPopularity.score.desc(),
+    MediaPopularity.media_id.desc()
+)
+
+
+class MediaSimilarity(db.Model):
+    __tablename__ = 'media_similarity'
+
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    similar_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.REAL, nullable=False)
+
+
+class CatalogState(db.Model):
+    __tablename__ = 'catalog_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,10 +1,12 @@
 import jwt
 
-from flask import Blueprint, g, jsonify, request
+from flask import Blueprint, current_app, g, jsonify, request
 from functools import wraps
 
 from app.models import db, User
 from ..utils.auth import decode_token, generate_token
+from ..utils.passwords import PasswordHasherBusy
+from ..utils.query_budget import query_budget
 from ..utils.validators import validate_password, validate_username
 
 
@@ -12,6 +14,7 @@ auth_bp = Blueprint('auth', __name__)
 
 
 @auth_bp.route('/register', methods=['POST'])
+@query_budget(3)
 def register():
     """Регистрация пользователя"""
     data = request.get_json()
@@ -40,7 +43,10 @@ def register():
         }), 400
 
     new_user = User(username=username)
-    new_user.set_password(password)
+    try:
+        new_user.set_password(password)
+    except PasswordHasherBusy:
+        return server_busy()
 
     try:
         db.session.add(new_user)
@@ -57,6 +63,7 @@ def register():
 
 
 @auth_bp.route('/login', methods=['POST'])
+@query_budget(3)
 def login():
     """Авторизация пользователя"""
     data = request.get_json()
@@ -64,11 +71,27 @@ def login():
         username=data.get('username')
     ).first()
 
-    if not user or not user.check_password(data.get('password')):
+    password = data.get('password')
+    try:
+        valid = user is not None and user.check_password(password)
+    except PasswordHasherBusy:
+        return server_busy()
+
+    if not valid:
         return jsonify({
             'error': 'Invalid credentials'
         }), 401
 
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Error rehashing password: {str(e)}')
+
     token = generate_token(user.id)
     return jsonify({
         'token': token,
@@ -78,6 +101,14 @@ def login():
     }), 200
 
 
+def server_busy():
+    response = jsonify({
+        'error': 'Server is busy, try again later'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 def auth_required(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
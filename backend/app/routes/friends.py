@@ -1,6 +1,16 @@
-from flask import Blueprint, g, jsonify
+from flask import Blueprint, g, jsonify, request
 
 from app.models import db, Friendship, User
+from app.utils.activity import FEED_MAX_PER_PAGE, FEED_PER_PAGE, get_friends_feed
+from app.utils.covers import cover_thumbnail_url
+from app.utils.friend_graph import (
+    friend_graph_added,
+    friend_graph_removed,
+    get_friend_graph,
+    SUGGESTIONS_LIMIT
+)
+from app.utils.friendships import get_friendship_status
+from app.utils.query_budget import query_budget
 from .auth import auth_required
 
 
@@ -8,6 +18,7 @@ friends_bp = Blueprint('friends', __name__)
 
 
 @friends_bp.route('/<int:friend_id>/request', methods=['POST'])
+@query_budget(2)
 @auth_required
 def send_request(friend_id):
     """Отправка запроса дружбы пользователю"""
@@ -41,6 +52,7 @@ def send_request(friend_id):
 
 
 @friends_bp.route('/requests', methods=['GET'])
+@query_budget(3)
 @auth_required
 def get_requests():
     """Получить все входящие и исходящие запросы в друзья"""
@@ -54,19 +66,21 @@ def get_requests():
         status='pending'
     ).all()
 
+    users = {
+        u.id: u
+        for u in User.query.filter(User.id.in_(
+            [r.user_id for r in incoming] + [r.friend_id for r in outgoing]
+        ))
+    }
+
     return jsonify({
-        'incoming': [serialize_request(r) for r in incoming],
-        'outgoing': [serialize_request(r) for r in outgoing]
+        'incoming': [serialize_request(r, users[r.user_id]) for r in incoming],
+        'outgoing': [serialize_request(r, users[r.friend_id]) for r in outgoing]
     }), 200
 
 
-def serialize_request(request):
+def serialize_request(request, user):
     """Сериализация запроса"""
-    user = User.query.get(
-        request.user_id
-        if request.user_id != g.user_id
-        else request.friend_id
-    )
     return {
         'user': {
             'id': user.id,
@@ -79,6 +93,7 @@ def serialize_request(request):
 
 
 @friends_bp.route('/requests/<int:friend_id>/accept', methods=['POST'])
+@query_budget(2)
 @auth_required
 def accept_request(friend_id):
     """Принять входящий запрос"""
@@ -90,6 +105,7 @@ def accept_request(friend_id):
 
     request.status = 'accepted'
     db.session.commit()
+    friend_graph_added(friend_id, g.user_id)
 
     return jsonify({
         'message': 'Request accepted'
@@ -97,6 +113,7 @@ def accept_request(friend_id):
 
 
 @friends_bp.route('/requests/<int:friend_id>/reject', methods=['POST'])
+@query_budget(1)
 @auth_required
 def reject_request(friend_id):
     """Отклонить входящий запрос"""
@@ -114,6 +131,7 @@ def reject_request(friend_id):
 
 
 @friends_bp.route('/requests/<int:friend_id>', methods=['DELETE'])
+@query_budget(1)
 @auth_required
 def cancel_request(friend_id):
     """Отменить исходящий запрос"""
@@ -131,6 +149,7 @@ def cancel_request(friend_id):
 
 
 @friends_bp.route('/<int:friend_id>', methods=['DELETE'])
+@query_budget(1)
 @auth_required
 def remove_friend(friend_id):
     """Удалить пользователя из друзей"""
@@ -140,12 +159,14 @@ def remove_friend(friend_id):
     ).delete()
 
     db.session.commit()
+    friend_graph_removed(g.user_id, friend_id)
     return jsonify({
         'message': 'Friendship removed'
     }), 200
 
 
 @friends_bp.route('/', methods=['GET'])
+@query_budget(2)
 @auth_required
 def get_friends():
     """Получить список всех друзей"""
@@ -172,26 +193,82 @@ def get_friends():
     } for u in friends]), 200
 
 
+@friends_bp.route('/feed', methods=['GET'])
+@query_budget(1)
+@auth_required
+def get_feed():
+    """Лента добавлений в списки друзей"""
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', FEED_PER_PAGE, type=int), 1), FEED_MAX_PER_PAGE)
+
+    rows, next_cursor = get_friends_feed(g.user_id, before, limit)
+
+    return jsonify({
+        'items': [{
+            'id': activity.id,
+            'user': {
+                'id': user.id,
+                'username': user.username,
+                'avatar': user.avatar_filename,
+                'displayName': user.display_name
+            },
+            'media': {
+                'id': media.id,
+                'title': media.title,
+                'type': media.type,
+                'cover_url': cover_thumbnail_url(media.id, media.cover_hash, media.cover_url)
+            },
+            'list_type': activity.list_type,
+            'created_at': activity.created_at.isoformat()
+        } for activity, user, media in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+
+@friends_bp.route('/suggestions', methods=['GET'])
+@query_budget(3)
+@auth_required
+def get_suggestions():
+    """Возможные знакомые: друзья друзей по числу общих друзей"""
+    limit = min(max(request.args.get('limit', SUGGESTIONS_LIMIT, type=int), 1), 100)
+
+    pending = db.session.query(
+        Friendship.user_id,
+        Friendship.friend_id
+    ).filter(
+        ((Friendship.user_id == g.user_id) | (Friendship.friend_id == g.user_id)),
+        Friendship.status != 'accepted'
+    ).all()
+    exclude = {user_id for pair in pending for user_id in pair}
+
+    candidates = get_friend_graph().suggestions(g.user_id, limit, exclude)
+    users = {
+        u.id: u
+        for u in User.query.filter(User.id.in_([user_id for user_id, _ in candidates]))
+    }
+
+    return jsonify([{
+        'id': user_id,
+        'username': users[user_id].username,
+        'avatar': users[user_id].avatar_filename,
+        'displayName': users[user_id].display_name,
+        'mutualFriends': mutual
+    } for user_id, mutual in candidates if user_id in users]), 200
+
+
 @friends_bp.route('/status/<int:user_id>', methods=['GET'])
+@query_budget(1)
 @auth_required
 def get_status(user_id):
     """Получить статус дружбы с пользователем"""
-    relation = Friendship.query.filter(
-        ((Friendship.user_id == g.user_id) & (Friendship.friend_id == user_id)) |
-        ((Friendship.user_id == user_id) & (Friendship.friend_id == g.user_id))
-    ).first()
-
-    if not relation:
-        return jsonify({
-            'status': 'not_friends'
-        }), 200
-
     status_map = {
-        'pending': 'request_sent' if relation.user_id == g.user_id else 'request_received',
+        'none': 'not_friends',
+        'pending outgoing': 'request_sent',
+        'pending incoming': 'request_received',
         'accepted': 'friends',
         'rejected': 'rejected'
     }
 
     return jsonify({
-        'status': status_map[relation.status]
+        'status': status_map[get_friendship_status(g.user_id, user_id)]
     }), 200
@@ -1,83 +1,227 @@
-from datetime import datetime
-from flask import Blueprint, current_app, g, jsonify, request
+import hashlib
+import math
+import time
+
+from flask import abort, Blueprint, current_app, g, jsonify, redirect, request, url_for
 from flask_cors import cross_origin
-from sqlalchemy import or_
 
 from app.models import db, Media, User, UserMediaList
+from app.utils.cache import get_app_cache
+from app.utils.catalog import get_catalog_version, get_media_row
+from app.utils.covers import (
+    absolute_url,
+    cache_cover,
+    CATALOG_COVER_SIZE,
+    cover_size,
+    cover_thumbnail_path,
+    cover_thumbnail_url,
+    CoverError,
+    DETAIL_COVER_SIZE,
+    thumbnail_filename
+)
+from app.utils.facets import get_catalog_facets
+from app.utils.lists import apply_list_operations, ListOperationError, MediaNotFound, parse_operation
+from app.utils.pagination import count_rows, join_community, keyset_page, KEYSET_COLUMNS, order_keyset
+from app.utils.query_budget import query_budget
+from app.utils.search import apply_search
+from app.utils.similar import get_similar_media, SIMILAR_TOP_K
+from app.utils.statuses import get_list_statuses, LIST_TYPES, status_fields
 from .auth import auth_optional, auth_required
 
 
 media_bp = Blueprint('media', __name__)
 
 
-@media_bp.route('/', methods=['GET'])
-@cross_origin(supports_credentials=True)
-@auth_optional
-def get_media():
-    """Получить каталог медиа"""
+CATALOG_TYPES = ('movie', 'anime', 'book')
+CATALOG_PER_PAGE = 100
+
+
+class CatalogError(Exception):
+    """Некорректные параметры запроса каталога"""
+
+
+def catalog_params(args):
+    """Нормализованные параметры запроса каталога"""
+    search_query = ' '.join(args.get('query', '').split()).lower()
+    media_type = args.get('type')
     try:
-        media_type = request.args.get('type')
-        sort_by = request.args.get('sort_by', 'popularity')
-        search_query = request.args.get('query')
-        page = int(request.args.get('page', 1))
-        per_page = 100
-
-        query = Media.query
-
-        if media_type and media_type in ['movie', 'anime', 'book']:
-            query = query.filter(Media.type == media_type)
-        if search_query:
-            query = query.filter(or_(
-                Media.title.ilike(f'%{search_query}%'),
-                Media.author.ilike(f'%{search_query}%')
-            ))
-
-        if sort_by == 'popularity':
-            query = query.order_by(Media.external_rating_count.desc())
-        elif sort_by == 'newest':
-            query = query.order_by(Media.release_year.desc())
+        page = int(args.get('page', 1))
+    except ValueError:
+        raise CatalogError('Invalid page')
+
+    return {
+        'type': media_type if media_type in CATALOG_TYPES else None,
+        'query': search_query,
+        'sort_by': args.get('sort_by', 'relevance' if search_query else 'popularity'),
+        'page': page,
+        'cursor': args.get('cursor'),
+        'total': args.get('total'),
+        'facets': args.get('facets') in ('1', 'true')
+    }
+
+
+def build_catalog_page(params):
+    """Страница каталога без персональных полей пользователя"""
+    sort_by = params['sort_by']
+    per_page = CATALOG_PER_PAGE
+
+    query = Media.query
+
+    if params['type']:
+        query = query.filter(Media.type == params['type'])
+
+    rank = None
+    if params['query']:
+        query, rank = apply_search(query, params['query'])
+
+    if params['cursor'] is not None:
+        if sort_by not in KEYSET_COLUMNS:
+            raise CatalogError('Cursor pagination supports only popularity, newest and community sorting')
+
+        try:
+            page_items, next_cursor = keyset_page(query, sort_by, params['cursor'], per_page, params['type'])
+        except ValueError:
+            raise CatalogError('Invalid cursor')
+
+        pagination = {
+            'next_cursor': next_cursor
+        }
+        if params['total'] in ('estimate', 'exact'):
+            total_rows = count_rows(query, estimate=params['total'] == 'estimate')
+            pagination['total_pages'] = math.ceil(total_rows / per_page)
+    else:
+        if sort_by == 'relevance' and rank is not None:
+            query = query.order_by(rank.desc(), Media.external_rating_count.desc())
+        elif sort_by == 'community':
+            query = order_keyset(join_community(query), sort_by)
+        elif sort_by in KEYSET_COLUMNS:
+            query = order_keyset(query, sort_by)
+        elif sort_by == 'relevance':
+            query = order_keyset(query, 'popularity')
 
         paginated = query.paginate(
-            page=page,
+            page=params['page'],
             per_page=per_page,
             error_out=False
         )
+        page_items = paginated.items
+        pagination = {
+            'total_pages': paginated.pages,
+            'current_page': params['page']
+        }
+
+    items = [{
+        'id': media.id,
+        'title': media.title,
+        'type': media.type,
+        'author': media.author,
+        'cover_url': cover_thumbnail_path(media.id, media.cover_hash, media.cover_url),
+        'rating': media.external_rating,
+        'year': media.release_year
+    } for media in page_items]
+
+    result = {
+        'items': items,
+        **pagination
+    }
+    if params['facets']:
+        result['facets'] = get_catalog_facets(params['query'], params['type'])
+    return result
+
+
+def get_cached_catalog_page(params):
+    """Общая часть страницы каталога из кэша ответов
+
+    Возвращает данные страницы, тело ответа для анонимного пользователя
+    и его ETag. Ключ включает версию каталога, поэтому импорт
+    автоматически делает старые записи недоступными. Сортировка community
+    зависит от популярности, которая меняется при каждом изменении списков
+    без смены версии, поэтому такие страницы живут не дольше
+    COMMUNITY_CACHE_TTL секунд (0 — не кэшируются). Данные страницы
+    хранят пути обложек без хоста. Абсолютные адреса строятся от
+    PUBLIC_URL, и тогда кэшируется и готовое тело ответа; без PUBLIC_URL
+    тело собирается для хоста каждого запроса.
+    """
+    cache = get_app_cache('response_cache', 'RESPONSE_CACHE_SIZE', 512)
+    key = ('catalog', get_catalog_version(), tuple(sorted(params.items())))
+    if params['sort_by'] == 'community':
+        ttl = current_app.config.get('COMMUNITY_CACHE_TTL', 30)
+        if ttl <= 0:
+            return build_catalog_response(build_catalog_page(params))
+        key += (int(time.monotonic() // ttl),)
+
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_catalog_page(params)
+        cache.set(key, payload)
+
+    # Без PUBLIC_URL адреса обложек строятся из заголовка Host, который
+    # задаёт клиент: такое тело в общий кэш не кладётся
+    if not current_app.config.get('PUBLIC_URL'):
+        return build_catalog_response(payload)
+
+    body_key = key + ('body',)
+    entry = cache.get(body_key)
+    if entry is None:
+        entry = build_catalog_response(payload)
+        cache.set(body_key, entry)
+    return entry
+
+
+def build_catalog_response(payload):
+    """Данные страницы с абсолютными адресами, тело анонимного ответа и его ETag"""
+    payload = resolve_cover_urls(payload)
+    body = current_app.json.dumps({
+        **payload,
+        'items': [{**item, **status_fields({}, item['id'])} for item in payload['items']]
+    })
+    return payload, body, hashlib.sha1(body.encode()).hexdigest()
+
+
+def resolve_cover_urls(payload):
+    """Данные страницы с абсолютными адресами обложек"""
+    return {
+        **payload,
+        'items': [{**item, 'cover_url': absolute_url(item['cover_url'])} for item in payload['items']]
+    }
+
+
+@media_bp.route('/', methods=['GET'])
+@query_budget(8)
+@cross_origin(supports_credentials=True)
+@auth_optional
+def get_media():
+    """Получить каталог медиа"""
+    try:
+        params = catalog_params(request.args)
+        payload, body, etag = get_cached_catalog_page(params)
 
-        user_statuses = {}
         if g.get('user_id'):
-            user_media_entries = UserMediaList.query.filter_by(
-                user_id=g.user_id
-            ).all()
-
-            for entry in user_media_entries:
-                media_id = entry.media_id
-                if media_id not in user_statuses:
-                    user_statuses[media_id] = {
-                        'planned': False,
-                        'completed': False,
-                        'favorite': False
-                    }
-                user_statuses[media_id][entry.list_type] = True
-
-        items = [{
-            'id': media.id,
-            'title': media.title,
-            'type': media.type,
-            'author': media.author,
-            'cover_url': media.cover_url,
-            'rating': media.external_rating,
-            'year': media.release_year,
-            'is_planned': user_statuses.get(media.id, {}).get('planned', False),
-            'is_completed': user_statuses.get(media.id, {}).get('completed', False),
-            'is_favorite': user_statuses.get(media.id, {}).get('favorite', False)
-        } for media in paginated.items]
+            user_statuses = get_list_statuses(
+                g.user_id,
+                [item['id'] for item in payload['items']]
+            )
+            response = jsonify({
+                **payload,
+                'items': [
+                    {**item, **status_fields(user_statuses, item['id'])}
+                    for item in payload['items']
+                ]
+            })
+            response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+            response.headers['Cache-Control'] = 'private, no-cache'
+        else:
+            response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'public, no-cache'
 
-        return jsonify({
-            'items': items,
-            'total_pages': paginated.pages,
-            'current_page': page
-        }), 200
+        response.vary.add('Authorization')
+        return response.make_conditional(request)
 
+    except CatalogError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         current_app.logger.error(f'Error fetching media: {str(e)}')
         return jsonify({
@@ -86,86 +230,75 @@ def get_media():
 
 
 @media_bp.route('/list', methods=['POST', 'OPTIONS'])
+@query_budget(8)
 @cross_origin(supports_credentials=True)
 @auth_required
 def handle_media_list():
     """Взаимодействие с пользовательскими списками медиа"""
     try:
-        data = request.get_json()
-        user_id = g.user_id
+        operation = parse_operation(request.get_json())
+        statuses = apply_list_operations(g.user_id, [operation])
+        db.session.commit()
 
-        if not data or 'media_id' not in data or 'list_type' not in data:
-            return jsonify({
-                'error': 'Missing required fields'
-            }), 400
+        return jsonify(status_fields(statuses, operation[0])), 200
 
-        media_id = data['media_id']
-        list_type = data['list_type']
-        operation = data.get('operation', 'toggle')
+    except ListOperationError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except MediaNotFound:
+        return jsonify({
+            'error': 'Media not found'
+        }), 404
+    except Exception as e:
+        current_app.logger.error(f'Error handling media list: {str(e)}')
+        db.session.rollback()
+        return jsonify({
+            'error': str(e)
+        }), 500
 
-        media = Media.query.get(media_id)
-        if not media:
-            return jsonify({
-                'error': 'Media not found'
-            }), 404
-
-        if list_type in ['planned', 'completed']:
-            opposite_type = 'completed' if list_type == 'planned' else 'planned'
-            UserMediaList.query.filter_by(
-                user_id=user_id,
-                media_id=media_id,
-                list_type=opposite_type
-            ).delete(synchronize_session=False)
-            db.session.commit()
-
-        existing = UserMediaList.query.filter_by(
-            user_id=user_id,
-            media_id=media_id,
-            list_type=list_type
-        ).first()
-
-        if operation == 'toggle':
-            should_add = not existing
-        else:
-            should_add = operation == 'add'
-
-        if should_add:
-            if not existing:
-                new_entry = UserMediaList(
-                    user_id=user_id,
-                    media_id=media_id,
-                    list_type=list_type,
-                    added_at=datetime.utcnow()
-                )
-                db.session.add(new_entry)
-        else:
-            if existing:
-                db.session.delete(existing)
 
-        db.session.commit()
+@media_bp.route('/list/batch', methods=['POST', 'OPTIONS'])
+@query_budget(8)
+@cross_origin(supports_credentials=True)
+@auth_required
+def handle_media_list_batch():
+    """Пакетное изменение пользовательских списков в одной транзакции"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list) or not data['items']:
+        return jsonify({
+            'error': 'Missing items'
+        }), 400
 
-        current_status = {
-            'is_planned': UserMediaList.query.filter_by(
-                user_id=user_id,
-                media_id=media_id,
-                list_type='planned'
-            ).first() is not None,
-            'is_completed': UserMediaList.query.filter_by(
-                user_id=user_id,
-                media_id=media_id,
-                list_type='completed'
-            ).first() is not None,
-            'is_favorite': UserMediaList.query.filter_by(
-                user_id=user_id,
-                media_id=media_id,
-                list_type='favorite'
-            ).first() is not None
-        }
+    limit = current_app.config.get('LIST_BATCH_LIMIT', 500)
+    if len(data['items']) > limit:
+        return jsonify({
+            'error': f'Too many items, limit is {limit}'
+        }), 400
 
-        return jsonify(current_status), 200
+    try:
+        operations = [parse_operation(item) for item in data['items']]
+        statuses = apply_list_operations(g.user_id, operations)
+        db.session.commit()
 
+        return jsonify({
+            'statuses': {
+                str(media_id): status_fields(statuses, media_id)
+                for media_id in statuses
+            }
+        }), 200
+
+    except ListOperationError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except MediaNotFound as e:
+        return jsonify({
+            'error': 'Media not found',
+            'media_ids': e.media_ids
+        }), 404
     except Exception as e:
-        current_app.logger.error(f'Error handling media list: {str(e)}')
+        current_app.logger.error(f'Error handling media list batch: {str(e)}')
         db.session.rollback()
         return jsonify({
             'error': str(e)
@@ -173,6 +306,7 @@ def handle_media_list():
 
 
 @media_bp.route('/favorites', methods=['GET'])
+@query_budget(3)
 @auth_optional
 def get_favorites():
     """Получение списка избранного"""
@@ -200,21 +334,10 @@ def get_favorites():
             UserMediaList.added_at.desc()
         ).all()
 
-        user_statuses = {}
-        if g.get('user_id'):
-            user_media_entries = UserMediaList.query.filter_by(
-                user_id=g.user_id
-            ).all()
-
-            for entry in user_media_entries:
-                media_id = entry.media_id
-                if media_id not in user_statuses:
-                    user_statuses[media_id] = {
-                        'planned': False,
-                        'completed': False,
-                        'favorite': False
-                    }
-                user_statuses[media_id][entry.list_type] = True
+        user_statuses = get_list_statuses(
+            g.get('user_id'),
+            [media_entry.id for _, media_entry in favorites]
+        )
 
         result = []
         for user_media_entry, media_entry in favorites:
@@ -223,12 +346,14 @@ def get_favorites():
                     'id': media_entry.id,
                     'title': media_entry.title,
                     'type': media_entry.type,
-                    'cover_url': media_entry.cover_url,
+                    'cover_url': cover_thumbnail_url(
+                        media_entry.id,
+                        media_entry.cover_hash,
+                        media_entry.cover_url
+                    ),
                     'rating': media_entry.external_rating,
                     'year': media_entry.release_year,
-                    'is_planned': user_statuses.get(media_entry.id, {}).get('planned', False),
-                    'is_completed': user_statuses.get(media_entry.id, {}).get('completed', False),
-                    'is_favorite': user_statuses.get(media_entry.id, {}).get('favorite', False)
+                    **status_fields(user_statuses, media_entry.id)
                 },
                 'added_at': user_media_entry.added_at.isoformat()
             })
@@ -245,41 +370,89 @@ def get_favorites():
 
 
 @media_bp.route('/<int:media_id>', methods=['GET'])
+@query_budget(2)
 def get_media_details(media_id):
     """Получение информации о произведении"""
-    media = Media.query.get_or_404(media_id)
-    return jsonify({
+    media = get_media_row(media_id)
+    if media is None:
+        abort(404)
+
+    response = jsonify({
+        'id': media['id'],
+        'title': media['title'],
+        'type': media['type'],
+        'author': media['author'],
+        'release_year': media['release_year'],
+        'description': media['description'],
+        'cover_url': cover_thumbnail_url(
+            media['id'],
+            media['cover_hash'],
+            media['cover_url'],
+            DETAIL_COVER_SIZE
+        ),
+        'external_rating': media['external_rating'],
+        'external_rating_count': media['external_rating_count']
+    })
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('MEDIA_DETAIL_MAX_AGE', 300)
+    return response.make_conditional(request)
+
+
+@media_bp.route('/<int:media_id>/cover', methods=['GET'])
+@query_budget(3)
+def get_media_cover(media_id):
+    """Миниатюра обложки: загрузка при первом обращении и перенаправление на файл"""
+    media = db.session.get(Media, media_id)
+    if media is None or not media.cover_url:
+        abort(404)
+
+    size = cover_size(request.args.get('size', CATALOG_COVER_SIZE, type=int))
+    cover_hash = media.cover_hash
+    if not cover_hash:
+        try:
+            cover_hash = cache_cover(media)
+        except CoverError as e:
+            current_app.logger.warning(str(e))
+            return redirect(media.cover_url)
+
+    return redirect(url_for('cover_file', filename=thumbnail_filename(cover_hash, size)))
+
+
+@media_bp.route('/<int:media_id>/similar', methods=['GET'])
+@query_budget(1)
+def get_media_similar(media_id):
+    """Похожие произведения по спискам пользователей"""
+    limit = min(max(request.args.get('limit', SIMILAR_TOP_K, type=int), 1), SIMILAR_TOP_K)
+
+    items = [{
         'id': media.id,
         'title': media.title,
         'type': media.type,
-        'author': media.author,
-        'release_year': media.release_year,
-        'description': media.description,
-        'cover_url': media.cover_url,
-        'external_rating': media.external_rating,
-        'external_rating_count': media.external_rating_count
-    })
+        'cover_url': cover_thumbnail_url(media.id, media.cover_hash, media.cover_url),
+        'rating': media.external_rating,
+        'year': media.release_year,
+        'score': round(score, 4)
+    } for media, score in get_similar_media(media_id, limit)]
+
+    response = jsonify({'items': items})
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('MEDIA_DETAIL_MAX_AGE', 300)
+    return response
 
 
 @media_bp.route('/<int:media_id>/status', methods=['GET'])
+@query_budget(1)
 @auth_optional
 def get_media_status(media_id):
     """Получение статуса произведения"""
     if not g.user_id:
         return jsonify({}), 200
 
+    list_types = get_list_statuses(g.user_id, [media_id]).get(media_id, ())
     status = {
-        'planned': False,
-        'completed': False,
-        'favorite': False
+        list_type: list_type in list_types
+        for list_type in LIST_TYPES
     }
 
-    for list_type in status.keys():
-        exists = UserMediaList.query.filter_by(
-            user_id=g.user_id,
-            media_id=media_id,
-            list_type=list_type
-        ).first()
-        status[list_type] = exists is not None
-
     return jsonify(status)
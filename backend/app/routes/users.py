@@ -1,14 +1,15 @@
-import os
-
-from datetime import datetime
 from flask import Blueprint, current_app, g, jsonify, request
 from flask_cors import cross_origin
-from sqlalchemy import func
-from werkzeug.utils import secure_filename
 
 from app.models import db, Friendship, Media, User, UserMediaList
 from app.routes.auth import auth_optional, auth_required
 from app.schemas import ProfileUpdateSchema
+from app.utils.avatars import AvatarError, AvatarTooLarge, read_limited, save_avatar
+from app.utils.covers import cover_thumbnail_url
+from app.utils.friendships import get_friendship_status, get_friendship_statuses
+from app.utils.statuses import get_list_statuses, status_fields
+from app.utils.query_budget import query_budget
+from app.utils.user_stats import get_profile_stats
 
 
 users_bp = Blueprint('users', __name__)
@@ -24,6 +25,7 @@ def allowed_file(filename):
 
 
 @users_bp.route('/<username>', methods=['GET'])
+@query_budget(5)
 @cross_origin(supports_credentials=True)
 @auth_optional
 def get_profile(username):
@@ -53,112 +55,25 @@ def get_profile(username):
             UserMediaList.added_at.desc()
         ).all()
 
-        user_statuses = {}
-        if g.get('user_id'):
-            user_media_entries = UserMediaList.query.filter_by(
-                user_id=g.user_id
-            ).all()
-
-            for entry in user_media_entries:
-                media_id = entry.media_id
-                if media_id not in user_statuses:
-                    user_statuses[media_id] = {
-                        'planned': False,
-                        'completed': False,
-                        'favorite': False
-                    }
-                user_statuses[media_id][entry.list_type] = True
+        user_statuses = get_list_statuses(
+            g.get('user_id'),
+            [media.id for _, media in query]
+        )
 
         media = [{
             "id": media.id,
             "title": media.title,
             "type": media.type,
-            "cover_url": media.cover_url,
+            "cover_url": cover_thumbnail_url(media.id, media.cover_hash, media.cover_url),
             'rating': media.external_rating,
             'year': media.release_year,
-            'is_planned': user_statuses.get(media.id, {}).get('planned', False),
-            'is_completed': user_statuses.get(media.id, {}).get('completed', False),
-            'is_favorite': user_statuses.get(media.id, {}).get('favorite', False)
+            **status_fields(user_statuses, media.id)
         } for user_media, media in query]
         return jsonify(media)
 
-    stats = {
-        'anime': {
-            'completed': user.lists.filter_by(list_type='completed')
-            .join(Media)
-            .filter(Media.type == 'anime')
-            .count(),
-            'planned': user.lists.filter_by(list_type='planned')
-            .join(Media)
-            .filter(Media.type == 'anime')
-            .count()
-        },
-        'movies': {
-            'completed': user.lists.filter_by(list_type='completed')
-            .join(Media)
-            .filter(Media.type == 'movie')
-            .count(),
-            'planned': user.lists.filter_by(list_type='planned')
-            .join(Media)
-            .filter(Media.type == 'movie')
-            .count()
-        },
-        'books': {
-            'completed': user.lists.filter_by(list_type='completed')
-            .join(Media)
-            .filter(Media.type == 'book')
-            .count(),
-            'planned': user.lists.filter_by(list_type='planned')
-            .join(Media)
-            .filter(Media.type == 'book')
-            .count()
-        }
-    }
+    stats, durations = get_profile_stats(user.id)
 
-    durations = {
-        'anime': {
-            'completed': user.lists.join(Media)
-            .filter(
-                UserMediaList.list_type == 'completed',
-                Media.type == 'anime'
-            )
-            .with_entities(func.coalesce(func.sum(Media.duration), 0))
-            .scalar()
-        },
-        'movies': {
-            'completed': user.lists.join(Media)
-            .filter(
-                UserMediaList.list_type == 'completed',
-                Media.type == 'movie'
-            )
-            .with_entities(func.coalesce(func.sum(Media.duration), 0))
-            .scalar()
-        },
-        'books': {
-            'completed': user.lists.join(Media)
-            .filter(
-                UserMediaList.list_type == 'completed',
-                Media.type == 'book'
-            )
-            .with_entities(func.coalesce(func.sum(Media.duration), 0))
-            .scalar()
-        }
-    }
-
-    status = 'none'
-    if g.get('user_id'):
-        current_user = User.query.get(g.user_id)
-        friendship = Friendship.query.filter(
-            ((Friendship.user_id == user.id) & (Friendship.friend_id == current_user.id)
-             |
-             (Friendship.friend_id == user.id) & (Friendship.user_id == current_user.id))
-        ).first()
-        if friendship:
-            if not friendship.status == 'pending':
-                status = friendship.status
-            else:
-                type = 'incoming' if friendship.friend_id == current_user.id else 'outcoming'
-                status = friendship.status + ' ' + type
+    status = get_friendship_status(g.get('user_id'), user.id)
 
     return jsonify({
         'id': user.id,
@@ -177,6 +92,7 @@ def get_profile(username):
 
 
 @users_bp.route('/me', methods=['PUT'])
+@query_budget(1)
 @auth_required
 def update_profile():
     """Редактирование профиля"""
@@ -218,6 +134,7 @@ def update_profile():
 
 
 @users_bp.route('/avatar', methods=['POST'])
+@query_budget(1)
 @auth_required
 def upload_avatar():
     """Загрузка аватара"""
@@ -237,36 +154,29 @@ def upload_avatar():
             'error': 'Invalid file type'
         }), 400
 
-    if len(file.read()) > MAX_FILE_SIZE:
-        return jsonify({
-            'error': 'File size exceeds 2MB limit'
-        }), 400
-    file.seek(0)
-
-    filename = secure_filename(
-        f"user_{g.user_id}_{datetime.now().timestamp()}."
-        f"{file.filename.rsplit('.', 1)[1].lower()}"
-    )
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    file_path = os.path.join(upload_folder, filename)
-
     try:
-        file.save(file_path)
-        user = User.query.get(g.user_id)
-        user.avatar_filename = filename
-        db.session.commit()
+        filename = save_avatar(g.user_id, read_limited(file.stream, MAX_FILE_SIZE))
         return jsonify({
             'avatar_url': f'{filename}'
         }), 200
+    except AvatarTooLarge:
+        return jsonify({
+            'error': 'File size exceeds 2MB limit'
+        }), 400
+    except AvatarError:
+        return jsonify({
+            'error': 'Invalid image'
+        }), 400
     except Exception as e:
         current_app.logger.error(f"Avatar upload failed: {str(e)}")
+        db.session.rollback()
         return jsonify({
             'error': 'File upload failed'
         }), 500
 
 
 @users_bp.route('/<username>/friends', methods=['GET'])
+@query_budget(3)
 def get_user_friends(username):
     """Получение списка друзей"""
     user = User.query.filter_by(username=username).first_or_404()
@@ -276,15 +186,17 @@ def get_user_friends(username):
         Friendship.status == 'accepted'
     ).limit(5).all()
 
-    friends_list = []
-    for f in friends:
-        friend_id = f.friend_id if f.user_id == user.id else f.user_id
-        friend = User.query.get(friend_id)
-        friends_list.append({
-            'id': friend.id,
-            'username': friend.username,
-            'avatar': friend.avatar_filename
-        })
+    friend_ids = [f.friend_id if f.user_id == user.id else f.user_id for f in friends]
+    users = {
+        u.id: u
+        for u in User.query.filter(User.id.in_(friend_ids))
+    }
+
+    friends_list = [{
+        'id': users[friend_id].id,
+        'username': users[friend_id].username,
+        'avatar': users[friend_id].avatar_filename
+    } for friend_id in friend_ids]
 
     return jsonify({
         'friends': friends_list
@@ -292,6 +204,7 @@ def get_user_friends(username):
 
 
 @users_bp.route('/search', methods=['GET'])
+@query_budget(2)
 @auth_required
 def search_users():
     """Поиск по пользователям"""
@@ -300,22 +213,13 @@ def search_users():
         (User.username.ilike(f'%{query}%') | User.display_name.ilike(f'%{query}%'))
     ).limit(10).all()
 
-    current_user = User.query.get(g.user_id)
+    statuses = get_friendship_statuses(g.user_id, [u.id for u in users])
 
     return jsonify([{
         'id': u.id,
         'username': u.username,
         'avatar': u.avatar_filename,
         'displayName': u.display_name,
-        'status': Friendship.query.filter(
-            ((Friendship.user_id == u.id) & (Friendship.friend_id == current_user.id)
-             |
-             (Friendship.friend_id == u.id) & (Friendship.user_id == current_user.id))
-        ).first().status
-        if Friendship.query.filter(
-            ((Friendship.user_id == u.id) & (Friendship.friend_id == current_user.id)
-             |
-             (Friendship.friend_id == u.id) & (Friendship.user_id == current_user.id))
-        ).first() else 'none',
-        'isCurrentUser': u.id == current_user.id
+        'status': statuses[u.id].split(' ')[0],
+        'isCurrentUser': u.id == g.user_id
     } for u in users]), 200
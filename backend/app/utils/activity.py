@@ -0,0 +1,81 @@
+from sqlalchemy import select, true, tuple_, union_all
+from sqlalchemy.orm import aliased
+
+from app.models import db, Friendship, Media, User, UserActivity
+
+
+FEED_PER_PAGE = 20
+FEED_MAX_PER_PAGE = 50
+
+
+def record_list_activity(user_id, added, removed, created_at):
+    """Запись событий ленты в текущей транзакции
+
+    Добавления в списки становятся событиями; при удалении из списка
+    соответствующие события убираются, чтобы лента не показывала устаревшее.
+    """
+    table = UserActivity.__table__
+    if removed:
+        db.session.execute(table.delete().where(
+            table.c.user_id == user_id,
+            tuple_(table.c.media_id, table.c.list_type).in_([tuple(row) for row in removed])
+        ))
+    if added:
+        db.session.execute(table.insert(), [{
+            'user_id': user_id,
+            'media_id': media_id,
+            'list_type': list_type,
+            'created_at': created_at
+        } for media_id, list_type in added])
+
+
+def _friend_ids(user_id):
+    return union_all(
+        select(Friendship.friend_id.label('id')).where(
+            Friendship.user_id == user_id,
+            Friendship.status == 'accepted'
+        ),
+        select(Friendship.user_id.label('id')).where(
+            Friendship.friend_id == user_id,
+            Friendship.status == 'accepted'
+        )
+    ).subquery('friend_ids')
+
+
+def get_friends_feed(user_id, before=None, limit=FEED_PER_PAGE):
+    """Страница ленты друзей одним запросом
+
+    Слияние при чтении: в Postgres для каждого друга через LATERAL берутся
+    не больше limit + 1 последних событий по индексу (user_id, id), затем
+    они сливаются по id. Число запросов не зависит от числа друзей.
+    Возвращает тройки (UserActivity, User, Media) и курсор следующей страницы.
+    """
+    friends = _friend_ids(user_id)
+
+    def recent(friend_filter):
+        statement = select(UserActivity).where(friend_filter)
+        if before is not None:
+            statement = statement.where(UserActivity.id < before)
+        return statement.order_by(UserActivity.id.desc()).limit(limit + 1)
+
+    if db.engine.dialect.name == 'postgresql':
+        activity = aliased(UserActivity, recent(UserActivity.user_id == friends.c.id).lateral('activity'))
+        query = db.session.query(activity, User, Media).select_from(friends).join(activity, true())
+    else:
+        activity = aliased(UserActivity, recent(UserActivity.user_id.in_(select(friends.c.id))).subquery('activity'))
+        query = db.session.query(activity, User, Media)
+
+    rows = query.join(
+        User,
+        User.id == activity.user_id
+    ).join(
+        Media,
+        Media.id == activity.media_id
+    ).order_by(
+        activity.id.desc()
+    ).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1][0].id
@@ -1,12 +1,17 @@
+import argparse
+import asyncio
 import json
 import os
+import random
 import requests
+import threading
+import time
 
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from fake_useragent import UserAgent
 from gql import Client, gql
 from gql.transport.requests import RequestsHTTPTransport
+from livelib_parser import parse_livelib_page
 from pathlib import Path
 
 
@@ -14,39 +19,19 @@ load_dotenv()
 
 MAX_RESULTS = 100
 
+KINOPOISK_API_URL = os.getenv('KINOPOISK_API_URL', 'https://api.kinopoisk.dev/v1.4/movie')
+KINOPOISK_PAGE_LIMIT = 250
+KINOPOISK_FIELDS = ['id', 'name', 'description', 'year', 'rating', 'votes', 'movieLength', 'poster']
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def parse_livelib_books():
-    """Парсинг книг с LiveLib"""
-    books = []
-    try:
-        with open('livelib_raw.txt', encoding='utf-8') as f:
-            page_raw = f.read()
-
-        soup = BeautifulSoup(page_raw, 'lxml')
-        items = soup.find_all('div', class_='brow-inner rback')
-
-        for item in items[:100]:
-            title = item.find('a', class_='brow-book-name with-cycle').text.strip()
-            author = item.select_one('a.brow-book-author').text.strip()
-            rating = item.find('span', class_='rating-value stars-color-orange').text
-            release_year = item.find('table', class_='compact').find_all('tr')[1].find_all('td')[1].text
-            description = item.find('div', class_='brow-marg').find('p').text.strip()
-            cover = item.find('div', class_='cover-wrapper').find('img')
-            cover_url = cover['data-pagespeed-lazy-src']
-
-            books.append({
-                'title': title,
-                'author': author,
-                'rating': round(float(rating) * 2, 1),
-                'release_year': release_year,
-                'description': description,
-                'cover': cover_url
-            })
 
-    except Exception as e:
-        print(f'Ошибка при парсинге: {e}')
+def parse_livelib_books(path='livelib_raw.txt'):
+    """Парсинг книг с LiveLib"""
+    books, errors = parse_livelib_page(path)
+    for error in errors:
+        print(f'Ошибка при парсинге: {error}')
 
-    return books[:100]
+    return books[:MAX_RESULTS]
 
 
 def fetch_kinopoisk_movies(api_key):
@@ -64,7 +49,7 @@ def fetch_kinopoisk_movies(api_key):
         'type': 'movie',
         'sortField': 'votes.kp',
         'sortType': '-1',
-        'selectFields': ['name', 'description', 'year', 'rating', 'votes', 'movieLength', 'poster']
+        'selectFields': KINOPOISK_FIELDS
     }
 
     try:
@@ -72,21 +57,199 @@ def fetch_kinopoisk_movies(api_key):
         if response.status_code == 200:
             data = response.json()
             for movie in data.get('docs', []):
-                movies.append({
-                    'title': movie.get('name', 'Без названия'),
-                    'description': movie.get('description', ''),
-                    'release_year': movie.get('year', ''),
-                    'external_rating': movie.get('rating', {}).get('kp', 0),
-                    'external_rating_count': movie.get('votes', {}).get('kp', 0),
-                    'duration': movie.get('movieLength', 0),
-                    'cover_url': movie.get('poster', {}).get('url', '')
-                })
+                movies.append(kinopoisk_movie_record(movie))
     except Exception as e:
         print(f"Ошибка при запросе к Кинопоиску: {e}")
 
     return movies[:MAX_RESULTS]
 
 
+def kinopoisk_movie_record(movie):
+    """Запись фильма в формате media_data.json"""
+    return {
+        'external_id': movie.get('id'),
+        'title': movie.get('name', 'Без названия'),
+        'description': movie.get('description', ''),
+        'release_year': movie.get('year', ''),
+        'external_rating': movie.get('rating', {}).get('kp', 0),
+        'external_rating_count': movie.get('votes', {}).get('kp', 0),
+        'duration': movie.get('movieLength', 0),
+        'cover_url': (movie.get('poster') or {}).get('url', '')
+    }
+
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, запас capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CrawlCheckpoint:
+    """Список загруженных страниц, сохраняется атомарно после каждой страницы"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.pages = None
+        self.done = set()
+        if self.path.exists():
+            state = json.loads(self.path.read_text(encoding='utf-8'))
+            self.pages = state.get('pages')
+            self.done = set(state.get('done', []))
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp_path.write_text(json.dumps({
+            'pages': self.pages,
+            'done': sorted(self.done)
+        }), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+
+class KinopoiskCrawler:
+    """Асинхронный обход всех страниц Kinopoisk API
+
+    Страницы загружаются параллельно (не больше concurrency одновременно,
+    не чаще rate в секунду), неудачные запросы повторяются с
+    экспоненциальной задержкой. Фильмы дописываются в JSONL-файл по мере
+    загрузки, номера готовых страниц — в файл контрольной точки, так что
+    прерванный обход продолжается с места остановки.
+    """
+
+    def __init__(self, api_key, output_path, checkpoint_path, base_url=KINOPOISK_API_URL,
+                 concurrency=4, rate=5.0, retries=5, backoff=1.0, page_limit=KINOPOISK_PAGE_LIMIT,
+                 max_pages=None):
+        self.api_key = api_key
+        self.output_path = Path(output_path)
+        self.checkpoint = CrawlCheckpoint(checkpoint_path)
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.page_limit = page_limit
+        self.max_pages = max_pages
+        self.written = 0
+        self._local = threading.local()
+        self._write_lock = asyncio.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers['X-API-KEY'] = self.api_key or ''
+            self._local.session = session
+        return session
+
+    def _get(self, page):
+        params = {
+            'page': page,
+            'limit': self.page_limit,
+            'type': 'movie',
+            'sortField': 'votes.kp',
+            'sortType': '-1',
+            'selectFields': KINOPOISK_FIELDS
+        }
+        return self._session().get(self.base_url, params=params, timeout=30)
+
+    async def fetch_page(self, page):
+        """Загрузка страницы с повторами"""
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                response = await asyncio.to_thread(self._get, page)
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                error = f'HTTP {response.status_code}'
+            except requests.RequestException as e:
+                if e.response is not None and e.response.status_code not in RETRY_STATUSES:
+                    raise
+                error = str(e)
+
+            if attempt < self.retries:
+                print(f'Страница {page}: {error}, повтор через {delay:.1f} с')
+                await asyncio.sleep(delay)
+        raise RuntimeError(f'Страница {page} не загружена: {error}')
+
+    async def _store(self, page, data, output):
+        async with self._write_lock:
+            for movie in data.get('docs', []):
+                output.write(json.dumps(kinopoisk_movie_record(movie), ensure_ascii=False) + '\n')
+                self.written += 1
+            output.flush()
+            self.checkpoint.done.add(page)
+            self.checkpoint.save()
+
+    async def _worker(self, queue, output):
+        while True:
+            page = await queue.get()
+            try:
+                await self._store(page, await self.fetch_page(page), output)
+            except Exception as e:
+                print(f'Ошибка при загрузке страницы {page}: {e}')
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        """Обход; возвращает число записанных фильмов"""
+        with open(self.output_path, 'a', encoding='utf-8') as output:
+            if self.checkpoint.pages is None:
+                first = await self.fetch_page(1)
+                self.checkpoint.pages = first.get('pages', 1)
+                await self._store(1, first, output)
+
+            pages = self.checkpoint.pages
+            if self.max_pages:
+                pages = min(pages, self.max_pages)
+
+            queue = asyncio.Queue()
+            for page in range(1, pages + 1):
+                if page not in self.checkpoint.done:
+                    queue.put_nowait(page)
+
+            workers = [
+                asyncio.create_task(self._worker(queue, output))
+                for _ in range(self.concurrency)
+            ]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        missing = pages - len([page for page in self.checkpoint.done if page <= pages])
+        if missing:
+            print(f'Не загружено страниц: {missing}, перезапустите обход для продолжения')
+        return self.written
+
+
+def crawl_kinopoisk_movies(api_key, output_path='movies.jsonl', checkpoint_path='movies.checkpoint.json',
+                           **options):
+    """Полная выгрузка фильмов Кинопоиска в JSONL"""
+    crawler = KinopoiskCrawler(api_key, output_path, checkpoint_path, **options)
+    return asyncio.run(crawler.run())
+
+
 def fetch_shikimori_graphql(api_key):
     """Получение аниме из Shikimori"""
     anime_list = []
@@ -110,6 +273,7 @@ def fetch_shikimori_graphql(api_key):
     for anime in animes:
         anime_list.append(
             {
+                'external_id': anime['id'],
                 'title': anime['russian'],
                 'description': anime['description'],
                 'year': anime['releasedOn']['year'],
@@ -154,4 +318,27 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Сбор данных для каталога')
+    subparsers = parser.add_subparsers(dest='command')
+    crawl = subparsers.add_parser('crawl-movies', help='полная выгрузка фильмов Кинопоиска в JSONL')
+    crawl.add_argument('--output', default='movies.jsonl')
+    crawl.add_argument('--checkpoint', default='movies.checkpoint.json')
+    crawl.add_argument('--base-url', default=KINOPOISK_API_URL)
+    crawl.add_argument('--concurrency', type=int, default=4)
+    crawl.add_argument('--rate', type=float, default=5.0, help='запросов в секунду')
+    crawl.add_argument('--max-pages', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'crawl-movies':
+        written = crawl_kinopoisk_movies(
+            os.getenv('KINOPOISKDEV_API_KEY'),
+            args.output,
+            args.checkpoint,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            max_pages=args.max_pages
+        )
+        print(f'Записано фильмов: {written}')
+    else:
+        main()
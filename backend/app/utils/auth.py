@@ -3,10 +3,17 @@ import jwt
 from datetime import datetime, timedelta
 from flask import current_app
 
+from app.utils.cache import get_app_cache
+
 
 JWT_EXPIRATION_HOURS = 8
 
 
+def get_token_cache():
+    """LRU-кэш проверенных токенов, записи живут до exp токена"""
+    return get_app_cache('token_cache', 'JWT_CACHE_SIZE', 4096)
+
+
 def generate_token(user_id):
     """Генерация токена"""
     payload = {
@@ -23,13 +30,20 @@ def generate_token(user_id):
 
 def decode_token(token):
     """Проверка токена"""
+    cache = get_token_cache()
+    user_id = cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(
             token,
             current_app.config['SECRET_KEY'],
             algorithms=['HS256']
         )
-        return int(payload['sub'])
+        user_id = int(payload['sub'])
+        cache.set(token, user_id, payload['exp'])
+        return user_id
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
@@ -0,0 +1,174 @@
+import hashlib
+import io
+import os
+import re
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from PIL import Image, ImageOps
+
+from app.models import db, User
+
+
+AVATAR_SIZES = (64, 128, 256)
+DEFAULT_AVATAR_SIZE = 256
+ORIGINAL_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif', 'WEBP': 'webp'}
+MAX_AVATAR_PIXELS = 2048 * 2048
+READ_CHUNK_SIZE = 64 * 1024
+AVATAR_FILENAME_RE = re.compile(r'^avatar_(?P<hash>[0-9a-f]{64})_\d+\.webp$')
+
+
+class AvatarError(Exception):
+    """Загруженный файл не является допустимым изображением"""
+
+
+class AvatarTooLarge(AvatarError):
+    """Файл больше допустимого размера"""
+
+
+def _get_executor():
+    executor = current_app.extensions.get('avatar_executor')
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=current_app.config.get('AVATAR_WORKERS', 2),
+            thread_name_prefix='avatars'
+        )
+        current_app.extensions['avatar_executor'] = executor
+    return executor
+
+
+def avatar_filename(avatar_hash, size=DEFAULT_AVATAR_SIZE):
+    return f'avatar_{avatar_hash}_{size}.webp'
+
+
+def original_filename(avatar_hash, image_format):
+    return f'avatar_{avatar_hash}_original.{ORIGINAL_EXTENSIONS[image_format]}'
+
+
+def read_limited(stream, max_size):
+    """Чтение загрузки по частям с прерыванием при превышении размера"""
+    data = io.BytesIO()
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return data.getvalue()
+        data.write(chunk)
+        if data.tell() > max_size:
+            raise AvatarTooLarge()
+
+
+def _write_atomic(path, write):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_bytes(data):
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return write
+
+
+def _rendered(folder, avatar_hash):
+    return all(os.path.exists(os.path.join(folder, avatar_filename(avatar_hash, size))) for size in AVATAR_SIZES)
+
+
+def _render_avatars(data, folder, avatar_hash):
+    image = Image.open(io.BytesIO(data))
+    # JPEG сразу декодируется в уменьшенном масштабе, не меньше нужного размера
+    image.draft(None, (AVATAR_SIZES[-1], AVATAR_SIZES[-1]))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    image = ImageOps.fit(image, (AVATAR_SIZES[-1], AVATAR_SIZES[-1]), Image.LANCZOS)
+
+    for size in AVATAR_SIZES:
+        resized = image if size == AVATAR_SIZES[-1] else image.resize((size, size), Image.LANCZOS)
+        path = os.path.join(folder, avatar_filename(avatar_hash, size))
+        _write_atomic(path, lambda tmp_path: resized.save(tmp_path, 'WEBP', quality=85))
+
+
+def _set_user_avatar(user_id, filename):
+    User.query.filter_by(id=user_id).update({User.avatar_filename: filename})
+    db.session.commit()
+
+
+def _process(app, data, folder, avatar_hash, original, user_id):
+    """Фоновая обработка размеров; при ошибке у пользователя остаётся прежний аватар"""
+    with app.app_context():
+        try:
+            _render_avatars(data, folder, avatar_hash)
+            _set_user_avatar(user_id, avatar_filename(avatar_hash))
+        except Exception:
+            db.session.rollback()
+            app.logger.exception(f'Avatar processing failed for user {user_id}')
+        finally:
+            path = os.path.join(folder, original)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def check_avatar(data):
+    """Проверка заголовка и структуры файла без декодирования пикселей
+
+    Полное декодирование и уменьшение выполняются в фоновой обработке;
+    если файл всё же окажется битым, у пользователя останется прежний
+    аватар. Возвращает формат изображения.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in ORIGINAL_EXTENSIONS or image.width * image.height > MAX_AVATAR_PIXELS:
+            raise AvatarError()
+        image.verify()
+    except AvatarError:
+        raise
+    except Exception:
+        raise AvatarError()
+    return image.format
+
+
+def save_avatar(user_id, data):
+    """Проверка изображения и смена аватара пользователя
+
+    Одинаковые загрузки делят файлы по хешу содержимого. Если размеры ещё
+    не готовы, оригинал сохраняется в каталог загрузок и отдаётся вместо
+    них (см. avatar_fallback), а аватар пользователя меняется после
+    фоновой обработки. Возвращает имя файла аватара основного размера.
+    """
+    image_format = check_avatar(data)
+    avatar_hash = hashlib.sha256(data).hexdigest()
+    folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+
+    if _rendered(folder, avatar_hash):
+        _set_user_avatar(user_id, avatar_filename(avatar_hash))
+        return avatar_filename(avatar_hash)
+
+    original = original_filename(avatar_hash, image_format)
+    _write_atomic(os.path.join(folder, original), _write_bytes(data))
+    _get_executor().submit(
+        _process, current_app._get_current_object(), data, folder, avatar_hash, original, user_id
+    )
+    return avatar_filename(avatar_hash)
+
+
+def avatar_fallback(filename):
+    """Оригинал загрузки, пока размеры аватара ещё обрабатываются
+
+    Файлы лежат в общем каталоге загрузок, поэтому оригинал отдаёт любой
+    процесс, а не только тот, что принял загрузку.
+    """
+    match = AVATAR_FILENAME_RE.match(filename)
+    folder = current_app.config['UPLOAD_FOLDER']
+    if match is None or os.path.exists(os.path.join(folder, filename)):
+        return None
+    for image_format in ORIGINAL_EXTENSIONS:
+        original = original_filename(match.group('hash'), image_format)
+        if os.path.exists(os.path.join(folder, original)):
+            return original
+    return None
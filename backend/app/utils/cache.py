@@ -0,0 +1,63 @@
+import threading
+import time
+
+from collections import OrderedDict
+from flask import current_app
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с необязательным сроком жизни записей"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def get_app_cache(name, size_key, default_size):
+    """Кэш приложения, создаётся при первом обращении"""
+    cache = current_app.extensions.get(name)
+    if cache is None:
+        cache = LRUCache(current_app.config.get(size_key, default_size))
+        current_app.extensions[name] = cache
+    return cache
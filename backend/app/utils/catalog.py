@@ -0,0 +1,73 @@
+import time
+
+from flask import current_app, g, has_request_context
+
+from app.models import db, CatalogState, Media
+from app.utils.cache import get_app_cache
+
+
+_version = None
+_version_checked_at = 0.0
+
+
+def get_catalog_version():
+    """Текущая версия каталога
+
+    Версию увеличивает импорт (load_db.import_from_json); значение
+    перечитывается из базы не чаще раза в CATALOG_VERSION_TTL секунд.
+    Внутри HTTP-запроса версия читается один раз и запоминается в g,
+    чтобы все части ответа строились по одной версии.
+    """
+    global _version, _version_checked_at
+
+    if has_request_context() and 'catalog_version' in g:
+        return g.catalog_version
+
+    now = time.monotonic()
+    if _version is None or now - _version_checked_at >= current_app.config.get('CATALOG_VERSION_TTL', 5):
+        _version = db.session.query(CatalogState.version).filter_by(id=1).scalar() or 0
+        _version_checked_at = now
+    if has_request_context():
+        g.catalog_version = _version
+    return _version
+
+
+def reset_request_catalog_version():
+    """Сброс запомненной версии в начале запроса
+
+    Контекст приложения может пережить несколько запросов (тестовый
+    клиент внутри app_context), и без сброса g отдал бы версию прошлого.
+    """
+    g.pop('catalog_version', None)
+
+
+def bump_catalog_version():
+    """Увеличение версии каталога в текущей транзакции"""
+    global _version
+
+    updated = CatalogState.query.filter_by(id=1).update({
+        CatalogState.version: CatalogState.version + 1
+    })
+    if not updated:
+        db.session.add(CatalogState(id=1, version=1))
+    _version = None
+    g.pop('catalog_version', None)
+
+
+def get_media_row(media_id):
+    """Запись каталога из кэша в памяти процесса
+
+    Кэш ограничен MEDIA_CACHE_SIZE записями, ключ включает версию каталога.
+    Возвращает словарь полей Media или None.
+    """
+    cache = get_app_cache('media_cache', 'MEDIA_CACHE_SIZE', 10000)
+    key = (get_catalog_version(), media_id)
+
+    row = cache.get(key)
+    if row is None:
+        media = db.session.get(Media, media_id)
+        if media is None:
+            return None
+        row = {column.key: getattr(media, column.key) for column in Media.__table__.columns}
+        cache.set(key, row)
+    return row
@@ -0,0 +1,222 @@
+import click
+import hashlib
+import io
+import os
+import requests
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import current_app, request, url_for
+from flask.cli import with_appcontext
+from PIL import Image, ImageOps
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from app.models import db, Media
+from app.utils.catalog import bump_catalog_version
+
+
+COVER_SIZES = (160, 320, 640)
+CATALOG_COVER_SIZE = 320
+DETAIL_COVER_SIZE = 640
+
+_fetches = {}
+_fetches_lock = threading.Lock()
+
+
+class CoverError(Exception):
+    """Обложку не удалось загрузить или обработать"""
+
+
+def cover_folder():
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'covers')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def thumbnail_filename(cover_hash, size):
+    return f'{cover_hash}_{size}.jpg'
+
+
+def cover_size(size):
+    """Ближайший доступный размер миниатюры не меньше запрошенного"""
+    return next((width for width in COVER_SIZES if width >= size), COVER_SIZES[-1])
+
+
+def cover_thumbnail_path(media_id, cover_hash, cover_url, size=CATALOG_COVER_SIZE):
+    """Путь миниатюры обложки относительно корня сайта
+
+    Для уже сохранённых обложек — неизменяемый путь файла, для остальных —
+    путь, который загрузит обложку при первом обращении. Не зависит от
+    хоста запроса, поэтому его можно хранить в общем кэше ответов.
+    """
+    if cover_hash:
+        return url_for('cover_file', filename=thumbnail_filename(cover_hash, size))
+    if cover_url:
+        return url_for('media.get_media_cover', media_id=media_id, size=size)
+    return None
+
+
+def public_base_url():
+    """Адрес сайта для абсолютных ссылок: PUBLIC_URL или хост текущего запроса"""
+    return current_app.config.get('PUBLIC_URL') or request.host_url
+
+
+def absolute_url(path):
+    """Абсолютный адрес пути на сайте"""
+    return urljoin(public_base_url(), path) if path else path
+
+
+def cover_thumbnail_url(media_id, cover_hash, cover_url, size=CATALOG_COVER_SIZE):
+    """Абсолютный адрес миниатюры обложки"""
+    return absolute_url(cover_thumbnail_path(media_id, cover_hash, cover_url, size))
+
+
+def _source_url(url):
+    origin = current_app.config.get('COVER_ORIGIN_OVERRIDE')
+    if not origin:
+        return url
+    parts = urlsplit(url)
+    override = urlsplit(origin)
+    return urlunsplit((override.scheme, override.netloc, parts.path, parts.query, ''))
+
+
+def download_cover(url, max_bytes, timeout):
+    """Загрузка оригинала обложки с ограничением размера"""
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            data = io.BytesIO()
+            for chunk in response.iter_content(64 * 1024):
+                data.write(chunk)
+                if data.tell() > max_bytes:
+                    raise CoverError(f'Cover exceeds {max_bytes} bytes: {url}')
+            return data.getvalue()
+    except requests.RequestException as e:
+        raise CoverError(f'Cover download failed: {url}: {e}')
+
+
+def store_cover(data, folder):
+    """Сохранение миниатюр всех размеров под хешем содержимого"""
+    cover_hash = hashlib.sha256(data).hexdigest()
+    if all(os.path.exists(os.path.join(folder, thumbnail_filename(cover_hash, size))) for size in COVER_SIZES):
+        return cover_hash
+
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+    except Exception as e:
+        raise CoverError(f'Invalid cover image: {e}')
+
+    try:
+        for size in COVER_SIZES:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size * 3), Image.LANCZOS)
+            path = os.path.join(folder, thumbnail_filename(cover_hash, size))
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                thumbnail.save(tmp_path, 'JPEG', quality=85, optimize=True, progressive=True)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    except (OSError, ValueError) as e:
+        raise CoverError(f'Cover save failed: {e}')
+    return cover_hash
+
+
+def fetch_and_store(url, folder, max_bytes, timeout):
+    return store_cover(download_cover(url, max_bytes, timeout), folder)
+
+
+def _fetch_once(key, fetch):
+    """Одна загрузка на ключ: параллельные вызовы ждут результат первого"""
+    with _fetches_lock:
+        future = _fetches.get(key)
+        leader = future is None
+        if leader:
+            future = _fetches[key] = Future()
+
+    if leader:
+        try:
+            future.set_result(fetch())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _fetches_lock:
+                del _fetches[key]
+    return future.result()
+
+
+def _fetch_options():
+    return (
+        current_app.config.get('COVER_MAX_BYTES', 10 * 1024 * 1024),
+        current_app.config.get('COVER_FETCH_TIMEOUT', 10)
+    )
+
+
+def cache_cover(media):
+    """Загрузка обложки произведения при первом обращении
+
+    Одновременные первые обращения к одной обложке внутри процесса
+    ждут одну загрузку и запись хеша вместо того, чтобы повторять их.
+    """
+    max_bytes, timeout = _fetch_options()
+    try:
+        folder = cover_folder()
+    except OSError as e:
+        raise CoverError(f'Cover folder unavailable: {e}')
+    url = _source_url(media.cover_url)
+
+    def fetch():
+        cover_hash = fetch_and_store(url, folder, max_bytes, timeout)
+        Media.query.filter_by(id=media.id).update({Media.cover_hash: cover_hash})
+        db.session.commit()
+        return cover_hash
+
+    return _fetch_once((media.id, url), fetch)
+
+
+def cache_missing_covers(workers=8, batch_size=500):
+    """Загрузка всех ещё не сохранённых обложек каталога"""
+    folder = cover_folder()
+    max_bytes, timeout = _fetch_options()
+    stored = failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        last_id = 0
+        while True:
+            batch = db.session.query(Media.id, Media.cover_url).filter(
+                Media.id > last_id,
+                Media.cover_hash.is_(None),
+                Media.cover_url.isnot(None),
+                Media.cover_url != ''
+            ).order_by(Media.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            futures = {
+                media_id: executor.submit(fetch_and_store, _source_url(url), folder, max_bytes, timeout)
+                for media_id, url in batch
+            }
+            for media_id, future in futures.items():
+                try:
+                    Media.query.filter_by(id=media_id).update({Media.cover_hash: future.result()})
+                    stored += 1
+                except CoverError as e:
+                    current_app.logger.warning(str(e))
+                    failed += 1
+            db.session.commit()
+
+    if stored:
+        bump_catalog_version()
+        db.session.commit()
+    return stored, failed
+
+
+@click.command('cache-covers')
+@click.option('--workers', default=8, help='Число параллельных загрузок')
+@with_appcontext
+def cache_covers_command(workers):
+    """Загрузить и уменьшить обложки каталога"""
+    stored, failed = cache_missing_covers(workers)
+    click.echo(f'Сохранено обложек: {stored}, ошибок: {failed}')
@@ -0,0 +1,67 @@
+from sqlalchemy import cast, func, Integer
+
+from app.models import db, Media
+from app.utils.cache import get_app_cache
+from app.utils.catalog import get_catalog_version
+from app.utils.search import apply_search, search_capped
+
+
+YEAR_BUCKET = 10
+MAX_RATING_BUCKET = 9
+
+
+def _facet_groups(search_query):
+    """Число записей по сочетаниям (тип, десятилетие, рейтинг) одним запросом"""
+    year_bucket = (Media.release_year // YEAR_BUCKET) * YEAR_BUCKET
+    # CAST в Postgres округляет (8.6 -> 9), поэтому сначала floor
+    rating_bucket = cast(func.floor(Media.external_rating), Integer)
+
+    query = db.session.query(Media.id)
+    if search_query:
+        query, _ = apply_search(query, search_query)
+
+    return query.order_by(None).with_entities(
+        Media.type,
+        year_bucket,
+        rating_bucket,
+        func.count()
+    ).group_by(
+        Media.type,
+        year_bucket,
+        rating_bucket
+    ).all()
+
+
+def get_catalog_facets(search_query, media_type=None):
+    """Счётчики фасетов каталога для поисковой строки
+
+    Группы считаются одним запросом и кэшируются по версии каталога;
+    для пустой строки это фактически предрассчитанные фасеты всего каталога.
+    Счётчик по типам не учитывает выбранный тип, чтобы показывать
+    альтернативы, годы и рейтинги считаются внутри выбранного типа.
+    Поиск в памяти возвращает не больше SEARCH_MEMORY_LIMIT записей;
+    если совпадений больше, счётчики неполные и помечены флагом capped.
+    """
+    cache = get_app_cache('response_cache', 'RESPONSE_CACHE_SIZE', 512)
+    key = ('facets', get_catalog_version(), search_query)
+
+    entry = cache.get(key)
+    if entry is None:
+        entry = (
+            [tuple(row) for row in _facet_groups(search_query)],
+            bool(search_query) and search_capped(search_query)
+        )
+        cache.set(key, entry)
+    groups, capped = entry
+
+    facets = {'type': {}, 'year': {}, 'rating': {}, 'capped': capped}
+    for group_type, year, rating, count in groups:
+        facets['type'][group_type] = facets['type'].get(group_type, 0) + count
+        if media_type and group_type != media_type:
+            continue
+        if year is not None:
+            facets['year'][str(year)] = facets['year'].get(str(year), 0) + count
+        if rating is not None:
+            rating = str(min(rating, MAX_RATING_BUCKET))
+            facets['rating'][rating] = facets['rating'].get(rating, 0) + count
+    return facets
@@ -0,0 +1,186 @@
+import threading
+import time
+
+from array import array
+from bisect import bisect_left
+from heapq import nsmallest
+
+from flask import current_app
+from sqlalchemy.pool import StaticPool
+
+from app.models import db, Friendship
+
+
+SUGGESTIONS_LIMIT = 20
+
+_graph_lock = threading.Lock()
+
+
+class FriendGraph:
+    """Индекс принятых дружб: для каждого пользователя отсортированный
+    массив int32 с id друзей"""
+
+    def __init__(self):
+        self.adjacency = {}
+        self.edges = 0
+        self.lock = threading.Lock()
+
+    def build(self, pairs):
+        lists = {}
+        for user_id, friend_id in pairs:
+            if user_id == friend_id:
+                continue
+            lists.setdefault(user_id, []).append(friend_id)
+            lists.setdefault(friend_id, []).append(user_id)
+
+        adjacency = {}
+        edges = 0
+        for user_id, friend_ids in lists.items():
+            friends = array('i', sorted(set(friend_ids)))
+            adjacency[user_id] = friends
+            edges += len(friends)
+
+        with self.lock:
+            self.adjacency = adjacency
+            self.edges = edges // 2
+        return self
+
+    def friends(self, user_id):
+        return self.adjacency.get(user_id, array('i'))
+
+    def _insert(self, user_id, friend_id):
+        friends = self.adjacency.setdefault(user_id, array('i'))
+        position = bisect_left(friends, friend_id)
+        if position < len(friends) and friends[position] == friend_id:
+            return False
+        friends.insert(position, friend_id)
+        return True
+
+    def _delete(self, user_id, friend_id):
+        friends = self.adjacency.get(user_id)
+        if friends is None:
+            return False
+        position = bisect_left(friends, friend_id)
+        if position == len(friends) or friends[position] != friend_id:
+            return False
+        del friends[position]
+        if not friends:
+            del self.adjacency[user_id]
+        return True
+
+    def add_edge(self, user_id, friend_id):
+        with self.lock:
+            if self._insert(user_id, friend_id) and self._insert(friend_id, user_id):
+                self.edges += 1
+
+    def remove_edge(self, user_id, friend_id):
+        with self.lock:
+            if self._delete(user_id, friend_id) and self._delete(friend_id, user_id):
+                self.edges -= 1
+
+    def suggestions(self, user_id, limit=SUGGESTIONS_LIMIT, exclude=()):
+        """Друзья друзей по убыванию числа общих друзей: пары (user_id, общих)"""
+        friends = self.friends(user_id)
+        skip = set(friends)
+        skip.add(user_id)
+        skip.update(exclude)
+
+        mutual = {}
+        for friend_id in friends:
+            for candidate in self.friends(friend_id):
+                if candidate not in skip:
+                    mutual[candidate] = mutual.get(candidate, 0) + 1
+
+        return nsmallest(limit, mutual.items(), key=lambda item: (-item[1], item[0]))
+
+
+def load_friend_graph():
+    """Построение индекса по таблице friendships"""
+    pairs = db.session.query(
+        Friendship.user_id,
+        Friendship.friend_id
+    ).filter(
+        Friendship.status == 'accepted'
+    ).yield_per(10000)
+    return FriendGraph().build(pairs)
+
+
+def _publish(app, graph):
+    """Публикация нового индекса с изменениями, сделанными во время сборки"""
+    with _graph_lock:
+        changes = app.extensions.pop('friend_graph_changes', [])
+        for added, user_id, friend_id in changes:
+            if added:
+                graph.add_edge(user_id, friend_id)
+            else:
+                graph.remove_edge(user_id, friend_id)
+        app.extensions['friend_graph'] = (graph, time.monotonic())
+
+
+def _rebuild(app):
+    try:
+        with app.app_context():
+            graph = load_friend_graph()
+    except Exception:
+        app.logger.exception('Ошибка построения индекса дружб')
+        graph = app.extensions['friend_graph'][0]
+    _publish(app, graph)
+
+
+def get_friend_graph():
+    """Индекс дружб процесса
+
+    Строится при первом обращении и перестраивается раз в FRIEND_GRAPH_TTL
+    секунд, чтобы подхватить изменения, сделанные другими процессами;
+    изменения текущего процесса применяются сразу. Перестройку ведёт один
+    фоновый поток, запросы тем временем получают прежний индекс. При общем
+    соединении SQLite в памяти (StaticPool) индекс перестраивается сразу.
+    """
+    app = current_app._get_current_object()
+    state = app.extensions.get('friend_graph')
+    if state is None:
+        with _graph_lock:
+            state = app.extensions.get('friend_graph')
+            if state is None:
+                state = (load_friend_graph(), time.monotonic())
+                app.extensions['friend_graph'] = state
+        return state[0]
+
+    if time.monotonic() - state[1] < app.config.get('FRIEND_GRAPH_TTL', 300):
+        return state[0]
+
+    with _graph_lock:
+        if 'friend_graph_changes' in app.extensions:
+            return state[0]
+        app.extensions['friend_graph_changes'] = []
+
+    if isinstance(db.engine.pool, StaticPool):
+        _rebuild(app)
+        return app.extensions['friend_graph'][0]
+
+    threading.Thread(target=_rebuild, args=(app,), name='friend-graph', daemon=True).start()
+    return state[0]
+
+
+def _record_change(added, user_id, friend_id):
+    app = current_app._get_current_object()
+    with _graph_lock:
+        state = app.extensions.get('friend_graph')
+        if state is not None:
+            if added:
+                state[0].add_edge(user_id, friend_id)
+            else:
+                state[0].remove_edge(user_id, friend_id)
+        changes = app.extensions.get('friend_graph_changes')
+        if changes is not None:
+            changes.append((added, user_id, friend_id))
+
+
+def friend_graph_added(user_id, friend_id):
+    """Учёт новой дружбы в уже построенном индексе"""
+    _record_change(True, user_id, friend_id)
+
+
+def friend_graph_removed(user_id, friend_id):
+    """Учёт удалённой дружбы в уже построенном индексе"""
+    _record_change(False, user_id, friend_id)
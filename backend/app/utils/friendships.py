@@ -0,0 +1,37 @@
+from sqlalchemy import and_, or_
+
+from app.models import db, Friendship
+
+
+def get_friendship_statuses(viewer_id, user_ids):
+    """Статусы дружбы пользователя с набором пользователей одним запросом
+
+    Возвращает словарь user_id -> 'none', 'accepted', 'rejected',
+    'pending incoming' или 'pending outgoing'.
+    """
+    user_ids = set(user_ids)
+    statuses = dict.fromkeys(user_ids, 'none')
+    if not viewer_id or not user_ids:
+        return statuses
+
+    relations = db.session.query(
+        Friendship.user_id,
+        Friendship.friend_id,
+        Friendship.status
+    ).filter(or_(
+        and_(Friendship.user_id == viewer_id, Friendship.friend_id.in_(user_ids)),
+        and_(Friendship.friend_id == viewer_id, Friendship.user_id.in_(user_ids))
+    )).all()
+
+    for user_id, friend_id, status in relations:
+        outgoing = user_id == viewer_id
+        other_id = friend_id if outgoing else user_id
+        if status == 'pending':
+            status = 'pending outgoing' if outgoing else 'pending incoming'
+        statuses[other_id] = status
+    return statuses
+
+
+def get_friendship_status(viewer_id, user_id):
+    """Статус дружбы с одним пользователем"""
+    return get_friendship_statuses(viewer_id, [user_id])[user_id]
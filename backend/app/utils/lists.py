@@ -0,0 +1,132 @@
+from datetime import datetime
+from sqlalchemy import tuple_
+
+from app.models import db, Media, UserMediaList
+from app.utils.activity import record_list_activity
+from app.utils.popularity import apply_popularity_deltas
+from app.utils.sql import upsert
+from app.utils.statuses import get_list_statuses, LIST_TYPES
+from app.utils.user_stats import apply_stats_deltas
+
+
+OPERATIONS = ('toggle', 'add', 'remove')
+EXCLUSIVE_LIST_TYPES = {
+    'planned': 'completed',
+    'completed': 'planned'
+}
+
+
+class ListOperationError(Exception):
+    """Некорректная операция со списком"""
+
+
+class MediaNotFound(Exception):
+    """Произведения не найдены"""
+
+    def __init__(self, media_ids):
+        super().__init__('Media not found')
+        self.media_ids = sorted(media_ids)
+
+
+def parse_operation(data):
+    """Проверка одной операции со списком"""
+    if not isinstance(data, dict) or 'media_id' not in data or 'list_type' not in data:
+        raise ListOperationError('Missing required fields')
+
+    media_id = data['media_id']
+    list_type = data['list_type']
+    operation = data.get('operation', 'toggle')
+
+    if not isinstance(media_id, int) or isinstance(media_id, bool):
+        raise ListOperationError('Invalid media_id')
+    if list_type not in LIST_TYPES:
+        raise ListOperationError('Invalid list_type')
+    if operation not in OPERATIONS:
+        raise ListOperationError('Invalid operation')
+    return media_id, list_type, operation
+
+
+def apply_list_operations(user_id, operations):
+    """Применение операций со списками пользователя в одной транзакции
+
+    Операции выполняются по порядку над состоянием в памяти, затем
+    разница записывается одним DELETE и одним INSERT ... ON CONFLICT.
+    Здесь же обновляются статистика пользователя, счётчики популярности
+    и лента активности.
+    Возвращает итоговые статусы затронутых произведений
+    (media_id -> множество типов списков). Транзакцию фиксирует вызывающий.
+    """
+    media_ids = {media_id for media_id, _, _ in operations}
+    media = {
+        row.id: row
+        for row in db.session.query(Media.id, Media.type, Media.duration).filter(
+            Media.id.in_(media_ids)
+        )
+    }
+    missing = media_ids - media.keys()
+    if missing:
+        raise MediaNotFound(missing)
+
+    statuses = get_list_statuses(user_id, media_ids)
+    initial = {
+        (media_id, list_type)
+        for media_id, list_types in statuses.items()
+        for list_type in list_types
+    }
+
+    state = set(initial)
+    for media_id, list_type, operation in operations:
+        entry = (media_id, list_type)
+        if list_type in EXCLUSIVE_LIST_TYPES:
+            state.discard((media_id, EXCLUSIVE_LIST_TYPES[list_type]))
+
+        should_add = entry not in state if operation == 'toggle' else operation == 'add'
+        if should_add:
+            state.add(entry)
+        else:
+            state.discard(entry)
+
+    table = UserMediaList.__table__
+    removed = []
+    to_delete = initial - state
+    if to_delete:
+        removed = db.session.execute(
+            table.delete().where(
+                table.c.user_id == user_id,
+                tuple_(table.c.media_id, table.c.list_type).in_(to_delete)
+            ).returning(table.c.media_id, table.c.list_type)
+        ).all()
+
+    added = []
+    now = datetime.utcnow()
+    to_insert = state - initial
+    if to_insert:
+        added = db.session.execute(
+            upsert(table).values([{
+                'user_id': user_id,
+                'media_id': media_id,
+                'list_type': list_type,
+                'added_at': now
+            } for media_id, list_type in sorted(to_insert)]).on_conflict_do_nothing().returning(
+                table.c.media_id,
+                table.c.list_type
+            )
+        ).all()
+
+    deltas = {}
+    popularity = {}
+    for rows, sign in ((added, 1), (removed, -1)):
+        for media_id, list_type in rows:
+            key = (media[media_id].type, list_type)
+            count, duration = deltas.get(key, (0, 0))
+            deltas[key] = (count + sign, duration + sign * (media[media_id].duration or 0))
+            counters = popularity.setdefault(media_id, {})
+            counters[list_type] = counters.get(list_type, 0) + sign
+    apply_stats_deltas(user_id, deltas)
+    apply_popularity_deltas(popularity, {media_id: row.type for media_id, row in media.items()})
+    record_list_activity(user_id, added, removed, now)
+
+    result = {media_id: set() for media_id in media_ids}
+    for media_id, list_type in state:
+        result[media_id].add(list_type)
+    return result
@@ -0,0 +1,104 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from lxml import html
+
+
+BOOK_ID_RE = re.compile(r'/book/(\d+)')
+PAGE_PATTERNS = ('*.html', '*.htm', '*.txt')
+
+
+def _by_class(tag, css_class):
+    return f'.//{tag}[contains(concat(" ", normalize-space(@class), " "), " {css_class} ")]'
+
+
+ITEMS_XPATH = _by_class('div', 'brow-inner')
+TITLE_XPATH = _by_class('a', 'brow-book-name')
+AUTHOR_XPATH = _by_class('a', 'brow-book-author')
+RATING_XPATH = _by_class('span', 'rating-value')
+YEAR_XPATH = _by_class('table', 'compact') + '//tr[td[1][contains(., "Год издания")]]/td[2]'
+DESCRIPTION_XPATH = _by_class('div', 'brow-marg') + '/p[1]'
+COVER_XPATH = _by_class('div', 'cover-wrapper') + '//img'
+
+
+def _text(item, xpath):
+    nodes = item.xpath(xpath)
+    return nodes[0].text_content().strip() if nodes else None
+
+
+def parse_livelib_item(item):
+    """Разбор одной карточки книги"""
+    link = item.xpath(TITLE_XPATH)[0]
+    rating = _text(item, RATING_XPATH)
+    cover = item.xpath(COVER_XPATH)
+    book_id = BOOK_ID_RE.search(link.get('href', ''))
+
+    return {
+        'external_id': book_id.group(1) if book_id else None,
+        'title': link.text_content().strip(),
+        'author': _text(item, AUTHOR_XPATH),
+        'rating': round(float(rating) * 2, 1) if rating else None,
+        'release_year': _text(item, YEAR_XPATH),
+        'description': _text(item, DESCRIPTION_XPATH),
+        'cover': (cover[0].get('data-pagespeed-lazy-src') or cover[0].get('src')) if cover else None
+    }
+
+
+def parse_livelib_page(path):
+    """Разбор сохранённой страницы LiveLib
+
+    Возвращает книги и ошибки разбора отдельных карточек; ошибка
+    в одной карточке не отменяет остальные.
+    """
+    books = []
+    errors = []
+    try:
+        tree = html.fromstring(Path(path).read_bytes())
+    except Exception as e:
+        return books, [f'{path}: {e}']
+
+    for index, item in enumerate(tree.xpath(ITEMS_XPATH)):
+        try:
+            books.append(parse_livelib_item(item))
+        except Exception as e:
+            errors.append(f'{path}, карточка {index}: {e}')
+    return books, errors
+
+
+def iter_livelib_books(directory, workers=None, chunksize=4):
+    """Книги из всех сохранённых страниц каталога, разбор в пуле процессов
+
+    Записи отдаются потоком по мере разбора страниц, ошибки пишутся в stderr.
+    """
+    paths = sorted({path for pattern in PAGE_PATTERNS for path in Path(directory).glob(pattern)})
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for books, errors in executor.map(parse_livelib_page, paths, chunksize=chunksize):
+            for error in errors:
+                print(f'Ошибка при парсинге: {error}', file=sys.stderr)
+            yield from books
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Парсинг сохранённых страниц LiveLib в JSONL')
+    parser.add_argument('directory')
+    parser.add_argument('--output', default='books.jsonl')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') as output:
+        for book in iter_livelib_books(args.directory, args.workers):
+            output.write(json.dumps(book, ensure_ascii=False) + '\n')
+            count += 1
+    print(f'Записано книг: {count} за {time.perf_counter() - started:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
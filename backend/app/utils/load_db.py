@@ -1,8 +1,16 @@
+import argparse
+import hashlib
 import json
 import os
+import time
 
+from datetime import datetime
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Enum, Float, Integer, String, Text
+from sqlalchemy import (
+    case, create_engine, func, select, tuple_, update,
+    BigInteger, Column, DateTime, Enum, Float, Integer, String, Text
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 
@@ -22,6 +30,36 @@ class Media(Base):
     cover_url = Column(String(512))
     external_rating = Column(Float)
     external_rating_count = Column(Integer)
+    source = Column(String(20))
+    external_id = Column(String(64))
+    content_hash = Column(String(40))
+    cover_hash = Column(String(64))
+
+
+class UserMediaList(Base):
+    __tablename__ = 'user_media_lists'
+
+    user_id = Column(Integer, primary_key=True)
+    media_id = Column(Integer, primary_key=True)
+    list_type = Column(Enum('planned', 'completed', 'favorite', name='list_type'), primary_key=True)
+
+
+class UserMediaStats(Base):
+    __tablename__ = 'user_media_stats'
+
+    user_id = Column(Integer, primary_key=True)
+    media_type = Column(String(10), primary_key=True)
+    list_type = Column(String(10), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    duration = Column(BigInteger, nullable=False, default=0)
+
+
+class CatalogState(Base):
+    __tablename__ = 'catalog_state'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
 
 
 load_dotenv()
@@ -32,95 +70,479 @@ engine = create_engine(DATABASE_URI)
 Session = sessionmaker(bind=engine)
 session = Session()
 
+CHUNK_SIZE = 1000
 
-def fetch_books(data):
-    books = []
-    for item in data:
-        book = Media(
-            type='book',
-            title=item.get('title'),
-            author=item.get('author'),
-            release_year=int(item.get('release_year')),
-            external_rating=int(item.get('rating')),
-            duration=int(item.get('pages')),
-            description=item.get('description'),
-            cover_url=item.get('cover')
-        )
-        books.append(book)
-    return books
-
-
-def fetch_movies(data):
-    movies = []
-    for item in data:
-        movie = Media(
-            type='movie',
-            title=item.get('title'),
-            release_year=int(item.get('release_year')),
-            external_rating=int(item.get('external_rating')),
-            external_rating_count=int(item.get('external_rating_count')),
-            duration=int(item.get('duration')),
-            description=item.get('description'),
-            cover_url=item.get('cover_url')
-        )
-        movies.append(movie)
-    return movies
-
-
-def fetch_anime(data):
-    anime = []
-    for item in data:
-        anime_item = Media(
-            type='anime',
-            title=item.get('title'),
-            author=item.get('studio'),
-            release_year=int(item.get('year')),
-            external_rating=int(item.get('score')),
-            duration=int(item.get('duration')) * int(item.get('episodes')),
-            description=item.get('description'),
-            cover_url=item.get('cover_url')
-        )
-        anime.append(anime_item)
-    return anime
+SECTIONS = {
+    'books': 'book',
+    'movies': 'movie',
+    'anime': 'anime'
+}
 
+SOURCES = {
+    'book': 'livelib',
+    'movie': 'kinopoisk',
+    'anime': 'shikimori'
+}
 
-def import_from_json(json_file):
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
 
-    session.query(Media).delete()
-    print(f"Таблица очищена")
+CONTENT_COLUMNS = (
+    'title', 'type', 'author', 'release_year', 'description', 'duration',
+    'cover_url', 'external_rating', 'external_rating_count'
+)
 
-    books = fetch_books(data['books'])
+
+def _int(value):
     try:
-        session.bulk_save_objects(books)
-        session.commit()
-        print(f"Успешно добавлено {len(books)} книг")
-    except Exception as e:
-        session.rollback()
-        print(f"Ошибка при добавлении книг: {str(e)}")
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
-    movies = fetch_movies(data['movies'])
+
+def _float(value):
     try:
-        session.bulk_save_objects(movies)
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def book_values(item):
+    return {
+        'type': 'book',
+        'title': item.get('title'),
+        'author': item.get('author'),
+        'release_year': _int(item.get('release_year')),
+        'external_rating': _float(item.get('rating')),
+        'external_rating_count': _int(item.get('rating_count')),
+        'duration': _int(item.get('pages')),
+        'description': item.get('description'),
+        'cover_url': item.get('cover')
+    }
+
+
+def movie_values(item):
+    return {
+        'type': 'movie',
+        'title': item.get('title'),
+        'author': None,
+        'release_year': _int(item.get('release_year')),
+        'external_rating': _float(item.get('external_rating')),
+        'external_rating_count': _int(item.get('external_rating_count')),
+        'duration': _int(item.get('duration')),
+        'description': item.get('description'),
+        'cover_url': item.get('cover_url')
+    }
+
+
+def anime_values(item):
+    duration = _int(item.get('duration'))
+    episodes = _int(item.get('episodes'))
+    return {
+        'type': 'anime',
+        'title': item.get('title'),
+        'author': item.get('studio'),
+        'release_year': _int(item.get('year')),
+        'external_rating': _float(item.get('score')),
+        'external_rating_count': None,
+        'duration': duration * episodes if duration and episodes else None,
+        'description': item.get('description'),
+        'cover_url': item.get('cover_url')
+    }
+
+
+VALUE_BUILDERS = {
+    'book': book_values,
+    'movie': movie_values,
+    'anime': anime_values
+}
+
+
+def fallback_external_id(title, author, release_year):
+    """Ключ записи без внешнего id: хеш названия, автора и года"""
+    key = f"{title}|{author or ''}|{release_year or ''}"
+    return hashlib.sha1(key.lower().encode()).hexdigest()[:32]
+
+
+def media_row(media_type, item):
+    """Строка таблицы media с естественным ключом и хешем содержимого
+
+    Если у записи нет внешнего id, ключом служит хеш названия, автора и года.
+    """
+    values = VALUE_BUILDERS[media_type](item)
+    external_id = item.get('external_id')
+    if external_id in (None, ''):
+        external_id = fallback_external_id(values['title'], values['author'], values['release_year'])
+
+    content = json.dumps([values[column] for column in CONTENT_COLUMNS], ensure_ascii=False)
+    return {
+        **values,
+        'source': SOURCES[media_type],
+        'external_id': str(external_id),
+        'content_hash': hashlib.sha1(content.encode()).hexdigest()
+    }
+
+
+class JsonSectionReader:
+    """Потоковое чтение файла вида {"books": [...], "movies": [...], ...}
+
+    Элементы массивов разбираются по одному, файл целиком в память не загружается.
+    """
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ''
+            self._fill()
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f'Ожидался символ {char!r} в позиции {self.pos}')
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        while self._peek() != '}':
+            section = self._value()
+            self._expect(':')
+            self._expect('[')
+            while self._peek() != ']':
+                yield section, self._value()
+                if self._peek() == ',':
+                    self.pos += 1
+            self._expect(']')
+            if self._peek() == ',':
+                self.pos += 1
+
+
+def iter_records(path, media_type=None):
+    """Записи файла JSON или JSONL в виде (тип медиа, запись)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            if media_type not in VALUE_BUILDERS:
+                raise ValueError('Для JSONL нужно указать тип медиа')
+            for line in f:
+                if line.strip():
+                    yield media_type, json.loads(line)
+            return
+
+        for section, item in JsonSectionReader(f):
+            if section in SECTIONS:
+                yield SECTIONS[section], item
+
+
+def rekey_legacy_rows(rows):
+    """Перевод записей с ключом-хешем на настоящий внешний id
+
+    Записи старого загрузчика получают ключ fallback_external_id
+    (backfill_natural_keys). Когда та же запись приходит с внешним id
+    источника, ключ записи меняется на него, и upsert обновляет её
+    вместо вставки дубликата. Если хешу соответствует несколько входящих
+    записей или внешний id уже занят, запись не трогается.
+    Возвращает количество переведённых записей.
+    """
+    real_ids = {}
+    for row in rows:
+        key = (row['source'], fallback_external_id(row['title'], row['author'], row['release_year']))
+        if key[1] != row['external_id']:
+            real_ids[key] = None if key in real_ids else row['external_id']
+    real_ids = {key: external_id for key, external_id in real_ids.items() if external_id is not None}
+    if not real_ids:
+        return 0
+
+    legacy = session.query(Media.id, Media.source, Media.external_id).filter(
+        tuple_(Media.source, Media.external_id).in_(list(real_ids))
+    ).all()
+    if not legacy:
+        return 0
+
+    targets = {(source, real_ids[(source, external_id)]): media_id for media_id, source, external_id in legacy}
+    taken = set(session.query(Media.source, Media.external_id).filter(
+        tuple_(Media.source, Media.external_id).in_(list(targets))
+    ))
+    updates = [
+        {'id': media_id, 'external_id': external_id}
+        for (source, external_id), media_id in targets.items()
+        if (source, external_id) not in taken
+    ]
+    if updates:
+        session.execute(update(Media), updates)
+    return len(updates)
+
+
+def upsert_chunk(rows):
+    """Вставка и обновление пачки записей
+
+    Возвращает количество добавленных, обновлённых и неизменных строк
+    и id записей, у которых изменились тип или длительность: по ним
+    пересчитывается статистика пользователей.
+    """
+    rows = list({(row['source'], row['external_id']): row for row in rows}.values())
+    rekey_legacy_rows(rows)
+    keys = [(row['source'], row['external_id']) for row in rows]
+
+    existing = {
+        (row.source, row.external_id): row
+        for row in session.query(
+            Media.id,
+            Media.source,
+            Media.external_id,
+            Media.type,
+            Media.duration,
+            Media.content_hash
+        ).filter(tuple_(Media.source, Media.external_id).in_(keys))
+    }
+
+    changed = []
+    stats_changed = set()
+    for row in rows:
+        current = existing.get((row['source'], row['external_id']))
+        if current is not None and current.content_hash == row['content_hash']:
+            continue
+        changed.append(row)
+        if current is not None and (current.type, current.duration) != (row['type'], row['duration']):
+            stats_changed.add(current.id)
+    inserted = sum(1 for row in changed if (row['source'], row['external_id']) not in existing)
+
+    if changed:
+        table = Media.__table__
+        statement = INSERTS[session.get_bind().dialect.name](table).values(changed)
+        statement = statement.on_conflict_do_update(
+            index_elements=['source', 'external_id'],
+            set_={
+                **{
+                    column: statement.excluded[column]
+                    for column in CONTENT_COLUMNS + ('content_hash',)
+                },
+                'cover_hash': case(
+                    (table.c.cover_url.is_distinct_from(statement.excluded.cover_url), None),
+                    else_=table.c.cover_hash
+                )
+            },
+            where=table.c.content_hash.is_distinct_from(statement.excluded.content_hash)
+        )
+        session.execute(statement)
+    session.commit()
+
+    return inserted, len(changed) - inserted, len(rows) - len(changed), stats_changed
+
+
+def backfill_natural_keys(chunk_size=CHUNK_SIZE):
+    """Заполнение (source, external_id) у записей, загруженных до upsert
+
+    Старый загрузчик не сохранял естественный ключ, а NULL не совпадает
+    в уникальном индексе, поэтому без этого шага первый импорт продублировал
+    бы весь каталог. Ключ считается так же, как в media_row для записей без
+    внешнего id; при импорте записи с внешним id источника ключ меняется
+    на него (rekey_legacy_rows). Если ключ уже занят (дубликат в каталоге), запись
+    остаётся без ключа и попадает в счётчик пропущенных.
+    Возвращает количество заполненных и пропущенных записей.
+    """
+    filled = skipped = 0
+    last_id = 0
+    while True:
+        rows = session.query(
+            Media.id,
+            Media.type,
+            Media.title,
+            Media.author,
+            Media.release_year
+        ).filter(
+            (Media.source.is_(None)) | (Media.external_id.is_(None)),
+            Media.id > last_id
+        ).order_by(Media.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        keys = {}
+        for row in rows:
+            key = (SOURCES[row.type], fallback_external_id(row.title, row.author, row.release_year))
+            if key in keys:
+                skipped += 1
+            else:
+                keys[key] = row.id
+
+        taken = set(session.query(Media.source, Media.external_id).filter(
+            tuple_(Media.source, Media.external_id).in_(list(keys))
+        ))
+        updates = [
+            {'id': media_id, 'source': source, 'external_id': external_id}
+            for (source, external_id), media_id in keys.items()
+            if (source, external_id) not in taken
+        ]
+        skipped += len(keys) - len(updates)
+        if updates:
+            session.execute(update(Media), updates)
         session.commit()
-        print(f"Успешно добавлено {len(movies)} фильмов")
-    except Exception as e:
-        session.rollback()
-        print(f"Ошибка при добавлении фильмов: {str(e)}")
+        filled += len(updates)
 
-    anime = fetch_anime(data['anime'])
-    try:
-        session.bulk_save_objects(anime)
+    if filled or skipped:
+        print(f"Заполнены ключи у {filled} записей, пропущено дубликатов: {skipped}")
+    return filled, skipped
+
+
+def refresh_user_stats(media_ids, chunk_size=CHUNK_SIZE):
+    """Пересчёт статистики пользователей, у которых в списках есть эти записи
+
+    Импорт пишет в media мимо apply_list_operations, поэтому счётчики
+    user_media_stats пересчитываются здесь так же, как в rebuild_user_stats.
+    Возвращает количество пользователей с пересчитанной статистикой.
+    """
+    media_ids = sorted(media_ids)
+    user_ids = set()
+    for start in range(0, len(media_ids), chunk_size):
+        user_ids.update(user_id for (user_id,) in session.query(UserMediaList.user_id).filter(
+            UserMediaList.media_id.in_(media_ids[start:start + chunk_size])
+        ).distinct())
+
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        batch = user_ids[start:start + chunk_size]
+        aggregate = select(
+            UserMediaList.user_id,
+            Media.type,
+            UserMediaList.list_type,
+            func.count(),
+            func.coalesce(func.sum(Media.duration), 0)
+        ).join(
+            Media,
+            UserMediaList.media_id == Media.id
+        ).where(
+            UserMediaList.user_id.in_(batch)
+        ).group_by(
+            UserMediaList.user_id,
+            Media.type,
+            UserMediaList.list_type
+        )
+        session.execute(UserMediaStats.__table__.delete().where(UserMediaStats.user_id.in_(batch)))
+        session.execute(UserMediaStats.__table__.insert().from_select(
+            ['user_id', 'media_type', 'list_type', 'count', 'duration'],
+            aggregate
+        ))
         session.commit()
-        print(f"Успешно добавлено {len(movies)} аниме")
-    except Exception as e:
-        session.rollback()
-        print(f"Ошибка при добавлении аниме: {str(e)}")
+    return len(user_ids)
+
 
+def bump_catalog_version():
+    """Увеличение версии каталога, сбрасывает кэши приложения"""
+    updated = session.query(CatalogState).filter_by(id=1).update({
+        CatalogState.version: CatalogState.version + 1,
+        CatalogState.updated_at: datetime.utcnow()
+    })
+    if not updated:
+        session.add(CatalogState(id=1, version=1, updated_at=datetime.utcnow()))
+    session.commit()
+
+
+def import_from_json(json_file, media_type=None, chunk_size=CHUNK_SIZE):
+    """Идемпотентная потоковая загрузка каталога
+
+    Записи сопоставляются по (source, external_id) и записываются пачками
+    через INSERT ... ON CONFLICT; строки с неизменным хешем пропускаются,
+    существующие записи не удаляются. Перед загрузкой ключи проставляются
+    записям, загруженным старым загрузчиком (backfill_natural_keys), после
+    загрузки пересчитывается статистика пользователей, у которых в списках
+    есть записи с изменённым типом или длительностью (refresh_user_stats).
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+    started = time.perf_counter()
+    chunk = []
+    stats_changed = set()
+
+    backfill_natural_keys(chunk_size)
+
+    def flush():
+        try:
+            inserted, updated, unchanged, media_ids = upsert_chunk(chunk)
+            stats_changed.update(media_ids)
+            counts['inserted'] += inserted
+            counts['updated'] += updated
+            counts['unchanged'] += unchanged
+        except Exception as e:
+            session.rollback()
+            counts['failed'] += len(chunk)
+            print(f"Ошибка при загрузке пачки: {str(e)}")
+        chunk.clear()
+
+    try:
+        for record_type, item in iter_records(json_file, media_type):
+            try:
+                chunk.append(media_row(record_type, item))
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"Пропущена запись {item.get('title')!r}: {str(e)}")
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
     finally:
+        if stats_changed:
+            users = refresh_user_stats(stats_changed, chunk_size)
+            print(f"Пересчитана статистика {users} пользователей")
+        if counts['inserted'] or counts['updated']:
+            bump_catalog_version()
         session.close()
 
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(
+        f"Добавлено: {counts['inserted']}, обновлено: {counts['updated']}, "
+        f"без изменений: {counts['unchanged']}, ошибок: {counts['failed']}"
+    )
+    print(f"Обработано {total} записей за {elapsed:.1f} с ({total / max(elapsed, 1e-9):.0f} записей/с)")
+    return counts
+
 
 if __name__ == "__main__":
-    import_from_json('media_data.json')
+    parser = argparse.ArgumentParser(
+        description='Загрузка каталога в базу. Перед загрузкой записям без (source, external_id), '
+                    'оставшимся от старого загрузчика, проставляется ключ, иначе они бы продублировались.'
+    )
+    parser.add_argument('path', nargs='?', default='media_data.json', help='файл JSON или JSONL')
+    parser.add_argument('--type', choices=sorted(VALUE_BUILDERS), help='тип медиа для JSONL')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--backfill-only', action='store_true', help='только проставить ключи, без загрузки')
+    args = parser.parse_args()
+
+    if args.backfill_only:
+        backfill_natural_keys(args.chunk_size)
+    else:
+        import_from_json(args.path, args.type, args.chunk_size)
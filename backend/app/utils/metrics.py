@@ -0,0 +1,254 @@
+import threading
+import time
+
+from bisect import bisect_left
+
+from flask import current_app, request, request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from app.utils.cache import LRUCache
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+
+        for labels, counts, total in sorted(snapshot):
+            prefix = _labels(self.label_names, labels)
+            prefix = prefix + ',' if prefix else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f'{{{prefix[:-1]}}}' if prefix else ''
+            lines.append(f'{self.name}_sum{suffix} {_number(total)}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            snapshot = sorted(self.series.items())
+        for labels, value in snapshot:
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {_number(value)}')
+        return lines
+
+
+def _gauge(name, help_text, label_names, series, kind='gauge'):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in series:
+        label_text = _labels(label_names, labels)
+        lines.append(f'{name}{{{label_text}}} {_number(value)}' if label_text else f'{name} {_number(value)}')
+    return lines
+
+
+class Metrics:
+    """Метрики процесса: запросы, SQL, пул соединений и кэши
+
+    Каждый процесс ведёт свои счётчики; при нескольких воркерах
+    Prometheus опрашивает их по отдельности.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.request_duration = Histogram(
+            'poketroid_http_request_duration_seconds',
+            'Время обработки запроса',
+            ('endpoint', 'method'),
+            LATENCY_BUCKETS
+        )
+        self.requests = Counter(
+            'poketroid_http_requests_total',
+            'Число запросов по коду ответа',
+            ('endpoint', 'method', 'status')
+        )
+        self.statements = Histogram(
+            'poketroid_db_statements_per_request',
+            'Число SQL-запросов на HTTP-запрос',
+            ('endpoint',),
+            STATEMENT_BUCKETS
+        )
+        self.statement_time = Histogram(
+            'poketroid_db_time_per_request_seconds',
+            'Суммарное время SQL-запросов на HTTP-запрос',
+            ('endpoint',),
+            LATENCY_BUCKETS
+        )
+        self.checkout_wait = Histogram(
+            'poketroid_db_pool_checkout_wait_seconds',
+            'Время получения соединения из пула, включая ожидание свободного',
+            (),
+            WAIT_BUCKETS
+        )
+        self.connection_hold = Histogram(
+            'poketroid_db_pool_connection_hold_seconds',
+            'Время от выдачи соединения из пула до возврата',
+            (),
+            WAIT_BUCKETS
+        )
+        self.local = threading.local()
+        self.pool = None
+
+    def request_started(self, sender, **extra):
+        self.local.started = time.perf_counter()
+
+    def request_finished(self, sender, response, **extra):
+        started = getattr(self.local, 'started', None)
+        if started is None:
+            return
+        self.local.started = None
+
+        endpoint = request.endpoint or 'unmatched'
+        self.request_duration.observe((endpoint, request.method), time.perf_counter() - started)
+        self.requests.inc((endpoint, request.method, str(response.status_code)))
+        self.statements.observe((endpoint,), self.budget.statements)
+        self.statement_time.observe((endpoint,), self.budget.statement_time)
+
+    def pool_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['metrics_checkout'] = time.perf_counter()
+
+    def pool_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop('metrics_checkout', None)
+        if started is not None:
+            self.connection_hold.observe((), time.perf_counter() - started)
+
+    def time_pool_connect(self, pool):
+        """Замер Pool.connect(): ожидание свободного соединения и его выдача
+
+        У пула нет события до начала ожидания, поэтому оборачивается
+        публичный метод connect экземпляра пула. Engine.dispose() создаёт
+        новый пул, и обёртка ставится на него заново (событие engine_disposed).
+        """
+        connect = pool.connect
+        histogram = self.checkout_wait
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                histogram.observe((), time.perf_counter() - started)
+
+        pool.connect = timed_connect
+        if isinstance(pool, QueuePool):
+            self.pool = pool
+
+    def instrument_engine(self, engine):
+        """Замер ожидания соединений и их удержания (события checkout/checkin)
+
+        Слушатели событий пула переносятся на новый пул при dispose сами.
+        """
+        event.listen(engine.pool, 'checkout', self.pool_checkout)
+        event.listen(engine.pool, 'checkin', self.pool_checkin)
+        self.time_pool_connect(engine.pool)
+        event.listen(engine, 'engine_disposed', lambda engine: self.time_pool_connect(engine.pool))
+
+    def render(self, extensions):
+        lines = []
+        for metric in (
+            self.request_duration,
+            self.requests,
+            self.statements,
+            self.statement_time,
+            self.checkout_wait,
+            self.connection_hold
+        ):
+            lines.extend(metric.render())
+
+        if self.pool is not None:
+            lines.extend(_gauge('poketroid_db_pool_size', 'Размер пула соединений', (), [((), self.pool.size())]))
+            lines.extend(_gauge(
+                'poketroid_db_pool_checked_out',
+                'Выданные соединения пула',
+                (),
+                [((), self.pool.checkedout())]
+            ))
+
+        caches = sorted(
+            (name, cache.stats())
+            for name, cache in extensions.items()
+            if isinstance(cache, LRUCache)
+        )
+        lines.extend(_gauge(
+            'poketroid_cache_hits_total', 'Попадания в кэш', ('cache',),
+            [((name,), stats['hits']) for name, stats in caches], 'counter'
+        ))
+        lines.extend(_gauge(
+            'poketroid_cache_misses_total', 'Промахи кэша', ('cache',),
+            [((name,), stats['misses']) for name, stats in caches], 'counter'
+        ))
+        lines.extend(_gauge(
+            'poketroid_cache_entries', 'Записей в кэше', ('cache',),
+            [((name,), stats['size']) for name, stats in caches]
+        ))
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app, engine):
+    """Подключение метрик к сигналам Flask и событиям пула
+
+    SQL-запросы считает бюджет запросов (init_query_budget), он должен
+    быть подключён раньше.
+    """
+    metrics = Metrics(app.extensions['query_budget'])
+    app.extensions['metrics'] = metrics
+
+    request_started.connect(metrics.request_started, app)
+    request_finished.connect(metrics.request_finished, app)
+    metrics.instrument_engine(engine)
+    return metrics
+
+
+def render_metrics():
+    """Метрики текущего приложения в текстовом формате Prometheus"""
+    return current_app.extensions['metrics'].render(current_app.extensions)
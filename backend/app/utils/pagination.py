@@ -0,0 +1,147 @@
+import base64
+import json
+
+from sqlalchemy import and_, func, literal, or_, tuple_
+
+from app.models import db, Media, MediaPopularity
+
+
+# Счёт сообщества: у произведений, которых нет ни в одном списке,
+# строки media_popularity может не быть, они идут со счётом 0
+community_score = func.coalesce(MediaPopularity.score, 0)
+
+# Колонка сортировки и колонка id той же таблицы: условие курсора
+# должно ссылаться на колонки индекса, иначе оно не станет Index Cond.
+# Страницы community по курсору строит community_page.
+KEYSET_COLUMNS = {
+    'popularity': (Media.external_rating_count, Media.id),
+    'newest': (Media.release_year, Media.id),
+    'community': (community_score, Media.id)
+}
+
+
+def encode_cursor(sort_by, value, media_id):
+    """Кодирование курсора страницы"""
+    raw = json.dumps([sort_by, value, media_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_by):
+    """Декодирование курсора страницы"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, media_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+    if cursor_sort != sort_by or not isinstance(media_id, int) \
+            or not (value is None or isinstance(value, int)):
+        raise ValueError('Invalid cursor')
+    return value, media_id
+
+
+def _nullable(column):
+    return getattr(column.expression, 'nullable', False)
+
+
+def join_community(query):
+    """Счёт сообщества для всех произведений запроса, включая не попавшие в списки"""
+    return query.outerjoin(MediaPopularity, MediaPopularity.media_id == Media.id)
+
+
+def order_keyset(query, sort_by):
+    """Порядок сортировки курсора; для community запрос уже соединён через join_community"""
+    column, id_column = KEYSET_COLUMNS[sort_by]
+    order = column.desc().nulls_last() if _nullable(column) else column.desc()
+    return query.order_by(order, id_column.desc())
+
+
+def _after(column, id_column, value, media_id):
+    """Условие «после курсора», которое Postgres выполняет как Index Cond
+
+    Строки с NULL идут после всех непустых значений, но OR с веткой
+    IS NULL не даёт использовать индекс, поэтому они дочитываются
+    отдельным запросом в keyset_page.
+    """
+    if value is None:
+        return and_(column.is_(None), id_column < media_id)
+    return tuple_(column, id_column) < tuple_(value, media_id)
+
+
+def community_page(query, value, media_id, per_page, media_type=None):
+    """Страница сортировки community после курсора
+
+    Порядок тот же, что у order_keyset: счёт (0 без строки популярности)
+    по убыванию, затем id. Произведения с положительным счётом читаются
+    по индексу популярности, остальные — дочитываются отдельным запросом
+    по первичному ключу media; одно условие на coalesce(score, 0)
+    читало бы весь каталог.
+    """
+    rows = []
+    if value is None or value > 0:
+        head = query.join(MediaPopularity, MediaPopularity.media_id == Media.id) \
+            .filter(MediaPopularity.score > 0)
+        if media_type:
+            head = head.filter(MediaPopularity.media_type == media_type)
+        if value is not None:
+            head = head.filter(tuple_(MediaPopularity.score, MediaPopularity.media_id) < tuple_(value, media_id))
+        rows = head.add_columns(MediaPopularity.score) \
+            .order_by(MediaPopularity.score.desc(), MediaPopularity.media_id.desc()) \
+            .limit(per_page + 1).all()
+
+    if len(rows) <= per_page:
+        tail = join_community(query).filter(or_(MediaPopularity.score.is_(None), MediaPopularity.score <= 0))
+        if value is not None and value <= 0:
+            tail = tail.filter(Media.id < media_id)
+        rows += tail.add_columns(literal(0)).order_by(Media.id.desc()).limit(per_page + 1 - len(rows)).all()
+    return rows
+
+
+def keyset_page(query, sort_by, cursor, per_page, media_type=None):
+    """Страница каталога после курсора
+
+    media_type нужен сортировке community: по нему выбирается индекс
+    популярности. Возвращает записи страницы и курсор следующей
+    страницы (или None).
+    """
+    column, id_column = KEYSET_COLUMNS[sort_by]
+    value = media_id = None
+    if cursor:
+        value, media_id = decode_cursor(cursor, sort_by)
+
+    if sort_by == 'community':
+        rows = community_page(query, value, media_id, per_page, media_type)
+        items = [row[0] for row in rows[:per_page]]
+        if len(rows) <= per_page:
+            return items, None
+        return items, encode_cursor(sort_by, rows[per_page - 1][1], items[-1].id)
+
+    page_query = query
+    if cursor:
+        page_query = query.filter(_after(column, id_column, value, media_id))
+
+    rows = order_keyset(page_query.add_columns(column), sort_by).limit(per_page + 1).all()
+    if cursor and value is not None and len(rows) <= per_page and _nullable(column):
+        rows += query.filter(column.is_(None)).add_columns(column) \
+            .order_by(id_column.desc()).limit(per_page + 1 - len(rows)).all()
+
+    items = [row[0] for row in rows[:per_page]]
+    if len(rows) <= per_page:
+        return items, None
+
+    value = rows[per_page - 1][1]
+    return items, encode_cursor(sort_by, value, items[-1].id)
+
+
+def count_rows(query, estimate=False):
+    """Количество строк запроса: точное или оценка планировщика Postgres"""
+    query = query.order_by(None)
+    if not estimate or db.engine.dialect.name != 'postgresql':
+        return query.count()
+
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + compiled.string,
+        compiled.params
+    ).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,72 @@
+import bcrypt
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хеширования паролей переполнена"""
+
+
+class PasswordHasher:
+    """Ограниченный пул потоков для bcrypt
+
+    bcrypt отпускает GIL, поэтому хеширование идёт в отдельных потоках.
+    Запрос, получивший место, ждёт результата в своём обработчике:
+    очередь плюс само хеширование. Поэтому мест (workers + queue_size)
+    должно быть меньше, чем потоков веб-сервера, а при нулевом timeout
+    запрос без свободного места сразу получает PasswordHasherBusy.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, func, *args):
+        if self.timeout > 0:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = PasswordHasher(
+            workers=current_app.config.get('BCRYPT_WORKERS', 2),
+            queue_size=current_app.config.get('BCRYPT_QUEUE_SIZE', 2),
+            timeout=current_app.config.get('BCRYPT_QUEUE_TIMEOUT', 0)
+        )
+        current_app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def hash_password(password):
+    """Хеширование пароля с настроенной стоимостью"""
+    salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_ROUNDS', 12))
+    return get_password_hasher().run(bcrypt.hashpw, password.encode(), salt).decode()
+
+
+def verify_password(password, password_hash):
+    """Проверка пароля"""
+    return get_password_hasher().run(bcrypt.checkpw, password.encode(), password_hash.encode())
+
+
+def needs_rehash(password_hash):
+    """Хеш создан с другой стоимостью, чем указана в настройках"""
+    try:
+        rounds = int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != current_app.config.get('BCRYPT_ROUNDS', 12)
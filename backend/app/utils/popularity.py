@@ -0,0 +1,143 @@
+import click
+
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, literal, select
+
+from app.models import db, Media, MediaPopularity, UserMediaList
+from app.utils.sql import upsert
+
+
+POPULARITY_WEIGHTS = {
+    'planned': 1,
+    'completed': 2,
+    'favorite': 3
+}
+
+
+def apply_popularity_deltas(deltas, media_types):
+    """Изменение счётчиков популярности в текущей транзакции
+
+    deltas: словарь media_id -> {тип списка: изменение}. Строки
+    обновляются одним INSERT ... ON CONFLICT с приращением, в порядке
+    media_id, чтобы параллельные запросы не блокировали друг друга.
+    """
+    rows = []
+    for media_id in sorted(deltas):
+        changes = {list_type: deltas[media_id].get(list_type, 0) for list_type in POPULARITY_WEIGHTS}
+        if not any(changes.values()):
+            continue
+        rows.append({
+            'media_id': media_id,
+            'media_type': media_types[media_id],
+            **changes,
+            'score': sum(POPULARITY_WEIGHTS[list_type] * change for list_type, change in changes.items())
+        })
+    if not rows:
+        return
+
+    table = MediaPopularity.__table__
+    statement = upsert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.media_id],
+        set_={
+            column: table.c[column] + statement.excluded[column]
+            for column in (*POPULARITY_WEIGHTS, 'score')
+        }
+    )
+    db.session.execute(statement)
+
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _reconcile_batch(first_id, last_id):
+    """Пересчёт счётчиков произведений first_id..last_id в одной транзакции
+
+    Недостающие строки заводятся с нулями, затем строки пачки блокируются
+    (SELECT ... FOR UPDATE, в порядке media_id, как в apply_popularity_deltas).
+    Изменение списка, начатое раньше, успевает закоммититься до подсчёта
+    и попадает в него; начатое позже ждёт блокировки и прибавляет свою
+    дельту к уже исправленному значению. Остальные строки таблицы
+    в это время изменяются без ожидания.
+    Возвращает количество заведённых и исправленных строк.
+    """
+    in_batch = Media.id.between(first_id, last_id)
+    table = MediaPopularity.__table__
+    columns = ['media_id', 'media_type', *POPULARITY_WEIGHTS, 'score']
+
+    missing = upsert(table).from_select(
+        columns,
+        select(Media.id, Media.type, *[literal(0)] * (len(columns) - 2)).where(in_batch)
+    ).on_conflict_do_nothing(index_elements=[table.c.media_id])
+    created = db.session.execute(missing).rowcount
+
+    db.session.execute(
+        select(MediaPopularity.media_id)
+        .where(MediaPopularity.media_id.between(first_id, last_id))
+        .order_by(MediaPopularity.media_id)
+        .with_for_update()
+    ).all()
+
+    counts = {
+        list_type: func.count(case((UserMediaList.list_type == list_type, 1)))
+        for list_type in POPULARITY_WEIGHTS
+    }
+    aggregate = select(
+        Media.id,
+        Media.type,
+        *counts.values(),
+        sum(weight * counts[list_type] for list_type, weight in POPULARITY_WEIGHTS.items())
+    ).select_from(
+        Media
+    ).outerjoin(
+        UserMediaList,
+        UserMediaList.media_id == Media.id
+    ).where(
+        in_batch
+    ).group_by(
+        Media.id,
+        Media.type
+    )
+
+    statement = upsert(table).from_select(columns, aggregate)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.media_id],
+        set_={column: statement.excluded[column] for column in columns[1:]},
+        where=table.c.score.is_distinct_from(statement.excluded.score)
+        | table.c.planned.is_distinct_from(statement.excluded.planned)
+        | table.c.completed.is_distinct_from(statement.excluded.completed)
+        | table.c.favorite.is_distinct_from(statement.excluded.favorite)
+        | table.c.media_type.is_distinct_from(statement.excluded.media_type)
+    )
+    fixed = db.session.execute(statement).rowcount
+    db.session.commit()
+    return created + fixed
+
+
+def reconcile_popularity(batch_size=RECONCILE_BATCH_SIZE):
+    """Пересчёт счётчиков популярности по user_media_lists
+
+    Заводит строки для всех произведений каталога и исправляет расхождения.
+    Каталог обходится пачками по batch_size произведений, и каждая пачка
+    пересчитывается в своей транзакции под блокировкой только своих строк
+    (_reconcile_batch), так что изменения списков не ждут весь пересчёт.
+    """
+    rows = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(Media.id).where(Media.id > last_id).order_by(Media.id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+        rows += _reconcile_batch(batch[0], batch[-1])
+        last_id = batch[-1]
+    return rows
+
+
+@click.command('reconcile-popularity')
+@with_appcontext
+def reconcile_popularity_command():
+    """Сверить счётчики популярности со списками пользователей"""
+    rows = reconcile_popularity()
+    click.echo(f'Исправлено строк популярности: {rows}')
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from logging.handlers import RotatingFileHandler
+
+from flask import current_app, has_request_context, request, request_started
+from sqlalchemy import event
+
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN '
+}
+EXPLAINED_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+MAX_PARAMETERS_LENGTH = 2000
+
+slow_query_logger = logging.getLogger('poketroid.slow_queries')
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов, чем разрешено"""
+
+
+def query_budget(limit):
+    """Допустимое число SQL-запросов для представления
+
+    Ставится сразу под декоратором маршрута.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class QueryBudget:
+    """Подсчёт SQL-запросов запроса и запись медленных запросов с планом
+
+    Единственный счётчик запросов на HTTP-запрос: метрики берут число
+    и суммарное время запросов отсюда (statements, statement_time).
+    """
+
+    def __init__(self, slow_seconds, logger):
+        self.slow_seconds = slow_seconds
+        self.logger = logger
+        self.local = threading.local()
+
+    def request_started(self, sender, **extra):
+        self.local.statements = 0
+        self.local.statement_time = 0.0
+
+    @property
+    def statements(self):
+        return getattr(self.local, 'statements', 0)
+
+    @property
+    def statement_time(self):
+        return getattr(self.local, 'statement_time', 0.0)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('budget_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['budget_started'].pop()
+        self.local.statements = self.statements + 1
+        self.local.statement_time = self.statement_time + elapsed
+
+        if self.slow_seconds and elapsed >= self.slow_seconds:
+            self.log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    def handle_error(self, context):
+        if context.connection is not None:
+            started = context.connection.info.get('budget_started')
+            if started:
+                started.pop()
+
+    def explain(self, conn, statement, parameters):
+        """План запроса через отдельный курсор DBAPI, минуя события движка
+
+        В Postgres ошибка внутри транзакции обрывает её до ROLLBACK, поэтому
+        EXPLAIN выполняется под SAVEPOINT и при ошибке откатывается только
+        он. Отдельное соединение не берётся: при занятом пуле запрос ждал бы
+        сам себя.
+        """
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            return None
+
+        savepoint = conn.dialect.name == 'postgresql'
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute('SAVEPOINT query_budget_explain')
+            try:
+                cursor.execute(prefix + statement, parameters)
+                plan = '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+            except Exception as e:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT query_budget_explain')
+                return f'EXPLAIN failed: {e}'
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT query_budget_explain')
+            return plan
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.close()
+
+    def log_slow_query(self, conn, statement, parameters, executemany, elapsed):
+        plan = None if executemany else self.explain(conn, statement, parameters)
+        self.logger.warning(json.dumps({
+            'duration_ms': round(elapsed * 1000, 1),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'statement': ' '.join(statement.split()),
+            'parameters': repr(parameters)[:MAX_PARAMETERS_LENGTH],
+            'plan': plan
+        }, ensure_ascii=False))
+
+    def check(self, response):
+        """Сравнение числа запросов представления с его бюджетом"""
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        statements = self.statements
+        if limit is None or statements <= limit:
+            return response
+
+        message = f'{request.endpoint} executed {statements} SQL statements, budget is {limit}'
+        if current_app.config.get('QUERY_BUDGET_MODE') == 'raise' or current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+        return response
+
+
+def init_query_budget(app, engine):
+    """Подключение бюджетов запросов и журнала медленных запросов
+
+    Медленные запросы пишутся в файл SLOW_QUERY_LOG, а если он не задан —
+    в журнал приложения.
+    """
+    log_path = app.config.get('SLOW_QUERY_LOG')
+    if log_path and not slow_query_logger.handlers:
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        handler = RotatingFileHandler(
+            log_path,
+            maxBytes=app.config.get('SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024),
+            backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 5),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+        slow_query_logger.propagate = False
+
+    budget = QueryBudget(
+        app.config.get('SLOW_QUERY_SECONDS', 0.5),
+        slow_query_logger if log_path else app.logger
+    )
+    app.extensions['query_budget'] = budget
+
+    request_started.connect(budget.request_started, app)
+    app.after_request(budget.check)
+    event.listen(engine, 'before_cursor_execute', budget.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', budget.after_cursor_execute)
+    event.listen(engine, 'handle_error', budget.handle_error)
+    return budget
@@ -0,0 +1,424 @@
+import math
+import re
+import threading
+
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from heapq import nlargest
+
+from flask import current_app
+from sqlalchemy import case, false, func, literal, or_, text
+from sqlalchemy.pool import StaticPool
+
+from app.models import db, Media, media_search_vector, SEARCH_CONFIG
+from app.utils.catalog import get_catalog_version
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-яё]')
+
+FIELD_WEIGHTS = (
+    ('title', 3),
+    ('author', 2),
+    ('description', 1)
+)
+
+MAX_PREFIX_EXPANSIONS = 50
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+LATIN_TO_CYRILLIC = {
+    'shch': 'щ', 'sch': 'щ', 'dzh': 'дж', 'zh': 'ж', 'kh': 'х', 'ts': 'ц',
+    'ch': 'ч', 'sh': 'ш', 'yu': 'ю', 'ya': 'я', 'yo': 'е', 'ye': 'е',
+    'ju': 'ю', 'ja': 'я', 'jo': 'е', 'je': 'е',
+    'a': 'а', 'b': 'б', 'c': 'к', 'd': 'д', 'e': 'е', 'f': 'ф', 'g': 'г',
+    'h': 'х', 'i': 'и', 'j': 'й', 'k': 'к', 'l': 'л', 'm': 'м', 'n': 'н',
+    'o': 'о', 'p': 'п', 'q': 'к', 'r': 'р', 's': 'с', 't': 'т', 'u': 'у',
+    'v': 'в', 'w': 'в', 'x': 'кс', 'z': 'з'
+}
+
+LATIN_SEQUENCES = sorted(LATIN_TO_CYRILLIC, key=len, reverse=True)
+LATIN_VOWELS = 'aeiouy'
+
+# Пары, которые транслитерация не различает: «voyna», «vojna» и «voina»
+# должны найти «Война», а «tolstoy» — «Толстой»
+CYRILLIC_FOLD = str.maketrans('йыёэ', 'ииее')
+
+
+# Стеммер Snowball для русского языка
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв'), ('вшись', 'вши', 'в'))
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий',
+    'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'
+)
+PARTICIPLE = (('ивш', 'ывш', 'ующ'), ('ем', 'нн', 'вш', 'ющ', 'щ'))
+REFLEXIVE = ('ся', 'сь')
+VERB = (
+    (
+        'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено',
+        'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+        'ен', 'ят', 'ит', 'ыт', 'ую', 'ю'
+    ),
+    ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи',
+    'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия',
+    'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я'
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _region(word, start):
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word, start, endings, after_a=False):
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if after_a and not (stem and stem[-1] in 'ая' and len(stem) - 1 >= start):
+                continue
+            return stem
+    return None
+
+
+def _strip_grouped(word, start, groups):
+    return _strip(word, start, groups[0]) or _strip(word, start, groups[1], after_a=True)
+
+
+def stem(word):
+    """Стемминг русского слова"""
+    word = word.replace('ё', 'е')
+    rv = next((i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    if rv >= len(word):
+        return word
+    r2 = _region(word, _region(word, 0))
+
+    stemmed = _strip_grouped(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stemmed = _strip(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            stemmed = _strip_grouped(stemmed, rv, PARTICIPLE) or stemmed
+        else:
+            stemmed = _strip_grouped(word, rv, VERB) or _strip(word, rv, NOUN)
+    word = stemmed or word
+
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        return word[:-1] if word.endswith('нн') else word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+
+def transliterate(value, final_i=False):
+    """Транслитерация строки между кириллицей и латиницей
+
+    final_i: конечное i после гласной читается как й (tolstoi, nikolai),
+    иначе как и (geroi).
+    """
+    value = value.lower()
+    if CYRILLIC_RE.search(value):
+        return ''.join(CYRILLIC_TO_LATIN.get(char, char) for char in value)
+
+    result = []
+    i = 0
+    while i < len(value):
+        if final_i and value[i] == 'i' and i and value[i - 1] in LATIN_VOWELS \
+                and not value[i + 1:i + 2].isalpha():
+            result.append('й')
+            i += 1
+            continue
+        for sequence in LATIN_SEQUENCES:
+            if value.startswith(sequence, i):
+                result.append(LATIN_TO_CYRILLIC[sequence])
+                i += len(sequence)
+                break
+        else:
+            if value[i] == 'y':
+                # после гласной y — это й (voyna, tolstoy), после согласной — ы
+                result.append('й' if i and value[i - 1] in LATIN_VOWELS else 'ы')
+            else:
+                result.append(value[i])
+            i += 1
+    return ''.join(result)
+
+
+def fold(value):
+    """Сведение неразличимых при транслитерации букв: й/ы → и, ё/э → е"""
+    return value.translate(CYRILLIC_FOLD)
+
+
+def tokenize(value):
+    """Разбиение строки на нормализованные токены"""
+    if not value:
+        return []
+    return TOKEN_RE.findall(value.lower().replace('ё', 'е'))
+
+
+@lru_cache(maxsize=100_000)
+def normalize_token(token):
+    return fold(stem(token)) if CYRILLIC_RE.search(token) else token
+
+
+def query_variants(search_query):
+    """Варианты запроса: исходный и транслитерированные"""
+    variants = []
+    for variant in (search_query, transliterate(search_query), transliterate(search_query, final_i=True)):
+        tokens = tokenize(variant)
+        if tokens and tokens not in variants:
+            variants.append(tokens)
+    return variants
+
+
+class MediaSearchIndex:
+    """Инвертированный индекс по названию, автору и описанию"""
+
+    def __init__(self):
+        self.postings = {}
+        self.terms = []
+        self.size = 0
+
+    def build(self, rows):
+        postings = {}
+        size = 0
+        for row in rows:
+            size += 1
+            weights = {}
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(getattr(row, field)):
+                    term = normalize_token(token)
+                    if weights.get(term, 0) < weight:
+                        weights[term] = weight
+            for term, weight in weights.items():
+                ids, term_weights = postings.setdefault(term, (array('i'), array('b')))
+                ids.append(row.id)
+                term_weights.append(weight)
+
+        self.postings = postings
+        self.terms = sorted(postings)
+        self.size = size
+        return self
+
+    def _expand(self, token, prefix):
+        term = normalize_token(token)
+        terms = [term] if term in self.postings else []
+        if prefix:
+            token = fold(token)
+            position = bisect_left(self.terms, token)
+            while position < len(self.terms) and len(terms) < MAX_PREFIX_EXPANSIONS:
+                candidate = self.terms[position]
+                if not candidate.startswith(token):
+                    break
+                if candidate != term:
+                    terms.append(candidate)
+                position += 1
+        return terms
+
+    def _score_token(self, token, prefix):
+        scores = {}
+        for term in self._expand(token, prefix):
+            ids, weights = self.postings[term]
+            idf = math.log(1 + self.size / len(ids))
+            for media_id, weight in zip(ids, weights):
+                score = weight * idf
+                if scores.get(media_id, 0) < score:
+                    scores[media_id] = score
+        return scores
+
+    def search(self, search_query, limit=1000):
+        """Поиск: все слова запроса должны совпасть, последнее — по префиксу"""
+        results = {}
+        for tokens in query_variants(search_query):
+            token_scores = [
+                self._score_token(token, prefix=i == len(tokens) - 1)
+                for i, token in enumerate(tokens)
+            ]
+            token_scores.sort(key=len)
+            matched = token_scores[0]
+            for scores in token_scores[1:]:
+                matched = {
+                    media_id: score + scores[media_id]
+                    for media_id, score in matched.items()
+                    if media_id in scores
+                }
+            for media_id, score in matched.items():
+                if results.get(media_id, 0) < score:
+                    results[media_id] = score
+
+        return nlargest(limit, results.items(), key=lambda item: (item[1], -item[0]))
+
+
+_index = None
+_index_version = None
+_index_building = False
+_index_lock = threading.Lock()
+_trigram_available = None
+
+
+def build_search_index(version):
+    """Построение индекса каталога и публикация его для запросов"""
+    global _index, _index_version
+
+    rows = db.session.query(
+        Media.id,
+        Media.title,
+        Media.author,
+        Media.description
+    ).yield_per(5000)
+    index = MediaSearchIndex().build(rows)
+    with _index_lock:
+        _index = index
+        _index_version = version
+    return index
+
+
+def _build_in_background(app, version):
+    global _index_building
+
+    try:
+        with app.app_context():
+            build_search_index(version)
+    except Exception:
+        app.logger.exception('Ошибка построения поискового индекса')
+    finally:
+        with _index_lock:
+            _index_building = False
+
+
+def get_search_index():
+    """Индекс каталога для текущего запроса
+
+    При смене версии каталога индекс перестраивается в фоновом потоке,
+    а запросы тем временем получают прежний индекс; до первой сборки
+    возвращается None. При общем соединении SQLite в памяти (StaticPool)
+    фоновая сборка конфликтовала бы с запросом, поэтому там индекс
+    строится сразу.
+    """
+    global _index_building
+
+    version = get_catalog_version()
+    if _index is not None and _index_version == version:
+        return _index
+
+    if isinstance(db.engine.pool, StaticPool):
+        with _index_lock:
+            if _index is not None and _index_version == version:
+                return _index
+        return build_search_index(version)
+
+    with _index_lock:
+        if not _index_building:
+            _index_building = True
+            threading.Thread(
+                target=_build_in_background,
+                args=(current_app._get_current_object(), version),
+                name='search-index',
+                daemon=True
+            ).start()
+    return _index
+
+
+def search_backend():
+    backend = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+    return backend
+
+
+def _has_trigram():
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trigram_available
+
+
+def _tsquery_text(search_query):
+    groups = []
+    for tokens in query_variants(search_query):
+        tokens = tokens[:-1] + [tokens[-1] + ':*']
+        groups.append('(' + ' & '.join(tokens) + ')')
+    return ' | '.join(groups)
+
+
+def _postgres_search(query, search_query):
+    conditions = []
+    rank = literal(0.0)
+
+    tsquery_text = _tsquery_text(search_query)
+    if tsquery_text:
+        tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text)
+        conditions.append(media_search_vector.op('@@')(tsquery))
+        rank = func.ts_rank(media_search_vector, tsquery)
+
+    if _has_trigram() or not conditions:
+        conditions.append(Media.title.icontains(search_query, autoescape=True))
+        conditions.append(Media.author.icontains(search_query, autoescape=True))
+        if _has_trigram():
+            rank = rank + func.similarity(Media.title, search_query)
+
+    return query.filter(or_(*conditions)), rank
+
+
+def _memory_search(query, search_query):
+    index = get_search_index()
+    if index is None:
+        return query.filter(or_(
+            Media.title.icontains(search_query, autoescape=True),
+            Media.author.icontains(search_query, autoescape=True)
+        )), literal(0.0)
+
+    limit = current_app.config.get('SEARCH_MEMORY_LIMIT', 1000)
+    matches = index.search(search_query, limit=limit)
+    if not matches:
+        return query.filter(false()), literal(0.0)
+
+    scores = dict(matches)
+    rank = case(scores, value=Media.id, else_=0.0)
+    return query.filter(Media.id.in_(scores.keys())), rank
+
+
+def search_capped(search_query):
+    """Совпадений больше, чем SEARCH_MEMORY_LIMIT, и поиск в памяти их обрезал"""
+    if search_backend() == 'postgres':
+        return False
+    index = get_search_index()
+    if index is None:
+        return False
+    limit = current_app.config.get('SEARCH_MEMORY_LIMIT', 1000)
+    return len(index.search(search_query, limit=limit + 1)) > limit
+
+
+def apply_search(query, search_query):
+    """Фильтрация запроса каталога по поисковой строке
+
+    Возвращает отфильтрованный запрос и выражение релевантности.
+    """
+    if search_backend() == 'postgres':
+        return _postgres_search(query, search_query)
+    return _memory_search(query, search_query)
@@ -0,0 +1,160 @@
+import click
+import numpy as np
+import time
+
+from flask.cli import with_appcontext
+from scipy import sparse
+from sqlalchemy import select
+
+from app.models import db, Media, MediaSimilarity, UserMediaList
+
+
+SIMILAR_LIST_TYPES = ('completed', 'favorite')
+SIMILAR_TOP_K = 20
+FETCH_BATCH_SIZE = 100_000
+BLOCK_SIZE = 2000
+INSERT_BATCH_SIZE = 10_000
+
+
+def load_interactions(batch_size=FETCH_BATCH_SIZE):
+    """Пары (пользователь, произведение) из завершённого и избранного
+
+    Строки читаются потоком и складываются в массивы int32, поэтому память
+    растёт только на 8 байт на запись списка.
+    """
+    result = db.session.execute(
+        select(UserMediaList.user_id, UserMediaList.media_id).where(
+            UserMediaList.list_type.in_(SIMILAR_LIST_TYPES)
+        ).execution_options(stream_results=True, yield_per=batch_size)
+    )
+
+    users = []
+    media = []
+    for partition in result.partitions():
+        pairs = np.array(partition, dtype=np.int32).reshape(-1, 2)
+        users.append(pairs[:, 0])
+        media.append(pairs[:, 1])
+
+    if not users:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    return np.concatenate(users), np.concatenate(media)
+
+
+def interaction_matrix(user_ids, media_ids):
+    """Бинарная разреженная матрица пользователь × произведение
+
+    Возвращает матрицу CSC и массив id произведений по столбцам.
+    """
+    user_index = np.unique(user_ids, return_inverse=True)[1]
+    media_keys, media_index = np.unique(media_ids, return_inverse=True)
+
+    matrix = sparse.csc_matrix(
+        (np.ones(len(user_index), dtype=np.float32), (user_index, media_index)),
+        shape=(int(user_index.max(initial=-1)) + 1, len(media_keys))
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, media_keys
+
+
+def top_similar(matrix, top_k=SIMILAR_TOP_K, min_common=2, block_size=BLOCK_SIZE):
+    """Ближайшие по косинусной мере произведения для каждого столбца
+
+    Произведение X^T X считается блоками по block_size столбцов, так что
+    в памяти одновременно находится только одна полоса матрицы сходства.
+    Отдаёт кортежи (индекс столбца, индексы похожих, оценки).
+    """
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel()).astype(np.float32)
+    norms[norms == 0] = 1
+    transposed = matrix.T.tocsr()
+
+    for start in range(0, matrix.shape[1], block_size):
+        stop = min(start + block_size, matrix.shape[1])
+        block = (transposed[start:stop] @ matrix).tocsr()
+
+        for row in range(stop - start):
+            column = start + row
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            indices = block.indices[begin:end]
+            common = block.data[begin:end]
+
+            keep = (indices != column) & (common >= min_common)
+            indices = indices[keep]
+            if not len(indices):
+                continue
+            scores = common[keep] / (norms[column] * norms[indices])
+
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                indices, scores = indices[best], scores[best]
+            order = np.lexsort((indices, -scores))
+            yield column, indices[order], scores[order]
+
+
+def build_similar_media(top_k=SIMILAR_TOP_K, min_common=2, block_size=BLOCK_SIZE):
+    """Пересчёт таблицы похожих произведений
+
+    Таблица заменяется целиком в одной транзакции. Возвращает число
+    произведений с рекомендациями и число записанных строк.
+    """
+    user_ids, media_ids = load_interactions()
+    matrix, media_keys = interaction_matrix(user_ids, media_ids)
+    del user_ids, media_ids
+
+    table = MediaSimilarity.__table__
+    db.session.execute(table.delete())
+
+    media_count = rows_count = 0
+    batch = []
+    for column, indices, scores in top_similar(matrix, top_k, min_common, block_size):
+        media_id = int(media_keys[column])
+        batch.extend({
+            'media_id': media_id,
+            'rank': rank,
+            'similar_id': int(media_keys[index]),
+            'score': float(score)
+        } for rank, (index, score) in enumerate(zip(indices, scores)))
+        media_count += 1
+
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            rows_count += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(table.insert(), batch)
+        rows_count += len(batch)
+    db.session.commit()
+    return media_count, rows_count
+
+
+def get_similar_media(media_id, limit=SIMILAR_TOP_K):
+    """Похожие произведения из предрассчитанной таблицы: пары (Media, оценка)"""
+    return db.session.query(
+        Media,
+        MediaSimilarity.score
+    ).select_from(
+        MediaSimilarity
+    ).join(
+        Media,
+        MediaSimilarity.similar_id == Media.id
+    ).filter(
+        MediaSimilarity.media_id == media_id
+    ).order_by(
+        MediaSimilarity.rank
+    ).limit(limit).all()
+
+
+@click.command('build-similar')
+@click.option('--top-k', default=SIMILAR_TOP_K, help='Число похожих на произведение')
+@click.option('--min-common', default=2, help='Минимум общих пользователей')
+@click.option('--block-size', default=BLOCK_SIZE, help='Столбцов матрицы за один шаг')
+@with_appcontext
+def build_similar_command(top_k, min_common, block_size):
+    """Пересчитать похожие произведения по спискам пользователей"""
+    started = time.perf_counter()
+    media_count, rows_count = build_similar_media(top_k, min_common, block_size)
+    click.echo(
+        f'Похожие произведения: {media_count}, строк: {rows_count}, '
+        f'за {time.perf_counter() - started:.1f} с'
+    )
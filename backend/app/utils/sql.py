@@ -0,0 +1,10 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import db
+
+
+def upsert(table):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта"""
+    if db.engine.dialect.name == 'sqlite':
+        return sqlite.insert(table)
+    return postgresql.insert(table)
@@ -0,0 +1,37 @@
+from app.models import db, UserMediaList
+
+
+LIST_TYPES = ('planned', 'completed', 'favorite')
+
+
+def get_list_statuses(user_id, media_ids):
+    """Статусы произведений страницы в списках пользователя
+
+    Один запрос по id произведений страницы; возвращает словарь
+    media_id -> множество типов списков.
+    """
+    statuses = {}
+    media_ids = set(media_ids)
+    if not user_id or not media_ids:
+        return statuses
+
+    rows = db.session.query(
+        UserMediaList.media_id,
+        UserMediaList.list_type
+    ).filter(
+        UserMediaList.user_id == user_id,
+        UserMediaList.media_id.in_(media_ids)
+    ).all()
+
+    for media_id, list_type in rows:
+        statuses.setdefault(media_id, set()).add(list_type)
+    return statuses
+
+
+def status_fields(statuses, media_id):
+    """Поля статуса для сериализации произведения"""
+    list_types = statuses.get(media_id, ())
+    return {
+        f'is_{list_type}': list_type in list_types
+        for list_type in LIST_TYPES
+    }
@@ -0,0 +1,53 @@
+import mimetypes
+import os
+import re
+
+from flask import abort, current_app, send_file
+from werkzeug.security import safe_join
+
+
+CONTENT_HASHED_RE = re.compile(r'^(?:avatar_)?(?P<hash>[0-9a-f]{64})_\d+\.\w+$')
+IMMUTABLE_MAX_AGE = 31536000
+
+
+def serve_upload(filename, subfolder=''):
+    """Отдача файла из каталога загрузок
+
+    UPLOADS_SERVE_MODE:
+      flask      — файл отдаёт Flask (send_file с ETag, Last-Modified и Range);
+      x-accel    — только заголовок X-Accel-Redirect, файл отдаёт nginx из
+                   internal-локации UPLOADS_ACCEL_PREFIX, например:
+                       location /protected-uploads/ { internal; alias /srv/poketroid/uploads/; }
+      x-sendfile — заголовок X-Sendfile для Apache/lighttpd.
+    Файлы с хешем содержимого в имени кэшируются как неизменяемые.
+    """
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], subfolder)
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    match = CONTENT_HASHED_RE.match(filename)
+    max_age = IMMUTABLE_MAX_AGE if match else None
+
+    if current_app.config.get('UPLOADS_SERVE_MODE') == 'x-accel':
+        prefix = current_app.config.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = prefix + '/'.join(filter(None, [subfolder, filename]))
+        if match:
+            response.set_etag(match.group('hash'))
+        if max_age:
+            response.cache_control.max_age = max_age
+    else:
+        response = send_file(
+            path,
+            etag=match.group('hash') if match else True,
+            conditional=True,
+            max_age=max_age
+        )
+
+    if match:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
@@ -0,0 +1,113 @@
+import click
+
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from app.models import db, Media, UserMediaList, UserMediaStats
+from app.utils.sql import upsert
+
+
+STATS_KEYS = {
+    'anime': 'anime',
+    'movie': 'movies',
+    'book': 'books'
+}
+
+
+def apply_stats_deltas(user_id, deltas):
+    """Изменение счётчиков пользователя в текущей транзакции
+
+    deltas: словарь (media_type, list_type) -> (изменение количества,
+    изменение длительности).
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    table = UserMediaStats.__table__
+    statement = upsert(table).values([{
+        'user_id': user_id,
+        'media_type': media_type,
+        'list_type': list_type,
+        'count': count,
+        'duration': duration
+    } for (media_type, list_type), (count, duration) in deltas.items()])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.media_type, table.c.list_type],
+        set_={
+            'count': table.c.count + statement.excluded.count,
+            'duration': table.c.duration + statement.excluded.duration
+        }
+    )
+    db.session.execute(statement)
+
+
+def get_profile_stats(user_id):
+    """Статистика профиля одним чтением по первичному ключу
+
+    Возвращает количество записей по типам медиа и спискам
+    и суммарную длительность завершённого.
+    """
+    stats = {key: {'completed': 0, 'planned': 0} for key in STATS_KEYS.values()}
+    durations = {key: {'completed': 0} for key in STATS_KEYS.values()}
+
+    rows = db.session.query(
+        UserMediaStats.media_type,
+        UserMediaStats.list_type,
+        UserMediaStats.count,
+        UserMediaStats.duration
+    ).filter(
+        UserMediaStats.user_id == user_id
+    ).all()
+
+    for media_type, list_type, count, duration in rows:
+        key = STATS_KEYS.get(media_type)
+        if key is None:
+            continue
+        if list_type in stats[key]:
+            stats[key][list_type] = count
+        if list_type == 'completed':
+            durations[key]['completed'] = duration
+
+    return stats, durations
+
+
+def rebuild_user_stats(user_ids=None):
+    """Пересчёт статистики пользователей по user_media_lists"""
+    delete = UserMediaStats.__table__.delete()
+    aggregate = select(
+        UserMediaList.user_id,
+        Media.type,
+        UserMediaList.list_type,
+        func.count(),
+        func.coalesce(func.sum(Media.duration), 0)
+    ).join(
+        Media,
+        UserMediaList.media_id == Media.id
+    ).group_by(
+        UserMediaList.user_id,
+        Media.type,
+        UserMediaList.list_type
+    )
+
+    if user_ids is not None:
+        delete = delete.where(UserMediaStats.user_id.in_(user_ids))
+        aggregate = aggregate.where(UserMediaList.user_id.in_(user_ids))
+
+    db.session.execute(delete)
+    result = db.session.execute(
+        UserMediaStats.__table__.insert().from_select(
+            ['user_id', 'media_type', 'list_type', 'count', 'duration'],
+            aggregate
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Пересчитать статистику всех пользователей"""
+    rows = rebuild_user_stats()
+    click.echo(f'Пересчитано строк статистики: {rows}')
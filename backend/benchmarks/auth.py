@@ -0,0 +1,52 @@
+"""Микробенчмарк auth_required с кэшем проверенных токенов и без него
+
+Запуск из каталога backend:
+    python -m benchmarks.auth --calls 100000
+"""
+import argparse
+import time
+
+from flask import g
+
+from app.routes.auth import auth_required
+from app.utils.auth import generate_token, get_token_cache
+from benchmarks.common import BenchConfig, create_bench_app
+
+
+@auth_required
+def protected_view():
+    return g.user_id
+
+
+def run(cache_size, calls):
+    app = create_bench_app(JWT_CACHE_SIZE=cache_size)
+
+    with app.app_context():
+        token = generate_token(1)
+
+    headers = {'Authorization': f'Bearer {token}'}
+    with app.test_request_context(headers=headers):
+        started = time.perf_counter()
+        for _ in range(calls):
+            protected_view()
+        elapsed = time.perf_counter() - started
+        stats = get_token_cache().stats()
+
+    return elapsed / calls, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100_000)
+    args = parser.parse_args()
+
+    uncached, _ = run(0, args.calls)
+    cached, stats = run(BenchConfig.JWT_CACHE_SIZE, args.calls)
+
+    print(f'Без кэша: {uncached * 1e6:8.2f} мкс на вызов')
+    print(f'С кэшем:  {cached * 1e6:8.2f} мкс на вызов (попаданий {stats["hits"]}, промахов {stats["misses"]})')
+    print(f'Ускорение: x{uncached / cached:.1f}')
+
+
+if __name__ == '__main__':
+    main()
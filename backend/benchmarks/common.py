@@ -0,0 +1,24 @@
+from app import create_app, db
+from config import Config
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SECRET_KEY = 'benchmark'
+    BCRYPT_ROUNDS = 4
+
+
+def create_bench_app(database_url=None, **overrides):
+    """Приложение для бенчмарков: по умолчанию SQLite в памяти со свежей схемой
+
+    database_url и overrides попадают в конфигурацию до create_app:
+    движок и расширения читают её при создании приложения.
+    """
+    if database_url:
+        overrides['SQLALCHEMY_DATABASE_URI'] = database_url
+    app = create_app(type('BenchConfig', (BenchConfig,), overrides))
+
+    if not database_url:
+        with app.app_context():
+            db.create_all()
+    return app
@@ -0,0 +1,123 @@
+"""Детерминированный генератор синтетических данных для бенчмарков
+
+Активность пользователей и популярность произведений распределены по
+закону Ципфа: немногие пользователи ведут большие списки, немногие
+произведения есть почти у всех. При одинаковом seed данные совпадают.
+"""
+import random
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import text
+
+from app import db
+from app.models import Friendship, Media, MediaSimilarity, User, UserActivity, UserMediaList
+from app.utils.passwords import hash_password
+from app.utils.popularity import reconcile_popularity
+from app.utils.user_stats import rebuild_user_stats
+
+
+CHUNK_SIZE = 10000
+PASSWORD = 'benchmark-password'
+HUB_FRIENDS = 200
+
+
+class Zipf:
+    """Выборка рангов 1..n с вероятностью, пропорциональной 1 / rank ** s"""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+    def sample(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1]) + 1
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[start:start + CHUNK_SIZE])
+
+
+def username(user_id):
+    return f'user{user_id}'
+
+
+def seed_dataset(users, media, entries, friendships, seed=42, zipf_s=1.1):
+    """Заполнение пустой схемы пользователями, каталогом, списками и дружбами
+
+    Пользователь 1 — «хаб» с HUB_FRIENDS друзьями. У всех пользователей
+    пароль PASSWORD. В конце пересчитываются статистика и популярность
+    и обновляется статистика планировщика.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password_hash = hash_password(PASSWORD)
+
+    _insert(User.__table__, [{
+        'id': user_id,
+        'username': username(user_id),
+        'display_name': f'Пользователь {user_id}',
+        'password_hash': password_hash
+    } for user_id in range(1, users + 1)])
+
+    _insert(Media.__table__, [{
+        'id': media_id,
+        'title': f'Произведение {media_id}',
+        'type': ('book', 'movie', 'anime')[media_id % 3],
+        'author': f'Автор {media_id % 1000}',
+        'release_year': 1950 + media_id % 75,
+        'duration': 90,
+        'external_rating': round(rng.uniform(1, 10), 1),
+        'external_rating_count': rng.randint(0, 100000) if media_id % 10 else None,
+        'source': 'benchmark',
+        'external_id': str(media_id)
+    } for media_id in range(1, media + 1)])
+
+    user_ranks = Zipf(users, zipf_s, rng)
+    media_ranks = Zipf(media, zipf_s, rng)
+    entries = min(entries, users * media * 3)
+    list_rows = {}
+    while len(list_rows) < entries:
+        key = (user_ranks.sample(), media_ranks.sample(), rng.choice(('planned', 'completed', 'favorite')))
+        list_rows[key] = now - timedelta(minutes=rng.randint(0, 500000))
+    list_rows = sorted(list_rows.items(), key=lambda item: (item[1], item[0]))
+
+    _insert(UserMediaList.__table__, [{
+        'user_id': user_id,
+        'media_id': media_id,
+        'list_type': list_type,
+        'added_at': added_at
+    } for (user_id, media_id, list_type), added_at in list_rows])
+    _insert(UserActivity.__table__, [{
+        'user_id': user_id,
+        'media_id': media_id,
+        'list_type': list_type,
+        'created_at': added_at
+    } for (user_id, media_id, list_type), added_at in list_rows])
+
+    pairs = {(1, friend_id) for friend_id in range(2, min(users, HUB_FRIENDS) + 1)}
+    friendships = min(friendships, users * (users - 1) // 2)
+    while len(pairs) < friendships:
+        user_id, friend_id = user_ranks.sample(), rng.randint(1, users)
+        if user_id != friend_id and (friend_id, user_id) not in pairs:
+            pairs.add((user_id, friend_id))
+    _insert(Friendship.__table__, [{
+        'user_id': user_id,
+        'friend_id': friend_id,
+        'status': 'accepted' if rng.random() < 0.9 else 'pending'
+    } for user_id, friend_id in sorted(pairs)])
+
+    _insert(MediaSimilarity.__table__, [{
+        'media_id': media_id,
+        'rank': rank,
+        'similar_id': media_ranks.sample(),
+        'score': 1.0 - rank / 20
+    } for media_id in range(1, min(media, 5000) + 1) for rank in range(20)])
+
+    db.session.commit()
+    rebuild_user_stats()
+    reconcile_popularity()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
@@ -0,0 +1,172 @@
+"""Проверка планов запросов маршрутов на последовательное сканирование
+
+Скрипт пересоздаёт схему в указанной пустой базе Postgres, заполняет её
+синтетическими данными, вызывает маршруты всех блюпринтов, перехватывает
+выполненные SQL-запросы и прогоняет каждый через EXPLAIN. Если в плане
+есть Seq Scan по таблице больше --min-rows строк, скрипт завершается
+с кодом 1. Подсчёт общего числа строк (SELECT count(*)), запросы без WHERE
+(фасеты всего каталога) и построение индекса дружб читают таблицу целиком
+намеренно и не проверяются.
+
+Запуск из каталога backend:
+    python -m benchmarks.explain --database-url postgresql://localhost/poketroid_explain
+Та же проверка на меньшем наборе данных входит в тесты:
+    TEST_DATABASE_URL=postgresql://localhost/poketroid_explain python -m pytest -m postgres
+Индексы для уже существующей базы — в sql/hot_query_indexes.sql.
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import event, text
+
+from app import db
+from app.utils.auth import generate_token
+from app.utils.friend_graph import get_friend_graph
+from benchmarks.common import create_bench_app
+from benchmarks.dataset import seed_dataset, username
+
+
+CHECKED_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+# Обычный пользователь из середины распределения: у хаба и первых по рангу
+# пользователей тысячи записей и друзей, и последовательное сканирование
+# для их списков — правильный выбор планировщика, а не пропущенный индекс
+USER_ID = 1000
+
+
+def route_calls(client, headers):
+    """Обращения ко всем маршрутам, которые читают или пишут базу
+
+    Ответ 5xx прерывает проверку: запросы упавшего маршрута иначе
+    просто не попали бы в отчёт.
+    """
+    def checked(path, response):
+        if response.status_code >= 500:
+            raise RuntimeError(f'{path}: {response.status_code} {response.get_data(as_text=True)[:200]}')
+        return response
+
+    def get(path, **kwargs):
+        return checked(path, client.get(path, headers=headers, **kwargs))
+
+    def post(path, payload):
+        return checked(path, client.post(path, headers=headers, json=payload))
+
+    get('/api/media/?type=movie')
+    get('/api/media/?sort_by=popularity&page=3')
+    get('/api/media/?sort_by=newest&type=book')
+    get('/api/media/?sort_by=popularity&cursor=')
+    get('/api/media/?sort_by=community&type=anime&cursor=')
+    get('/api/media/?sort_by=community')
+    get('/api/media/', query_string={'query': 'произведение 123', 'facets': '1'})
+    get('/api/media/?facets=1&type=movie')
+    get('/api/media/17')
+    get('/api/media/17/status')
+    get('/api/media/17/similar')
+    get(f'/api/media/favorites?user_id={USER_ID}')
+    post('/api/media/list', {'media_id': 42, 'list_type': 'planned', 'operation': 'add'})
+    post('/api/media/list/batch', {'items': [
+        {'media_id': 43, 'list_type': 'completed', 'operation': 'add'},
+        {'media_id': 44, 'list_type': 'favorite', 'operation': 'toggle'}
+    ]})
+
+    get(f'/api/users/{username(USER_ID)}')
+    get(f'/api/users/{username(USER_ID + 1)}?media_type=movie&list_type=completed')
+    get(f'/api/users/{username(USER_ID)}/friends')
+    get('/api/users/search?q=user123')
+
+    get('/api/friends/')
+    get('/api/friends/requests')
+    get('/api/friends/status/5')
+    get('/api/friends/feed')
+    get('/api/friends/suggestions')
+    post('/api/friends/1234/request', {})
+
+
+def _reads_whole_table(statement):
+    return statement.lstrip().upper().startswith('SELECT COUNT(*)') or ' WHERE ' not in ' '.join(statement.split())
+
+
+def _seq_scans(plan, min_rows, sizes):
+    if plan.get('Node Type') == 'Seq Scan' and sizes.get(plan.get('Relation Name'), 0) >= min_rows:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _seq_scans(child, min_rows, sizes)
+
+
+def explain_routes(database_url, users, media, entries, friendships, min_rows):
+    """Пересоздание схемы, вызов маршрутов и проверка планов их запросов
+
+    Возвращает число проверенных запросов и список пар
+    (таблицы с Seq Scan, текст запроса).
+    """
+    if users <= USER_ID:
+        raise ValueError(f'Нужно больше {USER_ID} пользователей')
+    app = create_bench_app(database_url, CATALOG_VERSION_TTL=0, SEARCH_BACKEND='postgres', SLOW_QUERY_LOG=None)
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            raise ValueError('Нужна база Postgres')
+        db.drop_all()
+        db.create_all()
+        seed_dataset(users, media, entries, friendships)
+        sizes = dict(db.session.execute(text(
+            "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r'"
+        )).all())
+        headers = {'Authorization': f'Bearer {generate_token(USER_ID)}'}
+        get_friend_graph()
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(CHECKED_STATEMENTS):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            route_calls(app.test_client(), headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        failures = []
+        seen = set()
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                if statement in seen or _reads_whole_table(statement):
+                    continue
+                seen.add(statement)
+
+                plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = sorted(set(_seq_scans(plan[0]['Plan'], min_rows, sizes)))
+                if scans:
+                    failures.append((scans, ' '.join(statement.split())))
+        db.session.remove()
+        db.engine.dispose()
+    return len(seen), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help='пустая база Postgres, схема будет пересоздана')
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--media', type=int, default=100_000)
+    parser.add_argument('--entries', type=int, default=500_000)
+    parser.add_argument('--friendships', type=int, default=200_000)
+    parser.add_argument('--min-rows', type=int, default=1000, help='порог размера таблицы')
+    args = parser.parse_args()
+
+    try:
+        checked, failures = explain_routes(
+            args.database_url, args.users, args.media, args.entries, args.friendships, args.min_rows
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    for scans, statement in failures:
+        print(f'Seq Scan по {", ".join(scans)}:\n{statement}\n')
+    print(f'Проверено запросов: {checked}, с последовательным сканированием: {len(failures)}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
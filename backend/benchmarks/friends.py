@@ -0,0 +1,60 @@
+"""Индекс дружб: построение, изменения и подбор возможных знакомых
+
+Запуск из каталога backend:
+    python -m benchmarks.friends --edges 1000000 --users 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.search import _report
+from app.utils.friend_graph import FriendGraph
+
+
+def generate_edges(edges, users, seed=42):
+    """Синтетический граф: у части пользователей друзей заметно больше"""
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < edges:
+        user_id = int(users * rng.random() ** 2) + 1
+        friend_id = rng.randint(1, users)
+        if user_id != friend_id:
+            seen.add((min(user_id, friend_id), max(user_id, friend_id)))
+    return list(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--edges', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    edges = generate_edges(args.edges, args.users)
+
+    started = time.perf_counter()
+    graph = FriendGraph().build(edges)
+    print(f'Индекс на {graph.edges} рёбер построен за {time.perf_counter() - started:.1f} с')
+
+    rng = random.Random(1)
+    users = [rng.randint(1, args.users) for _ in range(args.queries)]
+
+    timings = []
+    for user_id in users:
+        started = time.perf_counter()
+        graph.suggestions(user_id)
+        timings.append(time.perf_counter() - started)
+    _report('suggestions', timings)
+
+    pairs = [(rng.randint(1, args.users), rng.randint(1, args.users)) for _ in range(args.queries)]
+    timings = []
+    for user_id, friend_id in pairs:
+        started = time.perf_counter()
+        graph.add_edge(user_id, friend_id)
+        graph.remove_edge(user_id, friend_id)
+        timings.append(time.perf_counter() - started)
+    _report('add_edge + remove_edge', timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Бенчмарк парсера LiveLib на синтетических страницах, в страницах в секунду
+
+Запуск из каталога backend:
+    python -m benchmarks.livelib --pages 500 --items 50
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from pathlib import Path
+
+from app.utils.livelib_parser import iter_livelib_books
+
+
+ITEM_TEMPLATE = '''
+<div class="block-border card-block brow"><div class="brow-inner rback">
+  <div class="brow-cover"><div class="cover-wrapper "><a href="/book/{book_id}-kniga">
+    <img data-pagespeed-lazy-src="https://s1.livelib.ru/boocover/{book_id}/140/cover.jpg" src="/x.gif"/></a></div>
+  <div class="brow-rating"><span class="rating-book"><span class="rating-value stars-color-orange">4.{rating}</span></span></div></div>
+  <div class="brow-data"><div>
+    <a class="brow-book-name with-cycle" href="/book/{book_id}-kniga">Книга номер {book_id}</a>
+    <a class="brow-book-author" href="/author/{author_id}">Автор {author_id}</a>
+    <div class="brow-details"><table class="compact">
+      <tr><td>ISBN:</td><td>978-5-699-{book_id}</td></tr>
+      <tr><td>Год издания:</td><td>{year}</td></tr>
+    </table></div>
+    <div class="brow-marg"><p>{description}</p></div>
+  </div></div>
+</div></div>
+'''
+
+
+def generate_pages(directory, pages, items):
+    """Синтетические страницы со структурой подборки LiveLib"""
+    for page in range(pages):
+        cards = ''.join(
+            ITEM_TEMPLATE.format(
+                book_id=page * items + index,
+                author_id=index % 37,
+                rating=index % 10,
+                year=1950 + index % 70,
+                description='Описание книги. ' * 40
+            )
+            for index in range(items)
+        )
+        html = f'<html><head><title>Подборка</title></head><body><div id="booklist">{cards}</div></body></html>'
+        Path(directory, f'page_{page:05d}.html').write_text(html, encoding='utf-8')
+
+
+def run(directory, workers):
+    started = time.perf_counter()
+    books = sum(1 for _ in iter_livelib_books(directory, workers))
+    return books, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--items', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_pages(directory, args.pages, args.items)
+        for workers in sorted({1, os.cpu_count() or 1}):
+            books, elapsed = run(directory, workers)
+            print(f'Процессов: {workers:2d}  книг: {books}  {args.pages / elapsed:8.1f} страниц/с')
+
+
+if __name__ == '__main__':
+    main()
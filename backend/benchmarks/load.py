@@ -0,0 +1,249 @@
+"""Нагрузочный прогон всех блюпринтов на синтетических данных
+
+Для каждого сценария выполняется --requests запросов в --concurrency
+потоков через тестовый клиент Flask. В отчёте — p50/p95/p99, пропускная
+способность и число SQL-запросов на запрос; --output пишет тот же отчёт
+в JSON, чтобы прогоны можно было сравнивать diff'ом.
+
+SQLite в памяти работает через одно соединение, поэтому для конкурентных
+прогонов нужна отдельная база (схема в ней будет пересоздана):
+    python -m benchmarks.load --users 2000 --media 10000 --entries 100000
+    python -m benchmarks.load --database-url postgresql://localhost/poketroid_bench \\
+        --concurrency 8 --output results.json
+"""
+import argparse
+import itertools
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app import db
+from app.utils.auth import generate_token
+from benchmarks.common import BenchConfig, create_bench_app
+from benchmarks.dataset import PASSWORD, seed_dataset, username, Zipf
+
+
+_registrations = itertools.count()
+
+
+def _catalog(run):
+    return 'GET', '/api/media/', {'query_string': {
+        'type': run.rng.choice(['movie', 'anime', 'book']),
+        'page': run.rng.randint(1, 5)
+    }}
+
+
+def _catalog_search(run):
+    return 'GET', '/api/media/', {'query_string': {'query': f'произведение {run.media()}'}}
+
+
+def _list_toggle(run):
+    return 'POST', '/api/media/list', {'json': {
+        'media_id': run.media(),
+        'list_type': run.rng.choice(['planned', 'completed', 'favorite'])
+    }}
+
+
+def _register(run):
+    return 'POST', '/api/auth/register', {'json': {
+        'username': f'bench_{next(_registrations)}',
+        'password': PASSWORD
+    }}
+
+
+SCENARIOS = {
+    'auth.login': (False, lambda run: (
+        'POST', '/api/auth/login', {'json': {'username': username(run.user()), 'password': PASSWORD}}
+    )),
+    'auth.register': (False, _register),
+    'media.catalog': (False, _catalog),
+    'media.catalog_search': (False, _catalog_search),
+    'media.detail': (False, lambda run: ('GET', f'/api/media/{run.media()}', {})),
+    'media.similar': (False, lambda run: ('GET', f'/api/media/{run.media()}/similar', {})),
+    'media.status': (True, lambda run: ('GET', f'/api/media/{run.media()}/status', {})),
+    'media.favorites': (False, lambda run: (
+        'GET', '/api/media/favorites', {'query_string': {'user_id': run.user()}}
+    )),
+    'media.list': (True, _list_toggle),
+    'friends.list': (True, lambda run: ('GET', '/api/friends/', {})),
+    'friends.requests': (True, lambda run: ('GET', '/api/friends/requests', {})),
+    'friends.status': (True, lambda run: ('GET', f'/api/friends/status/{run.user()}', {})),
+    'friends.feed': (True, lambda run: ('GET', '/api/friends/feed', {})),
+    'friends.suggestions': (True, lambda run: ('GET', '/api/friends/suggestions', {})),
+    'users.profile': (False, lambda run: ('GET', f'/api/users/{username(run.user())}', {})),
+    'users.profile_list': (False, lambda run: (
+        'GET', f'/api/users/{username(run.user())}',
+        {'query_string': {'media_type': 'movie', 'list_type': 'completed'}}
+    )),
+    'users.friends': (False, lambda run: ('GET', f'/api/users/{username(run.user())}/friends', {})),
+    'users.search': (True, lambda run: (
+        'GET', '/api/users/search', {'query_string': {'q': username(run.user())}}
+    )),
+}
+
+
+class SqlCounter:
+    """Число SQL-запросов, выполненных текущим потоком"""
+
+    def __init__(self, engine):
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+
+class WorkerRun:
+    """Состояние одного потока: свой клиент и детерминированный генератор"""
+
+    def __init__(self, app, args, seed):
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+        self.users = Zipf(args.users, args.zipf, self.rng)
+        self.media_ranks = Zipf(args.media, args.zipf, self.rng)
+
+    def user(self):
+        return self.users.sample()
+
+    def media(self):
+        return self.media_ranks.sample()
+
+
+def in_memory_sqlite(database_url):
+    """База — SQLite в памяти: одно общее соединение на все потоки"""
+    url = make_url(database_url or BenchConfig.SQLALCHEMY_DATABASE_URI)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+    )
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу"""
+    return values[max(0, min(len(values) - 1, round(fraction * len(values)) - 1))]
+
+
+def run_scenario(app, args, name, tokens, counter):
+    needs_auth, build = SCENARIOS[name]
+    per_worker = [args.requests // args.concurrency] * args.concurrency
+    per_worker[0] += args.requests - sum(per_worker)
+
+    def worker(index):
+        run = WorkerRun(app, args, f'{args.seed}:{name}:{index}')
+        results = []
+        for _ in range(per_worker[index]):
+            headers = {'Authorization': f'Bearer {tokens[run.user()]}'} if needs_auth else {}
+            method, path, kwargs = build(run)
+
+            counter.reset()
+            started = time.perf_counter()
+            response = run.client.open(path, method=method, headers=headers, **kwargs)
+            elapsed = time.perf_counter() - started
+            results.append((elapsed, response.status_code, counter.count))
+            response.close()
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = [item for chunk in executor.map(worker, range(args.concurrency)) for item in chunk]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    queries = [count for _, _, count in results]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        'endpoint': name,
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status >= 500),
+        'statuses': statuses,
+        'throughput_rps': round(len(results) / wall, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3)
+        },
+        'sql_per_request': {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='отдельная база, схема будет пересоздана')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--media', type=int, default=10000)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--friendships', type=int, default=20_000)
+    parser.add_argument('--zipf', type=float, default=1.1, help='показатель распределения Ципфа')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=500, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--endpoints', nargs='*', choices=sorted(SCENARIOS), help='только эти сценарии')
+    parser.add_argument('--output', help='файл для отчёта в JSON, - для stdout')
+    args = parser.parse_args()
+
+    if args.concurrency > 1 and in_memory_sqlite(args.database_url):
+        parser.error('Для --concurrency > 1 нужна --database-url с отдельной базой, а не SQLite в памяти')
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        if args.database_url:
+            db.drop_all()
+            db.create_all()
+        started = time.perf_counter()
+        seed_dataset(args.users, args.media, args.entries, args.friendships, args.seed, args.zipf)
+        print(f'Данные сгенерированы за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+
+        tokens = {user_id: generate_token(user_id) for user_id in range(1, args.users + 1)}
+        counter = SqlCounter(db.engine)
+        dialect = db.engine.dialect.name
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('database_url', 'output')},
+        'database': dialect,
+        'endpoints': [
+            run_scenario(app, args, name, tokens, counter)
+            for name in (args.endpoints or SCENARIOS)
+        ]
+    }
+
+    for result in report['endpoints']:
+        latency = result['latency_ms']
+        print(
+            f"{result['endpoint']:<22} {result['throughput_rps']:8.1f} запросов/с  "
+            f"p50={latency['p50']:8.2f}  p95={latency['p95']:8.2f}  p99={latency['p99']:8.2f} мс  "
+            f"SQL={result['sql_per_request']['mean']:5.1f}  ошибок={result['errors']}",
+            file=sys.stderr if args.output == '-' else sys.stdout
+        )
+
+    if args.output:
+        data = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+        if args.output == '-':
+            print(data)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+
+
+if __name__ == '__main__':
+    main()
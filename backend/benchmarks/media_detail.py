@@ -0,0 +1,64 @@
+"""Пропускная способность GET /api/media/<id> с кэшем записей и без него
+
+Запуск из каталога backend:
+    python -m benchmarks.media_detail --media 5000 --requests 20000
+"""
+import argparse
+import random
+import time
+
+from app import db
+from app.models import Media
+from benchmarks.common import create_bench_app
+
+
+def seed(app, count):
+    with app.app_context():
+        db.session.bulk_save_objects([
+            Media(
+                id=media_id,
+                title=f'Произведение {media_id}',
+                type=random.choice(['book', 'movie', 'anime']),
+                author=f'Автор {media_id % 100}',
+                release_year=1950 + media_id % 75,
+                description='Описание ' * 50,
+                duration=90,
+                external_rating=7.5,
+                external_rating_count=media_id
+            )
+            for media_id in range(1, count + 1)
+        ])
+        db.session.commit()
+
+
+def run(cache_size, media_count, requests, hot_set):
+    app = create_bench_app(MEDIA_CACHE_SIZE=cache_size)
+    seed(app, media_count)
+    client = app.test_client()
+
+    rng = random.Random(1)
+    ids = [rng.randint(1, hot_set) for _ in range(requests)]
+
+    started = time.perf_counter()
+    for media_id in ids:
+        response = client.get(f'/api/media/{media_id}')
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--media', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--hot-set', type=int, default=1000, help='число часто запрашиваемых записей')
+    args = parser.parse_args()
+
+    before = run(0, args.media, args.requests, args.hot_set)
+    after = run(10000, args.media, args.requests, args.hot_set)
+
+    print(f'Без кэша: {before:9.0f} запросов/с')
+    print(f'С кэшем:  {after:9.0f} запросов/с (x{after / before:.1f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Накладные расходы метрик: одинаковые запросы с метриками и без них
+
+Оба приложения создаются и прогреваются заранее, затем серии запросов
+чередуются (порядок меняется от раунда к раунду), и сравниваются медианы
+по раундам: так дрейф частоты процессора и сборка мусора влияют на оба
+режима одинаково.
+
+Запуск из каталога backend:
+    python -m benchmarks.metrics --requests 2000 --rounds 15
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import create_bench_app
+from benchmarks.media_detail import seed
+
+
+def prepare(metrics_enabled, media_count):
+    """Заполненное и прогретое приложение и его тестовый клиент"""
+    app = create_bench_app(METRICS_ENABLED=metrics_enabled, MEDIA_CACHE_SIZE=media_count)
+    assert ('metrics' in app.extensions) == metrics_enabled, 'METRICS_ENABLED не применился'
+    seed(app, media_count)
+    client = app.test_client()
+    for media_id in range(1, media_count + 1):
+        client.get(f'/api/media/{media_id}')
+    return client
+
+
+def run(client, paths):
+    """Среднее время запроса в серии, секунды"""
+    started = time.perf_counter()
+    for path in paths:
+        response = client.get(path)
+        assert response.status_code == 200
+    return (time.perf_counter() - started) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--media', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000, help='запросов в серии')
+    parser.add_argument('--rounds', type=int, default=15)
+    args = parser.parse_args()
+
+    clients = {False: prepare(False, args.media), True: prepare(True, args.media)}
+    paths = [f'/api/media/{media_id % args.media + 1}' for media_id in range(args.requests)]
+
+    timings = {False: [], True: []}
+    ratios = []
+    for round_number in range(args.rounds):
+        order = (False, True) if round_number % 2 == 0 else (True, False)
+        result = {enabled: run(clients[enabled], paths) for enabled in order}
+        for enabled, elapsed in result.items():
+            timings[enabled].append(elapsed)
+        ratios.append(result[True] / result[False])
+
+    started = time.perf_counter()
+    body = clients[True].get('/metrics').get_data()
+    print(f'Размер /metrics: {len(body)} байт, отдача за {(time.perf_counter() - started) * 1000:.2f} мс')
+
+    before = statistics.median(timings[False])
+    after = statistics.median(timings[True])
+    ratios.sort()
+    print(f'Раундов: {args.rounds} по {args.requests} запросов')
+    print(f'Без метрик:  медиана {before * 1e6:7.1f} мкс на запрос')
+    print(f'С метриками: медиана {after * 1e6:7.1f} мкс на запрос (+{(after - before) * 1e6:.1f} мкс)')
+    print(f'Накладные расходы по раундам: медиана {(statistics.median(ratios) - 1) * 100:+.1f}%, '
+          f'разброс {(ratios[0] - 1) * 100:+.1f}% … {(ratios[-1] - 1) * 100:+.1f}%')
+
+
+if __name__ == '__main__':
+    main()
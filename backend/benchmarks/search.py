@@ -0,0 +1,98 @@
+"""Бенчмарк поиска по каталогу
+
+Запуск из каталога backend:
+    python -m benchmarks.search --rows 1000000
+    python -m benchmarks.search --postgres
+"""
+import argparse
+import random
+import statistics
+import time
+
+from types import SimpleNamespace
+
+from app.utils.search import MediaSearchIndex
+
+
+SYLLABLES = [
+    'ка', 'ло', 'ми', 'ре', 'то', 'на', 'ви', 'сто', 'рия', 'дом', 'ночь', 'свет',
+    'ла', 'ger', 'ton', 'mar', 'vel', 'ри', 'ан', 'ко', 'вей', 'ше', 'ность'
+]
+
+QUERIES = ['дом', 'ночь свет', 'калом', 'marton', 'стория', 'ви', 'dom', 'рекаро', 'kalo']
+
+
+def _word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def generate_rows(count, seed=42):
+    """Генерация синтетических записей каталога"""
+    rng = random.Random(seed)
+    for media_id in range(1, count + 1):
+        yield SimpleNamespace(
+            id=media_id,
+            title=' '.join(_word(rng) for _ in range(rng.randint(1, 4))),
+            author=' '.join(_word(rng) for _ in range(2)),
+            description=' '.join(_word(rng) for _ in range(rng.randint(5, 15)))
+        )
+
+
+def _report(label, timings):
+    timings = sorted(timings)
+    print(
+        f'{label:<24} p50={statistics.median(timings) * 1000:8.2f} ms  '
+        f'p95={timings[int(len(timings) * 0.95) - 1] * 1000:8.2f} ms  '
+        f'max={timings[-1] * 1000:8.2f} ms'
+    )
+
+
+def bench_memory(rows, repeats):
+    started = time.perf_counter()
+    index = MediaSearchIndex().build(generate_rows(rows))
+    print(f'Индекс на {rows} записей построен за {time.perf_counter() - started:.1f} с, '
+          f'термов: {len(index.terms)}')
+
+    for search_query in QUERIES:
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            index.search(search_query, limit=100)
+            timings.append(time.perf_counter() - started)
+        _report(search_query, timings)
+
+
+def bench_postgres(repeats):
+    from app import create_app
+    from app.models import Media
+    from app.utils.search import apply_search
+
+    app = create_app()
+    with app.app_context():
+        app.config['SEARCH_BACKEND'] = 'postgres'
+        print(f'Записей в каталоге: {Media.query.count()}')
+        for search_query in QUERIES:
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                query, rank = apply_search(Media.query, search_query)
+                query.order_by(rank.desc()).limit(100).all()
+                timings.append(time.perf_counter() - started)
+            _report(search_query, timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--postgres', action='store_true', help='замер на базе из DATABASE_URL')
+    args = parser.parse_args()
+
+    if args.postgres:
+        bench_postgres(args.repeats)
+    else:
+        bench_memory(args.rows, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Пропускная способность /uploads: отдача файла Flask против X-Accel-Redirect
+
+Запуск из каталога backend:
+    python -m benchmarks.uploads --size 65536 --requests 5000
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from benchmarks.common import create_bench_app
+
+
+def run(mode, folder, filename, requests, headers=None):
+    app = create_bench_app(
+        UPLOAD_FOLDER=folder,
+        UPLOADS_SERVE_MODE=mode,
+        USE_X_SENDFILE=mode == 'x-sendfile'
+    )
+    client = app.test_client()
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(f'/uploads/{filename}', headers=headers)
+        assert response.status_code in (200, 304)
+        response.get_data()
+        response.close()
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=64 * 1024, help='размер файла в байтах')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    filename = f'avatar_{hashlib.sha256(data).hexdigest()}_256.webp'
+
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, filename), 'wb') as f:
+            f.write(data)
+
+        etag = f'"{hashlib.sha256(data).hexdigest()}"'
+        results = [
+            ('Flask, полный ответ', run('flask', folder, filename, args.requests)),
+            ('Flask, 304 по ETag', run('flask', folder, filename, args.requests, {'If-None-Match': etag})),
+            ('X-Sendfile', run('x-sendfile', folder, filename, args.requests)),
+            ('X-Accel-Redirect', run('x-accel', folder, filename, args.requests))
+        ]
+
+    baseline = results[0][1]
+    for name, rate in results:
+        print(f'{name:<22} {rate:9.0f} запросов/с (x{rate / baseline:.1f})')
+
+
+if __name__ == '__main__':
+    main()
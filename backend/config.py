@@ -10,3 +10,35 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY')
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+    # Адрес сайта для абсолютных ссылок (https://poketroid.example/); без него берётся заголовок Host
+    PUBLIC_URL = os.environ.get('PUBLIC_URL')
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_MEMORY_LIMIT = int(os.environ.get('SEARCH_MEMORY_LIMIT', 1000))
+    JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 4096))
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+    BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+    # не больше половины потоков веб-сервера ждут bcrypt
+    BCRYPT_QUEUE_SIZE = int(os.environ.get('BCRYPT_QUEUE_SIZE', max(WEB_THREADS // 2 - BCRYPT_WORKERS, 0)))
+    BCRYPT_QUEUE_TIMEOUT = float(os.environ.get('BCRYPT_QUEUE_TIMEOUT', 0))
+    CATALOG_VERSION_TTL = float(os.environ.get('CATALOG_VERSION_TTL', 5))
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+    COMMUNITY_CACHE_TTL = float(os.environ.get('COMMUNITY_CACHE_TTL', 30))
+    MEDIA_CACHE_SIZE = int(os.environ.get('MEDIA_CACHE_SIZE', 10000))
+    MEDIA_DETAIL_MAX_AGE = int(os.environ.get('MEDIA_DETAIL_MAX_AGE', 300))
+    LIST_BATCH_LIMIT = int(os.environ.get('LIST_BATCH_LIMIT', 500))
+    COVER_MAX_BYTES = int(os.environ.get('COVER_MAX_BYTES', 10 * 1024 * 1024))
+    COVER_FETCH_TIMEOUT = float(os.environ.get('COVER_FETCH_TIMEOUT', 10))
+    COVER_ORIGIN_OVERRIDE = os.environ.get('COVER_ORIGIN_OVERRIDE')
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 4 * 1024 * 1024))
+    AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', 2))
+    UPLOADS_SERVE_MODE = os.environ.get('UPLOADS_SERVE_MODE', 'flask')
+    UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')
+    USE_X_SENDFILE = UPLOADS_SERVE_MODE == 'x-sendfile'
+    FRIEND_GRAPH_TTL = int(os.environ.get('FRIEND_GRAPH_TTL', 300))
+    # /metrics включается явно; с METRICS_TOKEN отдаётся только с заголовком Authorization: Bearer <токен>
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log')
+    SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
@@ -0,0 +1,48 @@
+-- Перевод уже существующей базы Postgres на текущую схему: новые колонки
+-- media и индексы под горячие запросы маршрутов
+--
+-- db.create_all() создаёт индексы только вместе с таблицами. Для рабочей
+-- базы сначала выполняется db.create_all() (создаст только недостающие
+-- таблицы с их индексами), затем этот файл — один раз через psql вне
+-- транзакции (CONCURRENTLY не блокирует запись в таблицы):
+--     psql "$DATABASE_URL" -f sql/hot_query_indexes.sql
+-- Повторный запуск безопасен. Если построение прервалось, недостроенный
+-- индекс остаётся INVALID: его нужно удалить (DROP INDEX CONCURRENTLY)
+-- и запустить файл снова.
+--
+-- Определения совпадают с app/models.py, это проверяет
+-- tests/test_query_plans.py. Что индексы действительно используются,
+-- проверяет python -m benchmarks.explain.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Естественный ключ загрузчика каталога, хеши содержимого и обложки
+ALTER TABLE media ADD COLUMN IF NOT EXISTS source VARCHAR(20);
+ALTER TABLE media ADD COLUMN IF NOT EXISTS external_id VARCHAR(64);
+ALTER TABLE media ADD COLUMN IF NOT EXISTS content_hash VARCHAR(40);
+ALTER TABLE media ADD COLUMN IF NOT EXISTS cover_hash VARCHAR(64);
+
+-- Ключ upsert загрузчика (ON CONFLICT (source, external_id)); у старых
+-- записей ключ пустой, его проставляет python app/utils/load_db.py --backfill-only
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_media_source_external_id ON media (source, external_id);
+
+-- Каталог: сортировки popularity и newest, без фильтра по типу и с ним
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_rating_count ON media (external_rating_count DESC NULLS LAST, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_release_year ON media (release_year DESC NULLS LAST, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_type_popularity ON media (type, external_rating_count DESC NULLS LAST, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_type_release_year ON media (type, release_year DESC NULLS LAST, id DESC);
+
+-- Полнотекстовый поиск по каталогу и поиск по подстроке названия и автора
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_search ON media USING gin (((setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || setweight(to_tsvector('russian'::regconfig, coalesce(author, '')), 'B')) || setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'C')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_title_trgm ON media USING gin (title gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_author_trgm ON media USING gin (author gin_trgm_ops);
+
+-- Поиск пользователей по подстроке
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_display_name_trgm ON users USING gin (display_name gin_trgm_ops);
+
+-- Избранное и списки профиля
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_media_lists_user_list_added ON user_media_lists (user_id, list_type, added_at DESC);
+
+-- Входящая сторона дружб: первичный ключ начинается с user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_friendships_friend_id_status ON friendships (friend_id, status);
@@ -0,0 +1,96 @@
+import pytest
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Media, User
+from app.utils import catalog, search
+from app.utils.auth import generate_token
+from config import Config
+
+
+class AppTestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SECRET_KEY = 'test'
+    BCRYPT_ROUNDS = 4
+    CATALOG_VERSION_TTL = 0
+    SEARCH_BACKEND = 'memory'
+    SLOW_QUERY_LOG = None
+    METRICS_ENABLED = True
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog, '_version', None)
+    monkeypatch.setattr(search, '_index', None)
+    monkeypatch.setattr(search, '_index_version', None)
+
+    app = create_app(type('Config', (AppTestConfig,), {'UPLOAD_FOLDER': str(tmp_path)}))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username, **fields):
+        user = User(username=username, password_hash='-', **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def auth_headers(app):
+    def auth_headers(user):
+        return {'Authorization': f'Bearer {generate_token(user.id)}'}
+    return auth_headers
+
+
+@pytest.fixture
+def make_media(app):
+    def make_media(count, **fields):
+        items = [
+            Media(
+                title=f'Произведение {i}',
+                type=('movie', 'anime', 'book')[i % 3],
+                release_year=2000 + i % 20,
+                external_rating=5 + i % 5,
+                external_rating_count=i * 10,
+                **fields
+            )
+            for i in range(count)
+        ]
+        db.session.add_all(items)
+        db.session.commit()
+        return items
+    return make_media
+
+
+@pytest.fixture
+def count_queries(app):
+    """Число SQL-запросов внутри блока: with count_queries() as queries: ..."""
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return count_queries
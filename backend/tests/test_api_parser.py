@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+pytest.importorskip('gql.transport.requests')
+pytest.importorskip('fake_useragent')
+
+# api_parser запускается как скрипт из app/utils и импортирует соседние модули напрямую
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app', 'utils'))
+
+from api_parser import KinopoiskCrawler  # noqa: E402
+
+
+PAGES = 6
+PAGE_LIMIT = 3
+
+
+class KinopoiskStub:
+    """Локальная замена Kinopoisk API: страницы фильмов и заданные сбои"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.failures = {}
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                page = int(query['page'][0])
+                limit = int(query['limit'][0])
+                with stub.lock:
+                    stub.requests[page] += 1
+                    failures = stub.failures.get(page)
+                    status = failures.pop(0) if failures else 200
+
+                if status != 200:
+                    self.send_response(status)
+                    self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    return
+
+                docs = [
+                    {'id': (page - 1) * limit + i, 'name': f'Фильм {page}-{i}', 'rating': {'kp': 7.5}}
+                    for i in range(limit)
+                ]
+                body = json.dumps({'docs': docs, 'page': page, 'pages': PAGES}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1.4/movie'
+
+
+@pytest.fixture
+def kinopoisk():
+    stub = KinopoiskStub()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def _crawl(kinopoisk, tmp_path, **options):
+    crawler = KinopoiskCrawler(
+        'test-key',
+        tmp_path / 'movies.jsonl',
+        tmp_path / 'movies.checkpoint.json',
+        base_url=kinopoisk.url,
+        concurrency=3,
+        rate=1000.0,
+        backoff=0,
+        page_limit=PAGE_LIMIT,
+        **options
+    )
+    return asyncio.run(crawler.run())
+
+
+def _written_ids(tmp_path):
+    with open(tmp_path / 'movies.jsonl', encoding='utf-8') as f:
+        return [json.loads(line)['external_id'] for line in f]
+
+
+def _done_pages(tmp_path):
+    return json.loads((tmp_path / 'movies.checkpoint.json').read_text(encoding='utf-8'))['done']
+
+
+def test_crawl_writes_every_page(kinopoisk, tmp_path):
+    written = _crawl(kinopoisk, tmp_path)
+
+    assert written == PAGES * PAGE_LIMIT
+    assert sorted(_written_ids(tmp_path)) == list(range(PAGES * PAGE_LIMIT))
+    assert _done_pages(tmp_path) == list(range(1, PAGES + 1))
+    assert all(count == 1 for count in kinopoisk.requests.values())
+
+
+def test_crawl_retries_throttled_and_failed_pages(kinopoisk, tmp_path):
+    kinopoisk.failures = {2: [429, 503], 4: [500]}
+
+    written = _crawl(kinopoisk, tmp_path, retries=2)
+
+    assert written == PAGES * PAGE_LIMIT
+    assert kinopoisk.requests[2] == 3
+    assert kinopoisk.requests[4] == 2
+
+
+def test_crawl_resumes_from_checkpoint(kinopoisk, tmp_path):
+    kinopoisk.failures = {3: [404]}
+
+    _crawl(kinopoisk, tmp_path, max_pages=4)
+    assert _done_pages(tmp_path) == [1, 2, 4]
+
+    _crawl(kinopoisk, tmp_path)
+
+    ids = _written_ids(tmp_path)
+    assert sorted(ids) == list(range(PAGES * PAGE_LIMIT))
+    assert _done_pages(tmp_path) == list(range(1, PAGES + 1))
+    assert kinopoisk.requests[1] == 1
+    assert kinopoisk.requests[3] == 2
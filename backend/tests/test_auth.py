@@ -0,0 +1,41 @@
+import threading
+import time
+
+import pytest
+
+from app.models import db, User
+from app.utils.passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_hasher_fails_fast_when_full():
+    hasher = PasswordHasher(workers=1, queue_size=0, timeout=0)
+    release = threading.Event()
+    worker = threading.Thread(target=hasher.run, args=(release.wait,))
+    worker.start()
+    time.sleep(0.05)
+
+    started = time.perf_counter()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(lambda: None)
+    assert time.perf_counter() - started < 0.05
+
+    release.set()
+    worker.join()
+    assert hasher.run(lambda: 42) == 42
+
+
+def test_login_survives_rehash_commit_failure(app, client, monkeypatch):
+    user = User(username='alice')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    app.config['BCRYPT_ROUNDS'] = 5
+
+    def failing_commit():
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    response = client.post('/api/auth/login', json={'username': 'alice', 'password': 'password123'})
+
+    assert response.status_code == 200
+    assert response.get_json()['username'] == 'alice'
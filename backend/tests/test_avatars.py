@@ -0,0 +1,113 @@
+import io
+import os
+import threading
+
+import pytest
+
+from PIL import Image
+
+from app.models import db, User
+from app.utils import avatars
+
+
+def _png(size=(300, 200)):
+    data = io.BytesIO()
+    Image.new('RGB', size, (10, 120, 200)).save(data, 'PNG')
+    return data.getvalue()
+
+
+def _upload(client, headers, data):
+    return client.post(
+        '/api/users/avatar',
+        data={'file': (io.BytesIO(data), 'avatar.png')},
+        headers=headers,
+        content_type='multipart/form-data'
+    )
+
+
+def _wait_for_processing(app):
+    app.extensions['avatar_executor'].shutdown(wait=True)
+    del app.extensions['avatar_executor']
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('alice', avatar_filename='old.png')
+
+
+def test_truncated_image_is_rejected(client, user, auth_headers):
+    response = _upload(client, auth_headers(user), _png()[:200])
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid image'}
+
+
+def test_oversized_image_is_rejected(client, user, auth_headers):
+    response = _upload(client, auth_headers(user), _png((3000, 3000)))
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid image'}
+
+
+def test_pixels_are_decoded_only_in_worker(app, client, user, auth_headers, monkeypatch):
+    data = _png()
+    decoded = []
+    load = Image.Image.load
+
+    def tracking_load(image):
+        decoded.append(threading.current_thread().name)
+        return load(image)
+
+    monkeypatch.setattr(Image.Image, 'load', tracking_load)
+    response = _upload(client, auth_headers(user), data)
+    assert response.status_code == 200
+    _wait_for_processing(app)
+
+    assert decoded
+    assert all(name.startswith('avatars') for name in decoded)
+
+
+def test_original_is_served_until_sizes_are_ready(app, client, user, auth_headers, monkeypatch):
+    user_id = user.id
+    release = threading.Event()
+    render = avatars._render_avatars
+
+    def slow_render(*args):
+        release.wait(5)
+        render(*args)
+
+    monkeypatch.setattr(avatars, '_render_avatars', slow_render)
+    data = _png()
+    filename = _upload(client, auth_headers(user), data).get_json()['avatar_url']
+
+    response = client.get(f'/uploads/{filename}')
+    assert response.status_code == 200
+    assert response.data == data
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    db.session.expire_all()
+    assert db.session.get(User, user_id).avatar_filename == 'old.png'
+
+    release.set()
+    _wait_for_processing(app)
+
+    db.session.expire_all()
+    assert db.session.get(User, user_id).avatar_filename == filename
+    response = client.get(f'/uploads/{filename}')
+    assert Image.open(io.BytesIO(response.data)).format == 'WEBP'
+    assert not any('_original.' in name for name in os.listdir(app.config['UPLOAD_FOLDER']))
+
+
+def test_failed_processing_keeps_previous_avatar(app, client, user, auth_headers, monkeypatch):
+    user_id = user.id
+
+    def broken_render(*args):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(avatars, '_render_avatars', broken_render)
+    filename = _upload(client, auth_headers(user), _png()).get_json()['avatar_url']
+    _wait_for_processing(app)
+
+    db.session.expire_all()
+    assert db.session.get(User, user_id).avatar_filename == 'old.png'
+    assert client.get(f'/uploads/{filename}').status_code == 404
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
@@ -0,0 +1,151 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from app import db
+from app.models import Media
+from app.utils import covers
+
+
+def _jpeg():
+    data = io.BytesIO()
+    Image.new('RGB', (800, 1200), (200, 40, 40)).save(data, 'JPEG')
+    return data.getvalue()
+
+
+@pytest.fixture
+def cover_origin(app):
+    """Локальная замена внешнего хоста обложек"""
+    image = _jpeg()
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            time.sleep(0.1)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(image)))
+            self.end_headers()
+            self.wfile.write(image)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.hits = hits
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config['COVER_ORIGIN_OVERRIDE'] = f'http://127.0.0.1:{server.server_port}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_catalog_cover_urls_follow_request_host(client, make_media):
+    make_media(3, cover_url='https://images.example/cover.jpg')
+
+    for host in ('http://first.example', 'https://second.example'):
+        items = client.get('/api/media/', base_url=host).get_json()['items']
+        assert all(item['cover_url'].startswith(f'{host}/api/media/') for item in items)
+
+
+def test_host_header_does_not_grow_response_cache(app, client, make_media):
+    make_media(3, cover_url='https://images.example/cover.jpg')
+    client.get('/api/media/')
+    size = app.extensions['response_cache'].stats()['size']
+
+    for i in range(20):
+        client.get('/api/media/', base_url=f'http://random-{i}.example')
+
+    assert app.extensions['response_cache'].stats()['size'] == size
+
+
+def test_public_url_replaces_request_host(app, client, make_media):
+    make_media(3, cover_url='https://images.example/cover.jpg')
+    app.config['PUBLIC_URL'] = 'https://poketroid.example/'
+
+    for host in ('http://first.example', 'http://evil.example'):
+        response = client.get('/api/media/', base_url=host)
+        items = response.get_json()['items']
+        assert all(item['cover_url'].startswith('https://poketroid.example/api/media/') for item in items)
+    assert app.extensions['response_cache'].stats()['hits'] > 0
+
+
+def test_cover_is_downloaded_and_stored(app, client, make_media, cover_origin):
+    media_id = make_media(1, cover_url='https://images.example/covers/1.jpg')[0].id
+
+    response = client.get(f'/api/media/{media_id}/cover?size=160')
+
+    assert response.status_code == 302
+    cover_hash = db.session.get(Media, media_id).cover_hash
+    assert response.headers['Location'].endswith(covers.thumbnail_filename(cover_hash, 160))
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], 'covers')
+    assert sorted(os.listdir(folder)) == sorted(
+        covers.thumbnail_filename(cover_hash, size) for size in covers.COVER_SIZES
+    )
+
+
+def test_cover_save_error_falls_back_to_original(app, client, make_media, cover_origin, monkeypatch):
+    media_id = make_media(1, cover_url='https://images.example/covers/1.jpg')[0].id
+
+    def replace(src, dst):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(covers.os, 'replace', replace)
+    response = client.get(f'/api/media/{media_id}/cover')
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://images.example/covers/1.jpg'
+    assert db.session.get(Media, media_id).cover_hash is None
+    assert os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], 'covers')) == []
+
+
+def test_concurrent_store_of_same_cover(tmp_path):
+    data = _jpeg()
+    errors = []
+
+    def store():
+        try:
+            covers.store_cover(data, str(tmp_path))
+        except covers.CoverError as e:
+            errors.append(e)
+
+    for _ in range(5):
+        for name in os.listdir(tmp_path):
+            os.remove(tmp_path / name)
+        threads = [threading.Thread(target=store) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+    assert errors == []
+    assert len(os.listdir(tmp_path)) == len(covers.COVER_SIZES)
+    for name in os.listdir(tmp_path):
+        Image.open(tmp_path / name).verify()
+
+
+def test_cold_cover_burst_fetches_origin_once(app, make_media, cover_origin):
+    media_id = make_media(1, cover_url='https://images.example/covers/1.jpg')[0].id
+    locations = []
+
+    def request_cover():
+        locations.append(app.test_client().get(f'/api/media/{media_id}/cover').headers['Location'])
+
+    threads = [threading.Thread(target=request_cover) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert cover_origin.hits == ['/covers/1.jpg']
+    assert len(locations) == 6
+    assert len(set(locations)) == 1 and '/uploads/covers/' in locations[0]
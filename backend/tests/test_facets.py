@@ -0,0 +1,32 @@
+from app.models import db, Media
+from app.utils.facets import get_catalog_facets
+
+
+def test_rating_buckets_are_floored(app):
+    db.session.add_all([
+        Media(title='Дюна', type='book', release_year=1965, external_rating=8.6),
+        Media(title='Солярис', type='book', release_year=1961, external_rating=7.9),
+        Media(title='Сталкер', type='movie', release_year=1979, external_rating=9.4)
+    ])
+    db.session.commit()
+
+    facets = get_catalog_facets('')
+
+    assert facets['rating'] == {'7': 1, '8': 1, '9': 1}
+    assert facets['year'] == {'1960': 2, '1970': 1}
+    assert facets['capped'] is False
+
+
+def test_memory_search_facets_are_marked_capped(app, make_media):
+    make_media(30)
+
+    app.config['SEARCH_MEMORY_LIMIT'] = 10
+    capped = get_catalog_facets('произведение')
+    assert capped['capped'] is True
+    assert sum(capped['type'].values()) == 10
+
+    app.config['SEARCH_MEMORY_LIMIT'] = 100
+    app.extensions.pop('response_cache')
+    full = get_catalog_facets('произведение')
+    assert full['capped'] is False
+    assert sum(full['type'].values()) == 30
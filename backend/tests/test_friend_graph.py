@@ -0,0 +1,48 @@
+import threading
+
+from app.utils import friend_graph
+from app.utils.friend_graph import FriendGraph, friend_graph_added, get_friend_graph
+
+
+def test_stale_graph_is_served_while_one_thread_rebuilds(app, monkeypatch):
+    app.config['FRIEND_GRAPH_TTL'] = 0
+    stale = FriendGraph().build([(1, 2)])
+    app.extensions['friend_graph'] = (stale, 0)
+
+    release = threading.Event()
+    loads = []
+
+    def load_friend_graph():
+        loads.append(threading.current_thread().name)
+        release.wait(5)
+        return FriendGraph().build([(1, 2), (2, 3)])
+
+    # Фоновая сборка, как с настоящим пулом соединений
+    monkeypatch.setattr(friend_graph, 'StaticPool', type('NoPool', (), {}))
+    monkeypatch.setattr(friend_graph, 'load_friend_graph', load_friend_graph)
+
+    served = []
+
+    def request():
+        with app.app_context():
+            served.append(get_friend_graph())
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert served == [stale] * 8
+    assert loads == ['friend-graph']
+
+    friend_graph_added(3, 4)
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'friend-graph':
+            thread.join(5)
+
+    graph = app.extensions['friend_graph'][0]
+    assert graph is not stale
+    assert list(graph.friends(3)) == [2, 4]
+    assert 'friend_graph_changes' not in app.extensions
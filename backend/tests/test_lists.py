@@ -0,0 +1,89 @@
+import pytest
+
+from app.routes import media as media_routes
+from app.utils.user_stats import get_profile_stats, rebuild_user_stats
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'items', 42, {'items': []}, {'items': 'x'}])
+def test_batch_rejects_malformed_body(client, make_user, auth_headers, body):
+    headers = auth_headers(make_user('alice'))
+    response = client.post('/api/media/list/batch', json=body, headers=headers)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Missing items'}
+
+
+def test_batch_rejects_non_json_body(client, make_user, auth_headers):
+    headers = auth_headers(make_user('alice'))
+    response = client.post('/api/media/list/batch', data='not json', headers=headers)
+
+    assert response.status_code == 400
+
+
+def test_batch_applies_operations(client, make_user, make_media, auth_headers):
+    headers = auth_headers(make_user('alice'))
+    first, second = [media.id for media in make_media(2)]
+
+    response = client.post('/api/media/list/batch', headers=headers, json={'items': [
+        {'media_id': first, 'list_type': 'planned', 'operation': 'add'},
+        {'media_id': second, 'list_type': 'favorite'},
+        {'media_id': first, 'list_type': 'completed'}
+    ]})
+
+    assert response.status_code == 200
+    statuses = response.get_json()['statuses']
+    assert statuses[str(first)] == {'is_planned': False, 'is_completed': True, 'is_favorite': False}
+    assert statuses[str(second)]['is_favorite'] is True
+
+
+def test_community_catalog_follows_list_edits(app, client, make_user, make_media, auth_headers, monkeypatch):
+    headers = auth_headers(make_user('alice'))
+    first, second = [media.id for media in make_media(2)]
+    now = [1000.0]
+    monkeypatch.setattr(media_routes.time, 'monotonic', lambda: now[0])
+
+    def community_ids():
+        return [item['id'] for item in client.get('/api/media/?sort_by=community').get_json()['items']]
+
+    client.post('/api/media/list', headers=headers, json={'media_id': first, 'list_type': 'favorite'})
+    assert community_ids() == [first, second]
+
+    client.post('/api/media/list', headers=headers, json={'media_id': second, 'list_type': 'favorite'})
+    client.post('/api/media/list', headers=headers, json={'media_id': second, 'list_type': 'planned'})
+    assert community_ids() == [first, second]
+
+    now[0] += app.config['COMMUNITY_CACHE_TTL']
+    assert community_ids() == [second, first]
+
+
+def test_stats_follow_add_remove_and_move(client, make_user, make_media, auth_headers):
+    user = make_user('alice')
+    headers = auth_headers(user)
+    movie, anime, book = make_media(3, duration=100)
+
+    def post(media, list_type, operation):
+        body = {'media_id': media.id, 'list_type': list_type, 'operation': operation}
+        assert client.post('/api/media/list', headers=headers, json=body).status_code == 200
+
+    post(movie, 'planned', 'add')
+    post(anime, 'completed', 'add')
+    post(book, 'completed', 'add')
+    # перенос из запланированного в завершённое
+    post(movie, 'completed', 'add')
+    post(book, 'completed', 'remove')
+    response = client.post('/api/media/list/batch', headers=headers, json={'items': [
+        {'media_id': book.id, 'list_type': 'planned', 'operation': 'add'},
+        {'media_id': anime.id, 'list_type': 'planned', 'operation': 'add'}
+    ]})
+    assert response.status_code == 200
+
+    stats, durations = get_profile_stats(user.id)
+    assert stats == {
+        'movies': {'completed': 1, 'planned': 0},
+        'anime': {'completed': 0, 'planned': 1},
+        'books': {'completed': 0, 'planned': 1}
+    }
+    assert durations == {'movies': {'completed': 100}, 'anime': {'completed': 0}, 'books': {'completed': 0}}
+
+    rebuild_user_stats([user.id])
+    assert get_profile_stats(user.id) == (stats, durations)
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from app.models import db, Media
+from app.utils.user_stats import get_profile_stats
+
+# Загрузчик создаёт движок при импорте; база для тестов подставляется в фикстуре
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app.utils import load_db  # noqa: E402
+
+
+@pytest.fixture
+def loader(app, monkeypatch):
+    session = Session(bind=db.engine)
+    monkeypatch.setattr(load_db, 'session', session)
+    yield load_db
+    session.close()
+
+
+def _write(tmp_path, data):
+    path = tmp_path / 'media_data.json'
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def _movie(external_id=None, **fields):
+    movie = {
+        'title': 'Сталкер',
+        'description': 'Зона',
+        'release_year': 1979,
+        'external_rating': 8.1,
+        'external_rating_count': 120000,
+        'duration': 163,
+        'cover_url': 'https://images.example/stalker.jpg',
+        **fields
+    }
+    if external_id is not None:
+        movie['external_id'] = external_id
+    return movie
+
+
+def test_reimport_is_idempotent(loader, tmp_path):
+    path = _write(tmp_path, {'movies': [_movie(1), _movie(2, title='Солярис', release_year=1972)]})
+
+    assert loader.import_from_json(path)['inserted'] == 2
+    counts = loader.import_from_json(path)
+
+    assert counts == {'inserted': 0, 'updated': 0, 'unchanged': 2, 'failed': 0}
+    assert Media.query.count() == 2
+
+
+def test_legacy_rows_are_rekeyed_to_source_ids(loader, tmp_path):
+    legacy = Media(title='Сталкер', type='movie', release_year=1979, external_rating=7.9)
+    db.session.add(legacy)
+    db.session.commit()
+    legacy_id = legacy.id
+
+    assert loader.backfill_natural_keys() == (1, 0)
+    counts = loader.import_from_json(_write(tmp_path, {'movies': [_movie(4374)]}))
+
+    assert counts == {'inserted': 0, 'updated': 1, 'unchanged': 0, 'failed': 0}
+    db.session.expire_all()
+    media = Media.query.one()
+    assert media.id == legacy_id
+    assert (media.source, media.external_id) == ('kinopoisk', '4374')
+    assert media.external_rating == 8.1
+
+
+def test_import_refreshes_stats_of_affected_users(loader, tmp_path, client, make_user, auth_headers):
+    path = _write(tmp_path, {'movies': [_movie(1), _movie(2, title='Солярис', release_year=1972, duration=167)]})
+    loader.import_from_json(path)
+    stalker, solaris = Media.query.order_by(Media.id).all()
+
+    alice, bob = make_user('alice'), make_user('bob')
+    for user, media, list_type in ((alice, stalker, 'completed'), (alice, solaris, 'completed'), (bob, solaris, 'planned')):
+        response = client.post('/api/media/list', headers=auth_headers(user), json={
+            'media_id': media.id, 'list_type': list_type, 'operation': 'add'
+        })
+        assert response.status_code == 200
+
+    stats, durations = get_profile_stats(alice.id)
+    assert stats['movies'] == {'completed': 2, 'planned': 0}
+    assert durations['movies'] == {'completed': 163 + 167}
+    assert get_profile_stats(bob.id)[0]['movies'] == {'completed': 0, 'planned': 1}
+
+    counts = loader.import_from_json(_write(tmp_path, {'movies': [_movie(1, duration=170)]}))
+
+    assert counts['updated'] == 1
+    db.session.expire_all()
+    assert get_profile_stats(alice.id)[1]['movies'] == {'completed': 170 + 167}
+    assert get_profile_stats(bob.id)[0]['movies'] == {'completed': 0, 'planned': 1}
@@ -0,0 +1,45 @@
+from app import create_app, db
+from tests.conftest import AppTestConfig
+
+
+def _count(body, name):
+    return int(next(line for line in body.splitlines() if line.startswith(name)).split()[-1])
+
+
+def test_metrics_count_statements_and_connection_hold(client, make_media):
+    media_id = make_media(1)[0].id
+    client.get(f'/api/media/{media_id}')
+
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'poketroid_db_statements_per_request_count{endpoint="media.get_media_details"} 1' in body
+    assert _count(body, 'poketroid_db_pool_connection_hold_seconds_count') > 0
+    assert _count(body, 'poketroid_db_pool_checkout_wait_seconds_count') > 0
+
+
+def test_checkout_wait_survives_engine_dispose(app):
+    metrics = app.extensions['metrics']
+    db.session.remove()
+    db.engine.dispose()
+    before = _count(metrics.render({}), 'poketroid_db_pool_checkout_wait_seconds_count')
+
+    with db.engine.connect():
+        pass
+
+    assert _count(metrics.render({}), 'poketroid_db_pool_checkout_wait_seconds_count') > before
+
+
+def test_metrics_token_is_required_when_set():
+    app = create_app(type('Config', (AppTestConfig,), {'METRICS_TOKEN': 'secret'}))
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_can_be_disabled():
+    app = create_app(type('Config', (AppTestConfig,), {'METRICS_ENABLED': False}))
+
+    assert 'metrics' not in app.extensions
+    assert app.test_client().get('/metrics').status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+
+from app.models import db, Media, MediaPopularity
+from app.routes import media as media_routes
+
+
+@pytest.fixture
+def catalog(app, monkeypatch):
+    monkeypatch.setattr(media_routes, 'CATALOG_PER_PAGE', 7)
+    # Много одинаковых значений и NULL в колонках сортировки
+    db.session.add_all([
+        Media(
+            title=f'Произведение {i}',
+            type=('movie', 'anime', 'book')[i % 3],
+            release_year=None if i % 4 == 0 else 2000 + i % 3,
+            external_rating_count=None if i % 5 == 0 else i % 4 * 100
+        )
+        for i in range(60)
+    ])
+    db.session.flush()
+    # У части произведений нет строки популярности, у части счёт 0
+    db.session.add_all([
+        MediaPopularity(media_id=media.id, media_type=media.type, score=media.id % 3 * 5)
+        for media in Media.query.filter(Media.id % 4 != 0)
+    ])
+    db.session.commit()
+
+
+def _offset_ids(client, **params):
+    ids = []
+    page = 1
+    while True:
+        data = client.get('/api/media/', query_string={**params, 'page': page}).get_json()
+        ids += [item['id'] for item in data['items']]
+        if page >= data['total_pages']:
+            return ids
+        page += 1
+
+
+def _cursor_ids(client, **params):
+    ids = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get('/api/media/', query_string={**params, 'cursor': cursor})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['items']) <= 7
+        ids += [item['id'] for item in data['items']]
+        cursor = data['next_cursor']
+    return ids
+
+
+@pytest.mark.parametrize('params', [
+    {'sort_by': 'popularity'},
+    {'sort_by': 'newest'},
+    {'sort_by': 'newest', 'type': 'book'},
+    {'sort_by': 'community'},
+    {'sort_by': 'community', 'type': 'anime'}
+])
+def test_cursor_walk_matches_offset_pages(client, catalog, params):
+    offset_ids = _offset_ids(client, **params)
+    cursor_ids = _cursor_ids(client, **params)
+
+    expected = Media.query.filter_by(type=params['type']).count() if 'type' in params else Media.query.count()
+    assert len(set(offset_ids)) == len(offset_ids) == expected
+    assert cursor_ids == offset_ids
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', 'WzEsMiwzXQ', 'WyJuZXdlc3QiLDEwMCwxXQ'])
+def test_malformed_cursor_is_rejected(client, catalog, cursor):
+    response = client.get('/api/media/', query_string={'sort_by': 'popularity', 'cursor': cursor})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
@@ -0,0 +1,32 @@
+from app.models import db, MediaPopularity, UserMediaList
+from app.utils.popularity import reconcile_popularity
+
+
+def _popularity():
+    db.session.expire_all()
+    return {
+        row.media_id: (row.planned, row.completed, row.favorite, row.score)
+        for row in MediaPopularity.query
+    }
+
+
+def test_reconcile_fixes_drift_and_creates_missing_rows(make_user, make_media):
+    user = make_user('alice')
+    media_ids = [media.id for media in make_media(7)]
+    db.session.add_all([
+        UserMediaList(user_id=user.id, media_id=media_ids[0], list_type='favorite'),
+        UserMediaList(user_id=user.id, media_id=media_ids[0], list_type='completed'),
+        UserMediaList(user_id=user.id, media_id=media_ids[5], list_type='planned'),
+        MediaPopularity(media_id=media_ids[0], media_type='movie', favorite=4, score=12),
+        MediaPopularity(media_id=media_ids[3], media_type='movie', planned=2, score=2)
+    ])
+    db.session.commit()
+
+    # 5 строк заведено, 3 исправлено, одна из них — только что заведённая
+    assert reconcile_popularity(batch_size=3) == 5 + 3
+
+    expected = {media_id: (0, 0, 0, 0) for media_id in media_ids}
+    expected[media_ids[0]] = (0, 1, 1, 5)
+    expected[media_ids[5]] = (1, 0, 0, 1)
+    assert _popularity() == expected
+    assert reconcile_popularity(batch_size=3) == 0
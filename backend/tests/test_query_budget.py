@@ -0,0 +1,69 @@
+import json
+import logging
+
+import pytest
+
+from app.models import db, Media
+from app.utils import query_budget as budget_module
+from app.utils.query_budget import query_budget, QueryBudgetExceeded
+
+
+def test_budget_raises_in_testing(app, client, make_media):
+    make_media(2)
+
+    @query_budget(1)
+    def over_budget():
+        Media.query.count()
+        Media.query.first()
+        return 'ok'
+
+    app.add_url_rule('/over-budget', view_func=over_budget)
+
+    with pytest.raises(QueryBudgetExceeded, match='executed 2 SQL statements, budget is 1'):
+        client.get('/over-budget')
+
+
+def _slow_entries(caplog):
+    return [
+        json.loads(record.getMessage())
+        for record in caplog.records
+        if record.getMessage().startswith('{"duration_ms"')
+    ]
+
+
+def test_slow_queries_go_to_app_log_with_plan(app, client, make_media, caplog, monkeypatch):
+    media_id = make_media(1)[0].id
+    monkeypatch.setattr(app.extensions['query_budget'], 'slow_seconds', 1e-9)
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get(f'/api/media/{media_id}')
+
+    assert response.status_code == 200
+    entries = _slow_entries(caplog)
+    assert entries and all(entry['endpoint'] == 'media.get_media_details' for entry in entries)
+    assert any('SEARCH media' in entry['plan'] for entry in entries)
+
+
+def test_failed_explain_does_not_break_request(app, client, make_media, caplog, monkeypatch):
+    media_id = make_media(1)[0].id
+    monkeypatch.setattr(app.extensions['query_budget'], 'slow_seconds', 1e-9)
+    monkeypatch.setitem(budget_module.EXPLAIN_PREFIXES, 'sqlite', 'EXPLAIN NONSENSE ')
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get(f'/api/media/{media_id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['id'] == media_id
+    assert all(entry['plan'].startswith('EXPLAIN failed') for entry in _slow_entries(caplog))
+    assert db.session.get(Media, media_id) is not None
+
+
+def test_catalog_search_with_facets_fits_budget(app, client, make_media, count_queries):
+    make_media(30)
+
+    with count_queries() as statements:
+        response = client.get('/api/media/', query_string={'query': 'произведение', 'facets': '1'})
+
+    assert response.status_code == 200
+    assert response.get_json()['facets']['capped'] is False
+    assert sum('catalog_state' in statement for statement in statements) == 1
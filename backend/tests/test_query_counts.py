@@ -0,0 +1,78 @@
+import pytest
+
+from app.models import db, UserMediaList
+
+
+@pytest.fixture
+def library(make_user, make_media, auth_headers):
+    """Пользователь с 20 произведениями в избранном и 10 в планах"""
+    user = make_user('alice')
+    media_ids = [media.id for media in make_media(60)]
+    db.session.add_all(
+        UserMediaList(user_id=user.id, media_id=media_id, list_type='favorite')
+        for media_id in media_ids[:20]
+    )
+    db.session.add_all(
+        UserMediaList(user_id=user.id, media_id=media_id, list_type='planned')
+        for media_id in media_ids[20:30]
+    )
+    db.session.commit()
+    return user.id, media_ids, auth_headers(user)
+
+
+def test_catalog_statuses_in_one_query(client, library, count_queries):
+    user_id, media_ids, headers = library
+    client.get('/api/media/')
+
+    with count_queries() as queries:
+        response = client.get('/api/media/', headers=headers)
+
+    assert response.status_code == 200
+    # версия каталога и статусы страницы; сама страница берётся из кэша
+    assert len(queries) == 2
+    items = {item['id']: item for item in response.get_json()['items']}
+    assert items[media_ids[0]]['is_favorite'] is True
+    assert items[media_ids[25]]['is_planned'] is True
+    assert items[media_ids[40]]['is_favorite'] is False
+
+
+def test_catalog_cursor_page_query_count(client, library, count_queries):
+    user_id, media_ids, headers = library
+
+    with count_queries() as queries:
+        response = client.get('/api/media/?cursor=', headers=headers)
+
+    assert response.status_code == 200
+    assert len(queries) == 3
+
+
+def test_favorites_query_count(client, library, count_queries):
+    user_id, media_ids, headers = library
+
+    with count_queries() as queries:
+        response = client.get(f'/api/media/favorites?user_id={user_id}', headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['items']) == 20
+    assert len(queries) == 2
+
+
+def test_profile_list_query_count(client, library, count_queries):
+    user_id, media_ids, headers = library
+
+    with count_queries() as queries:
+        response = client.get('/api/users/alice?media_type=movie&list_type=favorite', headers=headers)
+
+    assert response.status_code == 200
+    assert all(item['is_favorite'] for item in response.get_json())
+    assert len(queries) == 3
+
+
+def test_media_status_query_count(client, library, count_queries):
+    user_id, media_ids, headers = library
+
+    with count_queries() as queries:
+        response = client.get(f'/api/media/{media_ids[0]}/status', headers=headers)
+
+    assert response.get_json() == {'planned': False, 'completed': False, 'favorite': True}
+    assert len(queries) == 1
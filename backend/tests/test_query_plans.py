@@ -0,0 +1,100 @@
+import os
+import re
+
+import pytest
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from app.models import db
+from benchmarks.explain import explain_routes
+
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+INDEXES_SQL = os.path.join(os.path.dirname(__file__), '..', 'sql', 'hot_query_indexes.sql')
+
+# Схема до перехода на текущие модели: эти таблицы в рабочей базе уже есть,
+# и create_all не добавит в них ни колонок, ни индексов
+EXISTING_COLUMNS = {
+    'users': {
+        'id', 'username', 'password_hash', 'display_name', 'avatar_filename',
+        'gender', 'age', 'about', 'created_at', 'last_modified'
+    },
+    'media': {
+        'id', 'title', 'type', 'author', 'release_year', 'description', 'duration',
+        'cover_url', 'external_rating', 'external_rating_count'
+    },
+    'user_media_lists': {'user_id', 'media_id', 'list_type', 'added_at'},
+    'friendships': {'user_id', 'friend_id', 'status', 'created_at'}
+}
+EXISTING_INDEXES = {'ix_users_username'}
+
+
+def _postgres_indexes(tables=None):
+    """DDL индексов моделей в том виде, в каком их создаёт create_all на Postgres"""
+    dialect = postgresql.dialect()
+    return {
+        index.name: str(CreateIndex(index).compile(dialect=dialect))
+        for table in db.metadata.sorted_tables
+        if tables is None or table.name in tables
+        for index in table.indexes
+        if index._ddl_if is None or index._ddl_if.dialect == 'postgresql'
+    }
+
+
+def _read_sql():
+    with open(INDEXES_SQL, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_index_sql_matches_models():
+    statements = re.findall(
+        r'^CREATE (UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+) (.+);$',
+        _read_sql(),
+        re.M
+    )
+    shipped = {name: f'CREATE {unique}INDEX {name} {definition}' for unique, name, definition in statements}
+
+    expected = {
+        name: ddl
+        for name, ddl in _postgres_indexes(EXISTING_COLUMNS).items()
+        if name not in EXISTING_INDEXES
+    }
+    assert shipped == expected
+
+
+def test_index_sql_adds_new_columns():
+    shipped = {
+        (table, definition.split()[0]): definition
+        for table, definition in re.findall(
+            r'^ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (.+);$',
+            _read_sql(),
+            re.M
+        )
+    }
+
+    dialect = postgresql.dialect()
+    expected = {
+        (table, column.name): str(CreateColumn(column).compile(dialect=dialect))
+        for table, columns in EXISTING_COLUMNS.items()
+        for column in db.metadata.tables[table].columns
+        if column.name not in columns
+    }
+    assert shipped == expected
+
+
+@pytest.mark.postgres
+@pytest.mark.skipif(not DATABASE_URL, reason='TEST_DATABASE_URL не задан')
+def test_routes_avoid_seq_scans():
+    """Схема в TEST_DATABASE_URL пересоздаётся: нужна отдельная пустая база"""
+    checked, failures = explain_routes(
+        DATABASE_URL,
+        users=5000,
+        media=20_000,
+        entries=50_000,
+        friendships=20_000,
+        min_rows=1000
+    )
+
+    assert checked > 0
+    assert failures == []
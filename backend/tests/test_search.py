@@ -0,0 +1,61 @@
+import pytest
+
+from app.models import db, Media
+from app.utils.catalog import bump_catalog_version
+from app.utils.search import stem
+
+
+@pytest.fixture
+def catalog(app):
+    db.session.add_all([
+        Media(title='Война и мир', type='book', author='Лев Толстой', release_year=1869),
+        Media(title='Щелкунчик', type='movie', release_year=1973),
+        Media(title='Ёлка', type='movie', release_year=2010),
+        Media(title='Мирная жизнь', type='movie', release_year=2006)
+    ])
+    db.session.commit()
+
+
+def _titles(client, query):
+    response = client.get('/api/media/', query_string={'query': query})
+    assert response.status_code == 200
+    return sorted(item['title'] for item in response.get_json()['items'])
+
+
+def test_stemmer_reduces_word_forms():
+    assert stem('войны') == stem('война') == stem('войной')
+    assert stem('щелкунчика') == stem('щелкунчик')
+
+
+@pytest.mark.parametrize('query', ['война', 'войны', 'войной', 'ВОЙНЕ'])
+def test_stemmed_forms_match(client, catalog, query):
+    assert _titles(client, query) == ['Война и мир']
+
+
+@pytest.mark.parametrize('query, title', [
+    ('voyna', 'Война и мир'),
+    ('vojna', 'Война и мир'),
+    ('voina', 'Война и мир'),
+    ('tolstoy', 'Война и мир'),
+    ('shchelkunchik', 'Щелкунчик'),
+    ('schelkunchik', 'Щелкунчик'),
+    ('yolka', 'Ёлка'),
+    ('elka', 'Ёлка')
+])
+def test_latin_transliteration_matches(client, catalog, query, title):
+    assert _titles(client, query) == [title]
+
+
+def test_index_follows_catalog_changes(client, catalog):
+    assert _titles(client, 'солярис') == []
+
+    db.session.add(Media(title='Солярис', type='book', author='Станислав Лем', release_year=1961))
+    bump_catalog_version()
+    db.session.commit()
+    assert _titles(client, 'solyaris') == ['Солярис']
+
+    Media.query.filter_by(title='Солярис').update({Media.title: 'Непобедимый'})
+    bump_catalog_version()
+    db.session.commit()
+    assert _titles(client, 'солярис') == []
+    assert _titles(client, 'непобедимого') == ['Непобедимый']
@@ -52,14 +52,12 @@ const Catalog = () => {
 
       const params = {
         type: getContentType(selectedTab),
-        sort_by: 'popularity',
-        query: query.trim() || undefined,
-        _: Date.now()
+        sort_by: query.trim() ? 'relevance' : 'popularity',
+        query: query.trim() || undefined
       };
 
       const headers = token ? {
-        Authorization: `Bearer ${token}`,
-        'Cache-Control': 'no-cache'
+        Authorization: `Bearer ${token}`
       } : {};
 
       const response = await axios.get('http://localhost:5000/api/media', {
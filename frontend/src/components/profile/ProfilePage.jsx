@@ -114,7 +114,7 @@ const ProfilePage = () => {
             className="add-friend-btn"
             onClick={() => {
               sendRequest();
-              setStatus('pending outcoming');
+              setStatus('pending outgoing');
             }}
           >
             Добавить в друзья
@@ -156,7 +156,7 @@ const ProfilePage = () => {
           </div>
         )}
 
-        {status === 'pending outcoming' && (
+        {status === 'pending outgoing' && (
           <button
             className="cancel-request-btn"
             onClick={() => {